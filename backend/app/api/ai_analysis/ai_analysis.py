@@ -1,5 +1,7 @@
+import asyncio
 import json
-from typing import List, Dict, Set
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Set
 import re
 import uuid
 from openai import AsyncOpenAI
@@ -8,19 +10,263 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from api.database.database import get_db_session
+from api.ai_analysis.cache import llm_cache, make_cache_key
+from api.ai_analysis.chunking import (
+    MESSAGE_OVERHEAD_TOKENS,
+    chunk_texts,
+    estimate_tokens,
+    prompt_budget,
+    split_budget,
+)
+from api.ai_analysis.partial_json import IncrementalJSONParser
+from api.ai_analysis.scheduler import llm_scheduler
+from api.database.executor import run_in_db
+from api import metrics, tracing
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 client = None
 if os.getenv("OPENAI_API_KEY"):
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    # Retries are handled by llm_scheduler so they respect the shared rate limits
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
 
+# Bump whenever a prompt below changes so memoized analyses are recomputed
+PROMPT_VERSION = "2"
+SCREENING_MODEL = "gpt-3.5-turbo-16k"
+DETAIL_MODEL = "gpt-3.5-turbo-16k"
+SUMMARY_MODEL = "gpt-3.5-turbo"
+# Completion size assumed when reserving rate limit tokens for uncapped requests
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("EXPECTED_COMPLETION_TOKENS", "1000"))
+# Streamed text is passed on to on_partial once it grew by this many characters
+PARTIAL_MIN_CHARS = int(os.getenv("PARTIAL_MIN_CHARS", "40"))
 
+
+def _completion_request(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    temperature: float,
+    max_tokens: int = None,
+) -> tuple:
+    """Chat completion arguments and the tokens to reserve for them"""
+    request = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+        "temperature": temperature,
+    }
+    if max_tokens:
+        request["max_tokens"] = max_tokens
+
+    estimated_tokens = (
+        estimate_tokens(system_prompt)
+        + estimate_tokens(prompt)
+        + 2 * MESSAGE_OVERHEAD_TOKENS
+        + (max_tokens or EXPECTED_COMPLETION_TOKENS)
+    )
+    tracing.set_attributes(estimated_tokens=estimated_tokens)
+    return request, estimated_tokens
+
+
+def _record_usage(usage, estimated_tokens: int, stage: str, model: str):
+    llm_scheduler.settle(estimated_tokens, getattr(usage, "total_tokens", None))
+    if usage is None:
+        return
+    tracing.set_attributes(
+        prompt_tokens=usage.prompt_tokens,
+        completion_tokens=usage.completion_tokens,
+    )
+    metrics.LLM_PROMPT_TOKENS.inc(usage.prompt_tokens or 0, stage=stage, model=model)
+    metrics.LLM_COMPLETION_TOKENS.inc(
+        usage.completion_tokens or 0, stage=stage, model=model
+    )
+
+
+async def _cache_response(
+    cache_key: str, response_text: str, expect_json: bool, stage: str
+):
+    """Only responses that parse as JSON are cached when expect_json is set"""
+    if expect_json:
+        try:
+            json.loads(response_text)
+        except json.JSONDecodeError:
+            metrics.LLM_ERRORS.inc(stage=stage, error="InvalidJSON")
+            return
+    await run_in_db(llm_cache.set, cache_key, response_text)
+
+
+@tracing.traced("llm.chat_completion")
+async def _chat_completion(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    temperature: float,
+    max_tokens: int = None,
+    expect_json: bool = False,
+    stage: str = "other",
+) -> str:
+    """
+    Run a chat completion, serving repeated prompts from the LLM response cache
+
+    Only responses that parse as JSON are cached when expect_json is set, so a
+    malformed answer is retried on the next call instead of being replayed.
+    Cache misses go through llm_scheduler for rate limiting and retries.
+    stage labels the request in the LLM metrics.
+    """
+    cache_key = make_cache_key(model, temperature, system_prompt, prompt, max_tokens)
+    cached = await run_in_db(llm_cache.get, cache_key)
+    metrics.CACHE_LOOKUPS.inc(cache="llm", result="miss" if cached is None else "hit")
+    tracing.set_attributes(stage=stage, model=model, cached=cached is not None)
+    if cached is not None:
+        return cached
+
+    request, estimated_tokens = _completion_request(
+        model, system_prompt, prompt, temperature, max_tokens
+    )
+    started = time.perf_counter()
+    try:
+        raw_response = await llm_scheduler.call(
+            lambda: client.chat.completions.with_raw_response.create(**request),
+            estimated_tokens,
+        )
+    except Exception as e:
+        metrics.LLM_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        metrics.LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, stage=stage, model=model
+        )
+    llm_scheduler.observe_headers(raw_response.headers)
+    response = raw_response.parse()
+    _record_usage(getattr(response, "usage", None), estimated_tokens, stage, model)
+    response_text = response.choices[0].message.content.strip()
+    await _cache_response(cache_key, response_text, expect_json, stage)
+    return response_text
+
+
+@tracing.traced("llm.chat_completion")
+async def _stream_chat_completion(
+    model: str,
+    system_prompt: str,
+    prompt: str,
+    temperature: float,
+    on_delta: Callable[[str], Awaitable],
+    max_tokens: int = None,
+    expect_json: bool = False,
+    stage: str = "other",
+) -> str:
+    """
+    _chat_completion with stream=True, on_delta is awaited with each piece of
+    text as it arrives and the full text is returned
+
+    A cached response is passed to on_delta in one piece. Only opening the
+    stream is retried by llm_scheduler, a stream failing halfway raises.
+    """
+    cache_key = make_cache_key(model, temperature, system_prompt, prompt, max_tokens)
+    cached = await run_in_db(llm_cache.get, cache_key)
+    metrics.CACHE_LOOKUPS.inc(cache="llm", result="miss" if cached is None else "hit")
+    tracing.set_attributes(
+        stage=stage, model=model, cached=cached is not None, streamed=True
+    )
+    if cached is not None:
+        await on_delta(cached)
+        return cached
+
+    request, estimated_tokens = _completion_request(
+        model, system_prompt, prompt, temperature, max_tokens
+    )
+    request["stream"] = True
+    request["stream_options"] = {"include_usage": True}
+    started = time.perf_counter()
+    first_token_at = None
+    pieces = []
+    usage = None
+    try:
+        raw_response = await llm_scheduler.call(
+            lambda: client.chat.completions.with_raw_response.create(**request),
+            estimated_tokens,
+        )
+        llm_scheduler.observe_headers(raw_response.headers)
+        async for chunk in raw_response.parse():
+            if getattr(chunk, "usage", None) is not None:
+                usage = chunk.usage
+            for choice in chunk.choices:
+                delta = choice.delta.content if choice.delta else None
+                if not delta:
+                    continue
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    metrics.LLM_TIME_TO_FIRST_TOKEN.observe(
+                        first_token_at - started, stage=stage, model=model
+                    )
+                    tracing.set_attributes(
+                        time_to_first_token_ms=round(
+                            (first_token_at - started) * 1000, 3
+                        )
+                    )
+                pieces.append(delta)
+                await on_delta(delta)
+    except Exception as e:
+        metrics.LLM_ERRORS.inc(stage=stage, error=type(e).__name__)
+        raise
+    finally:
+        metrics.LLM_REQUEST_SECONDS.observe(
+            time.perf_counter() - started, stage=stage, model=model
+        )
+    _record_usage(usage, estimated_tokens, stage, model)
+    response_text = "".join(pieces).strip()
+    await _cache_response(cache_key, response_text, expect_json, stage)
+    return response_text
+
+
+async def _stream_updates(run: Callable[[Callable], Awaitable]) -> AsyncIterator:
+    """
+    Turn a callback-based call into an async iterator
+
+    run(on_partial) is started in its own task, every value it awaits
+    on_partial with is yielded as {"done": False, "value": value} and its
+    result as {"done": True, "value": result}. Leaving the loop early cancels it.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_partial(value):
+        await queue.put((False, value))
+
+    async def produce():
+        try:
+            await queue.put((True, await run(on_partial)))
+        except Exception as e:
+            await queue.put((None, e))
+
+    task = asyncio.create_task(produce())
+    try:
+        while True:
+            done, value = await queue.get()
+            if done is None:
+                raise value
+            yield {"done": done, "value": value}
+            if done:
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+
+
+@tracing.traced("llm.risk_summary")
 async def ai_generate_company_overall_risk_assessment(
-    overall_risk: str, product_analyses_explanations: List[str]
+    overall_risk: str,
+    product_analyses_explanations: List[str],
+    on_partial: Callable[[str], Awaitable] = None,
 ) -> str:
-    """Generate overall risk assessment using AI"""
+    """
+    Generate overall risk assessment using AI
+
+    With on_partial the completion is streamed and on_partial is awaited with
+    the summary text so far as it grows.
+    """
     if not client:
         return "AI analysis not available"
 
@@ -45,32 +291,65 @@ async def ai_generate_company_overall_risk_assessment(
     Provide only the summary paragraph, nothing else.
     """
 
+    request = dict(
+        model=SUMMARY_MODEL,
+        system_prompt="You are a patent analysis expert. Be concise and focus on key risks.",
+        prompt=prompt,
+        temperature=0.3,
+        max_tokens=150,  # Limit response length
+        stage="summary",
+    )
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a patent analysis expert. Be concise and focus on key risks.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-            max_tokens=150,  # Limit response length
-        )
+        with metrics.ANALYSIS_STAGE_SECONDS.time(stage="summary"):
+            if not on_partial:
+                return await _chat_completion(**request)
+
+            text = ""
+            reported = 0
 
-        return response.choices[0].message.content.strip()
+            async def on_delta(delta: str):
+                nonlocal text, reported
+                text += delta
+                if len(text) - reported >= PARTIAL_MIN_CHARS:
+                    reported = len(text)
+                    await on_partial(text.strip())
+
+            return await _stream_chat_completion(on_delta=on_delta, **request)
     except Exception as e:
         logger.error(f"Error generating risk assessment: {e}")
         return f"Error generating risk assessment: {str(e)}"
 
 
-async def analyze_claims_batch(claims_text: str, products_text: str) -> Dict:
-    """Analyze multiple claims against multiple products in a single GPT call"""
-    if not client:
-        return {"product_analyses": {}}
+async def stream_company_overall_risk_assessment(
+    overall_risk: str, product_analyses_explanations: List[str]
+) -> AsyncIterator[Dict]:
+    """
+    ai_generate_company_overall_risk_assessment as an async iterator
 
-    prompt = f"""
+    Yields {"done": False, "value": summary so far} while the summary streams
+    and {"done": True, "value": summary} last.
+    """
+    async for update in _stream_updates(
+        lambda on_partial: ai_generate_company_overall_risk_assessment(
+            overall_risk, product_analyses_explanations, on_partial=on_partial
+        )
+    ):
+        yield update
+
+
+JSON_ANALYSIS_SYSTEM_PROMPT = "You are a patent analysis expert. Be precise and focus on technical implementations. Always respond in valid JSON format."
+
+# Tokens kept free for the model's answer when sizing prompt chunks
+SCREENING_COMPLETION_TOKENS = int(os.getenv("SCREENING_COMPLETION_TOKENS", "3000"))
+DETAIL_COMPLETION_TOKENS = int(os.getenv("DETAIL_COMPLETION_TOKENS", "1000"))
+# Max number of chunk requests of one analysis in flight at once
+CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+
+LIKELIHOOD_ORDER = ["Low", "Moderate", "High"]
+
+
+def _screening_prompt(claims_text: str, products_text: str) -> str:
+    return f"""
     Analyze if any of these products potentially infringe on the patent claims.
     
     Patent Claims:
@@ -99,49 +378,9 @@ async def analyze_claims_batch(claims_text: str, products_text: str) -> Dict:
     Be concise but specific in explanations.
     """
 
-    try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo-16k",  # Using 16K model for larger context
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a patent analysis expert. Be precise and focus on technical implementations. Always respond in valid JSON format.",
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.3,
-        )
-
-        # Extract JSON from the response text
-        response_text = response.choices[0].message.content.strip()
-        try:
-            # Try to parse the response as JSON
-            result = json.loads(response_text)
-            return result.get("product_analyses", {})
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {e}")
-            print(f"Raw response: {response_text}")
-            return {"product_analyses": {}}
-
-    except Exception as e:
-        print(f"GPT batch analysis failed: {str(e)}")
-        return {"product_analyses": {}}
-
-
-async def ai_detail_product_infringement_analysis(
-    claims_text: str, product_text: str
-) -> Dict:
-    """Analyze claims against a product with detailed infringement analysis"""
-    if not client:
-        return {
-            "infringement_likelihood": "Error",
-            "relevant_claims": [],
-            "explanation": "AI analysis not available",
-            "specific_features": [],
-            "claim_details": {},
-        }
 
-    prompt = f"""
+def _detail_prompt(claims_text: str, product_text: str) -> str:
+    return f"""
     You are an expert patent infringement analyst. Analyze if this product potentially infringes on the listed patent claims.
 
     Given the following list of patent claims,  I want you to check product's description and check against the claims.
@@ -178,21 +417,292 @@ async def ai_detail_product_infringement_analysis(
     Be specific about technical features and implementations.
     """
 
+
+def _claim_sort_key(claim_num) -> tuple:
+    """Order claim numbers numerically, "00002" and "2" sort the same"""
+    claim_num = str(claim_num)
+    digits = re.sub(r"\D", "", claim_num)
+    return (int(digits) if digits else float("inf"), claim_num)
+
+
+async def _gather_limited(coroutines: List, limit: int = CHUNK_CONCURRENCY) -> List:
+    """gather() with at most limit coroutines running, results keep input order"""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*[run(coroutine) for coroutine in coroutines])
+
+
+@tracing.traced("llm.screening")
+async def analyze_claims_batch(
+    claims_texts: List[str], products_texts: List[str]
+) -> Dict:
+    """
+    Analyze multiple claims against multiple products
+
+    Claims and products are split into groups that fit the screening model's
+    context, every (claims chunk, products chunk) pair is screened
+    concurrently and the per-chunk results are merged. Inputs that fit go out
+    as a single call.
+
+    Input:
+    claims_texts: List[str], one formatted block per claim
+    products_texts: List[str], one formatted block per product
+
+    Returns a dict of product name and its relevant claims and explanations.
+    Raises ScreeningError when a chunk fails, see merge_screening_results.
+    """
+    if not client:
+        return {"product_analyses": {}}
+
+    budget = prompt_budget(
+        SCREENING_MODEL,
+        SCREENING_COMPLETION_TOKENS,
+        _screening_prompt("", ""),
+        JSON_ANALYSIS_SYSTEM_PROMPT,
+    )
+    claims_budget, products_budget = split_budget(
+        budget,
+        estimate_tokens("\n\n".join(claims_texts)),
+        estimate_tokens("\n\n".join(products_texts)),
+    )
+    claim_chunks = chunk_texts(claims_texts, claims_budget)
+    product_chunks = chunk_texts(products_texts, products_budget)
+    tracing.set_attributes(
+        claims=len(claims_texts),
+        products=len(products_texts),
+        chunks=len(claim_chunks) * len(product_chunks),
+    )
+    if len(claim_chunks) * len(product_chunks) > 1:
+        logger.info(
+            f"Screening in {len(claim_chunks)} claim x {len(product_chunks)} product chunks"
+        )
+
+    with metrics.ANALYSIS_STAGE_SECONDS.time(stage="screening"):
+        chunk_results = await _gather_limited(
+            [
+                _screen_chunk("\n\n".join(claims), "\n\n".join(products))
+                for claims in claim_chunks
+                for products in product_chunks
+            ]
+        )
+    return merge_screening_results(chunk_results)
+
+
+class ScreeningError(Exception):
+    """A screening chunk failed or its answer could not be parsed"""
+
+
+async def _screen_chunk(claims_text: str, products_text: str) -> Optional[Dict]:
+    """Screening result of one chunk, None when the call or its answer failed"""
     try:
-        response = await client.chat.completions.create(
-            model="gpt-3.5-turbo-16k",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are a patent analysis expert. Be precise and focus on technical implementations. Always respond in valid JSON format.",
-                },
-                {"role": "user", "content": prompt},
-            ],
+        response_text = await _chat_completion(
+            model=SCREENING_MODEL,  # Using 16K model for larger context
+            system_prompt=JSON_ANALYSIS_SYSTEM_PROMPT,
+            prompt=_screening_prompt(claims_text, products_text),
             temperature=0.3,
+            expect_json=True,
+            stage="screening",
+        )
+        try:
+            # Try to parse the response as JSON
+            result = json.loads(response_text)
+        except json.JSONDecodeError as e:
+            logger.error(f"Error parsing screening response: {e}")
+            logger.error(f"Raw response: {response_text}")
+            return None
+        product_analyses = (
+            result.get("product_analyses", {}) if isinstance(result, dict) else None
+        )
+        if not isinstance(product_analyses, dict):
+            logger.error(f"Unexpected screening response: {response_text}")
+            metrics.LLM_ERRORS.inc(stage="screening", error="InvalidResponse")
+            return None
+        return product_analyses
+
+    except Exception as e:
+        logger.error(f"GPT batch analysis failed: {str(e)}")
+        return None
+
+
+def merge_screening_results(chunk_results: List[Optional[Dict]]) -> Dict:
+    """
+    Merge per-chunk screening results into one result per product
+
+    A failed chunk (None) fails the whole screening with ScreeningError, as
+    in merge_detail_results, instead of its products silently dropping out
+    of the shortlist.
+    Relevant claims are unioned and sorted by claim number, the first
+    explanation of a claim wins. The result does not depend on which
+    chunk finished first.
+    """
+    failed = sum(1 for chunk_result in chunk_results if chunk_result is None)
+    if failed:
+        raise ScreeningError(
+            f"{failed} of {len(chunk_results)} screening chunks failed"
+        )
+
+    merged = {}
+    for chunk_result in chunk_results:
+        for product_name, analysis in chunk_result.items():
+            if not isinstance(analysis, dict):
+                continue
+            product = merged.setdefault(
+                product_name, {"relevant_claims": [], "explanations": {}}
+            )
+            for claim_num in analysis.get("relevant_claims") or []:
+                if claim_num not in product["relevant_claims"]:
+                    product["relevant_claims"].append(claim_num)
+            for claim_num, explanation in (analysis.get("explanations") or {}).items():
+                product["explanations"].setdefault(claim_num, explanation)
+
+    for product in merged.values():
+        product["relevant_claims"].sort(key=_claim_sort_key)
+        product["explanations"] = {
+            claim_num: product["explanations"][claim_num]
+            for claim_num in sorted(product["explanations"], key=_claim_sort_key)
+        }
+    return merged
+
+
+@tracing.traced("llm.detail")
+async def ai_detail_product_infringement_analysis(
+    claims_texts: List[str],
+    product_text: str,
+    on_partial: Callable[[Dict], Awaitable] = None,
+) -> Dict:
+    """
+    Analyze claims against a product with detailed infringement analysis
+
+    Claims that do not fit the detail model's context in one prompt are
+    analyzed in concurrent chunks and the results merged.
+
+    Input:
+    claims_texts: List[str], one formatted block per claim
+    product_text: str
+    on_partial: async callable(partial), streams the completion when set.
+        partial holds the fields of a chunk's answer parsed so far, the
+        explanation possibly cut short, plus chunk and chunks. Default is None
+
+    Returns a dict of infringement_likelihood, relevant_claims, explanation and specific_features
+    """
+    if not client:
+        return {
+            "infringement_likelihood": "Error",
+            "relevant_claims": [],
+            "explanation": "AI analysis not available",
+            "specific_features": [],
+            "claim_details": {},
+        }
+
+    budget = prompt_budget(
+        DETAIL_MODEL,
+        DETAIL_COMPLETION_TOKENS,
+        _detail_prompt("", product_text),
+        JSON_ANALYSIS_SYSTEM_PROMPT,
+    )
+    claim_chunks = chunk_texts(claims_texts, budget) or [[]]
+    tracing.set_attributes(claims=len(claims_texts), chunks=len(claim_chunks))
+    if len(claim_chunks) > 1:
+        logger.info(f"Detail analysis in {len(claim_chunks)} claim chunks")
+
+    with metrics.ANALYSIS_STAGE_SECONDS.time(stage="detail"):
+        chunk_results = await _gather_limited(
+            [
+                _detail_chunk(
+                    "\n\n".join(claims),
+                    product_text,
+                    on_partial=_chunk_partials(on_partial, index, len(claim_chunks)),
+                )
+                for index, claims in enumerate(claim_chunks)
+            ]
+        )
+    return merge_detail_results(chunk_results)
+
+
+def _chunk_partials(on_partial, index: int, chunks: int):
+    if on_partial is None:
+        return None
+
+    async def on_chunk_partial(partial: Dict):
+        await on_partial({**partial, "chunk": index, "chunks": chunks})
+
+    return on_chunk_partial
+
+
+async def stream_detail_product_infringement_analysis(
+    claims_texts: List[str], product_text: str
+) -> AsyncIterator[Dict]:
+    """
+    ai_detail_product_infringement_analysis as an async iterator
+
+    Yields {"done": False, "value": partial fields} as the answer streams,
+    e.g. infringement_likelihood and relevant_claims before the explanation is
+    finished, and {"done": True, "value": analysis} last.
+    """
+    async for update in _stream_updates(
+        lambda on_partial: ai_detail_product_infringement_analysis(
+            claims_texts, product_text, on_partial=on_partial
         )
+    ):
+        yield update
+
+
+DETAIL_FIELDS = (
+    "infringement_likelihood",
+    "relevant_claims",
+    "explanation",
+    "specific_features",
+)
+
+
+async def _stream_detail_completion(
+    request: Dict, on_partial: Callable[[Dict], Awaitable]
+) -> str:
+    """Stream a detail answer, passing its fields to on_partial as they parse"""
+    parser = IncrementalJSONParser()
+    reported = {}
+
+    async def on_delta(delta: str):
+        completed = parser.feed(delta)
+        partial = {
+            key: parser.fields[key] for key in DETAIL_FIELDS if key in parser.fields
+        }
+        field = parser.partial_field()
+        if field and field[0] in DETAIL_FIELDS:
+            previous = reported.get(field[0]) or ""
+            if not completed and len(field[1]) - len(previous) < PARTIAL_MIN_CHARS:
+                return
+            partial[field[0]] = field[1]
+        elif not any(key in DETAIL_FIELDS for key in completed):
+            return
+        reported.update(partial)
+        await on_partial(partial)
+
+    return await _stream_chat_completion(on_delta=on_delta, **request)
+
 
-        # Extract JSON from the response text
-        response_text = response.choices[0].message.content.strip()
+async def _detail_chunk(
+    claims_text: str,
+    product_text: str,
+    on_partial: Callable[[Dict], Awaitable] = None,
+) -> Dict:
+    request = dict(
+        model=DETAIL_MODEL,
+        system_prompt=JSON_ANALYSIS_SYSTEM_PROMPT,
+        prompt=_detail_prompt(claims_text, product_text),
+        temperature=0.3,
+        expect_json=True,
+        stage="detail",
+    )
+    try:
+        if on_partial:
+            response_text = await _stream_detail_completion(request, on_partial)
+        else:
+            response_text = await _chat_completion(**request)
         try:
             # Parse response and ensure it matches ProductPatentAnalysis fields
             result = json.loads(response_text)
@@ -223,3 +733,50 @@ async def ai_detail_product_infringement_analysis(
             "explanation": f"Analysis failed: {str(e)}",
             "specific_features": [],
         }
+
+
+def merge_detail_results(chunk_results: List[Dict]) -> Dict:
+    """
+    Merge per-chunk detail analyses of one product
+
+    A failed chunk fails the whole analysis, so it is retried instead of being
+    stored incomplete. Otherwise claims and features are unioned in chunk
+    order and the likelihood is the highest of the chunks, raised to what the
+    total number of relevant claims implies (6+ High, 2-5 Moderate).
+    """
+    if len(chunk_results) == 1:
+        return chunk_results[0]
+
+    for result in chunk_results:
+        if result["infringement_likelihood"] not in LIKELIHOOD_ORDER:
+            return result
+
+    relevant_claims = []
+    specific_features = []
+    explanations = []
+    for result in chunk_results:
+        for claim_num in result["relevant_claims"] or []:
+            if claim_num not in relevant_claims:
+                relevant_claims.append(claim_num)
+        for feature in result["specific_features"] or []:
+            if feature not in specific_features:
+                specific_features.append(feature)
+        if result["relevant_claims"] and result["explanation"]:
+            explanations.append(result["explanation"])
+    relevant_claims.sort(key=_claim_sort_key)
+
+    likelihood = max(
+        (result["infringement_likelihood"] for result in chunk_results),
+        key=LIKELIHOOD_ORDER.index,
+    )
+    if len(relevant_claims) >= 6:
+        likelihood = "High"
+    elif len(relevant_claims) >= 2 and likelihood == "Low":
+        likelihood = "Moderate"
+
+    return {
+        "infringement_likelihood": likelihood,
+        "relevant_claims": relevant_claims,
+        "explanation": " ".join(explanations) or chunk_results[0]["explanation"],
+        "specific_features": specific_features,
+    }
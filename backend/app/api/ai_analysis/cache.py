@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Cache lives next to patent_db.sqlite by default
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "./data/llm_cache.sqlite")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() != "false"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+
+
+def make_cache_key(
+    model: str,
+    temperature: float,
+    system_prompt: str,
+    user_prompt: str,
+    max_tokens: Optional[int] = None,
+) -> str:
+    """Content hash of everything that determines a completion"""
+    payload = json.dumps(
+        [model, temperature, system_prompt, user_prompt, max_tokens],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed LLM response cache with TTL and size-bounded LRU eviction
+
+    Input:
+    path: str, sqlite file path
+    ttl_seconds: int, entries older than this are treated as misses
+    max_entries: int, least recently used entries are evicted above this size
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int, enabled=True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_accessed REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_llm_responses_last_accessed "
+                "ON llm_responses (last_accessed)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss"""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute(
+                    "SELECT response, created_at FROM llm_responses WHERE cache_key = ?",
+                    (key,),
+                ).fetchone()
+                now = time.time()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        conn.execute(
+                            "DELETE FROM llm_responses WHERE cache_key = ?", (key,)
+                        )
+                        conn.commit()
+                    self.misses += 1
+                    return None
+
+                conn.execute(
+                    "UPDATE llm_responses SET last_accessed = ? WHERE cache_key = ?",
+                    (now, key),
+                )
+                conn.commit()
+                self.hits += 1
+                return row[0]
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache read failed: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, response: str):
+        """Store a response and evict least recently used entries above max_entries"""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                conn = self._connect()
+                now = time.time()
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO llm_responses
+                        (cache_key, response, created_at, last_accessed)
+                    VALUES (?, ?, ?, ?)
+                    """,
+                    (key, response, now, now),
+                )
+                conn.execute(
+                    "DELETE FROM llm_responses WHERE created_at < ?",
+                    (now - self.ttl_seconds,),
+                )
+                size = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+                if size > self.max_entries:
+                    evicted = conn.execute(
+                        """
+                        DELETE FROM llm_responses WHERE cache_key IN (
+                            SELECT cache_key FROM llm_responses
+                            ORDER BY last_accessed ASC LIMIT ?
+                        )
+                        """,
+                        (size - self.max_entries,),
+                    ).rowcount
+                    self.evictions += evicted
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"LLM cache write failed: {e}")
+
+    def clear(self):
+        """Remove every cached response"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_responses")
+            conn.commit()
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for this process"""
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+llm_cache = LLMResponseCache(
+    LLM_CACHE_PATH,
+    ttl_seconds=LLM_CACHE_TTL_SECONDS,
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    enabled=LLM_CACHE_ENABLED,
+)
@@ -0,0 +1,87 @@
+import math
+import os
+import re
+from typing import Callable, List, Tuple
+
+# Context window of each model in tokens, prompt and completion together
+MODEL_CONTEXT_TOKENS = {
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-16k": 16385,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-4o": 128000,
+    "gpt-4o-mini": 128000,
+}
+DEFAULT_CONTEXT_TOKENS = int(os.getenv("DEFAULT_CONTEXT_TOKENS", "4096"))
+# Extra tokens the chat format adds around each message
+MESSAGE_OVERHEAD_TOKENS = 8
+
+TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Conservative local estimate of the number of tokens in text
+
+    Takes the larger of one token per four characters and one token per word
+    or punctuation mark, which over-counts GPT tokenizers on patent prose
+    rather than under-counting them.
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(TOKEN_PIECE_PATTERN.findall(text)))
+
+
+def prompt_budget(model: str, reserved_completion_tokens: int, *fixed_texts) -> int:
+    """Tokens left for variable prompt content once fixed texts and the answer fit"""
+    context = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    fixed = sum(estimate_tokens(text) + MESSAGE_OVERHEAD_TOKENS for text in fixed_texts)
+    return max(1, context - reserved_completion_tokens - fixed)
+
+
+def chunk_texts(
+    texts: List[str],
+    budget: int,
+    separator: str = "\n\n",
+    cost: Callable[[str], int] = estimate_tokens,
+) -> List[List[str]]:
+    """
+    Split texts into consecutive groups whose joined size fits the budget
+
+    Order is kept, so chunks of the same input are always the same. A single
+    text larger than the budget gets a chunk of its own.
+    """
+    separator_cost = cost(separator)
+    chunks = []
+    current = []
+    current_cost = 0
+    for text in texts:
+        text_cost = cost(text) + (separator_cost if current else 0)
+        if current and current_cost + text_cost > budget:
+            chunks.append(current)
+            current = []
+            current_cost = 0
+            text_cost = cost(text)
+        current.append(text)
+        current_cost += text_cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_budget(budget: int, first_tokens: int, second_tokens: int) -> Tuple[int, int]:
+    """
+    Share a budget between two inputs that go into the same prompt
+
+    Everything fits: each side gets what the other leaves over. Otherwise a
+    side smaller than half the budget keeps its size and the other side gets
+    the rest.
+    """
+    if first_tokens + second_tokens <= budget:
+        return max(1, budget - second_tokens), max(1, budget - first_tokens)
+    half = budget // 2
+    if first_tokens <= half:
+        return max(1, first_tokens), max(1, budget - first_tokens)
+    if second_tokens <= half:
+        return max(1, budget - second_tokens), max(1, second_tokens)
+    return max(1, half), max(1, budget - half)
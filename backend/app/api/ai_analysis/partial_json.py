@@ -0,0 +1,146 @@
+import json
+import re
+from typing import Any, Dict, Optional, Tuple
+
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+# \u escape cut off at the end of a partial string
+_INCOMPLETE_UNICODE_ESCAPE = re.compile(r"\\u[0-9a-fA-F]{0,3}$")
+
+
+def _loads(text: str):
+    """json.loads that tolerates the trailing commas models like to add"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", text))
+
+
+class IncrementalJSONParser:
+    """
+    Parses the top-level fields of a JSON object as its text streams in
+
+    A field is reported as soon as its value is complete, so with
+    {"infringement_likelihood": "High", "relevant_claims": [...], "explanation": "..."}
+    the likelihood and claims are known while the explanation is still being
+    generated. The string value being received can be read with
+    partial_field(). Text before the opening brace, such as a ```json fence,
+    is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.done = False
+        self._pos = 0
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._expect = "key"  # key, colon, value or comma
+        self._key: Optional[str] = None
+        self._token_start: Optional[int] = None
+        self._value_start: Optional[int] = None
+
+    def feed(self, text: str) -> Dict[str, Any]:
+        """Add streamed text, returns the fields completed by it"""
+        completed = {}
+        if self.done:
+            return completed
+        self.buffer += text
+        buffer = self.buffer
+        while self._pos < len(buffer) and not self.done:
+            char = buffer[self._pos]
+            index = self._pos
+            self._pos += 1
+
+            if not self._started:
+                if char == "{":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_top_level_string(index, completed)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1:
+                    self._token_start = index
+                    if self._expect == "value":
+                        self._value_start = index
+                continue
+
+            if self._depth == 1:
+                self._top_level_char(char, index, completed)
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1:
+                    self._complete(buffer[self._value_start : index + 1], completed)
+        return completed
+
+    def _top_level_char(self, char: str, index: int, completed: Dict):
+        if char == ":" and self._expect == "colon":
+            self._expect = "value"
+        elif char in "{[" and self._expect == "value":
+            self._value_start = index
+            self._depth += 1
+        elif char == "," or char == "}":
+            if self._expect == "value" and self._value_start is not None:
+                # Number, true, false or null
+                self._complete(self.buffer[self._value_start : index], completed)
+            self._expect = "key"
+            if char == "}":
+                self.done = True
+        elif not char.isspace() and self._expect == "value":
+            if self._value_start is None:
+                self._value_start = index
+
+    def _end_top_level_string(self, index: int, completed: Dict):
+        if self._expect == "key":
+            self._key = json.loads(self.buffer[self._token_start : index + 1])
+            self._expect = "colon"
+        elif self._expect == "value":
+            self._complete(self.buffer[self._value_start : index + 1], completed)
+
+    def _complete(self, text: str, completed: Dict):
+        try:
+            value = _loads(text.strip())
+        except json.JSONDecodeError:
+            # Malformed value, the field is skipped
+            self._key = None
+        if self._key is not None:
+            self.fields[self._key] = value
+            completed[self._key] = value
+        self._value_start = None
+        self._expect = "comma"
+
+    def partial_field(self) -> Optional[Tuple[str, str]]:
+        """Key and text so far of the top-level string value being received"""
+        if not (
+            self._in_string
+            and self._depth == 1
+            and self._expect == "value"
+            and self._value_start is not None
+        ):
+            return None
+        raw = self.buffer[self._value_start + 1 :]
+        if self._escape:
+            raw = raw[:-1]
+        try:
+            return self._key, json.loads(f'"{raw}"')
+        except json.JSONDecodeError:
+            pass
+        try:
+            return self._key, json.loads(f'"{_INCOMPLETE_UNICODE_ESCAPE.sub("", raw)}"')
+        except json.JSONDecodeError:
+            return None
@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Dict, List
+
+import numpy as np
+
+# Products kept after local scoring, and the minimum BM25 score to keep one
+PREFILTER_TOP_K = int(os.getenv("PREFILTER_TOP_K", "20"))
+PREFILTER_MIN_SCORE = float(os.getenv("PREFILTER_MIN_SCORE", "0"))
+# Part of the analysis fingerprint, bump when ranking changes which products
+# are shortlisted so stored analyses are not reused
+PREFILTER_VERSION = "2"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    """
+    a an and any are as at be by claim claims comprising each for from further
+    has have in including is it its least of on one or said such than that the
+    their then there thereof these this to wherein which with
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords and single characters"""
+    return [
+        token
+        for token in TOKEN_PATTERN.findall((text or "").lower())
+        if len(token) > 1 and token not in STOPWORDS
+    ]
+
+
+def bm25_scores(
+    queries: List[str], documents: List[str], k1=BM25_K1, b=BM25_B
+) -> np.ndarray:
+    """
+    Score every document against every query with Okapi BM25
+
+    Input:
+    queries: List[str]
+    documents: List[str]
+
+    Returns an array of shape (len(queries), len(documents))
+    """
+    scores = np.zeros((len(queries), len(documents)))
+    query_tokens = [set(tokenize(query)) for query in queries]
+    vocabulary = {}
+    for tokens in query_tokens:
+        for token in sorted(tokens):
+            vocabulary.setdefault(token, len(vocabulary))
+    if not vocabulary or not documents:
+        return scores
+
+    # Document term frequencies, restricted to terms that appear in a query
+    term_frequencies = np.zeros((len(documents), len(vocabulary)))
+    document_lengths = np.zeros(len(documents))
+    for row, document in enumerate(documents):
+        tokens = tokenize(document)
+        document_lengths[row] = len(tokens)
+        columns = [vocabulary[token] for token in tokens if token in vocabulary]
+        np.add.at(term_frequencies[row], columns, 1)
+
+    average_length = document_lengths.mean() or 1.0
+    document_frequencies = np.count_nonzero(term_frequencies, axis=0)
+    idf = np.log(
+        1 + (len(documents) - document_frequencies + 0.5) / (document_frequencies + 0.5)
+    )
+    length_norm = k1 * (1 - b + b * document_lengths / average_length)
+    term_scores = (
+        idf * term_frequencies * (k1 + 1) / (term_frequencies + length_norm[:, None])
+    )
+
+    query_matrix = np.zeros((len(queries), len(vocabulary)))
+    for row, tokens in enumerate(query_tokens):
+        query_matrix[row, [vocabulary[token] for token in tokens]] = 1
+    return query_matrix @ term_scores.T
+
+
+def rank_products(
+    base_claims, products, top_k=PREFILTER_TOP_K, min_score=PREFILTER_MIN_SCORE
+) -> List[Dict]:
+    """
+    Rank products against base claims without calling the LLM
+
+    A product's score is its best BM25 score over the base claims. Products
+    sharing no words with the claims score 0 and are kept with the default
+    min_score of 0. When no product reaches min_score the best top_k are
+    returned anyway, so the model always screens some candidates.
+
+    Input:
+    base_claims: List[Claim]
+    products: List[Product]
+    top_k: int, max number of products to return, default is PREFILTER_TOP_K
+    min_score: float, products scoring below are dropped, default is PREFILTER_MIN_SCORE
+
+    Returns a list of {"product", "score", "claim_scores"} dicts, best first
+    """
+    if not base_claims or not products:
+        return []
+
+    claim_scores = bm25_scores(
+        [claim.text for claim in base_claims],
+        [f"{product.name} {product.description or ''}" for product in products],
+    )
+    product_scores = claim_scores.max(axis=0)
+
+    # Stable sort keeps the original product order for equal scores
+    order = np.argsort(-product_scores, kind="stable")
+    kept = [index for index in order if product_scores[index] >= min_score]
+    if not kept:
+        kept = list(order)
+    if top_k:
+        kept = kept[:top_k]
+    return [
+        {
+            "product": products[index],
+            "score": float(product_scores[index]),
+            "claim_scores": {
+                claim.num: float(claim_scores[row, index])
+                for row, claim in enumerate(base_claims)
+            },
+        }
+        for index in kept
+    ]
@@ -0,0 +1,311 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+import logging
+
+import openai
+
+logger = logging.getLogger(__name__)
+
+# Account limits, the scheduler keeps below both
+OPENAI_RPM_LIMIT = int(os.getenv("OPENAI_RPM_LIMIT", "3500"))
+OPENAI_TPM_LIMIT = int(os.getenv("OPENAI_TPM_LIMIT", "90000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+OPENAI_BACKOFF_BASE_SECONDS = float(os.getenv("OPENAI_BACKOFF_BASE_SECONDS", "1"))
+OPENAI_BACKOFF_MAX_SECONDS = float(os.getenv("OPENAI_BACKOFF_MAX_SECONDS", "60"))
+
+# Lower is served first, matches the job queue priorities
+INTERACTIVE_PRIORITY = 0
+BATCH_PRIORITY = 10
+
+llm_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE_PRIORITY)
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Run the LLM requests made inside the block with the given priority"""
+    token = llm_priority.set(priority)
+    try:
+        yield
+    finally:
+        llm_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Continuously refilled bucket, capacity is one minute worth of the rate
+
+    Input:
+    per_minute: float, refill rate and capacity
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(
+            self.per_minute, self.level + (now - self.updated) * self.per_minute / 60
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken, requests above capacity wait for a full bucket"""
+        self._refill()
+        amount = min(amount, self.per_minute)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.per_minute
+
+    def take(self, amount: float):
+        self._refill()
+        self.level -= amount
+
+    def give_back(self, amount: float):
+        self._refill()
+        self.level = min(self.per_minute, self.level + amount)
+
+    def clamp(self, remaining: float):
+        """Never assume more capacity than the server reports left"""
+        self._refill()
+        self.level = min(self.level, remaining)
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Delay requested by the server through retry-after(-ms) headers, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(
+        error,
+        (
+            openai.RateLimitError,
+            openai.APIConnectionError,  # includes APITimeoutError
+            openai.InternalServerError,
+        ),
+    ):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in (
+        408,
+        409,
+    )
+
+
+class RequestScheduler:
+    """
+    Shared admission control for OpenAI requests
+
+    Requests wait in a priority queue until both the requests-per-minute and
+    tokens-per-minute buckets can take them, interactive requests go before
+    batch work. Rate limits reported by the server in x-ratelimit-* headers
+    lower the buckets, a 429 pauses every request for the retry-after delay.
+    Retryable failures back off exponentially with full jitter.
+
+    Input:
+    rpm: int, requests per minute
+    tpm: int, tokens per minute
+    max_retries: int, retries per request after the first attempt
+    """
+
+    def __init__(
+        self,
+        rpm: int = OPENAI_RPM_LIMIT,
+        tpm: int = OPENAI_TPM_LIMIT,
+        max_retries: int = OPENAI_MAX_RETRIES,
+        backoff_base: float = OPENAI_BACKOFF_BASE_SECONDS,
+        backoff_max: float = OPENAI_BACKOFF_MAX_SECONDS,
+    ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._waiting = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.in_flight = 0
+        self.requests_total = 0
+        self.retries_total = 0
+        self.rate_limited_total = 0
+        self.failures_total = 0
+        self.throttle_seconds_total = 0.0
+        self.backoff_seconds_total = 0.0
+
+    def _ensure_dispatcher(self):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+    async def _dispatch(self):
+        """Admit the head of the queue whenever the buckets allow it"""
+        while True:
+            while self._waiting and self._waiting[0][3].done():
+                heapq.heappop(self._waiting)  # caller cancelled while waiting
+            if not self._waiting:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            _, _, tokens, future = self._waiting[0]
+            wait = max(
+                self._paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+            )
+            if wait <= 0:
+                heapq.heappop(self._waiting)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                future.set_result(None)
+                continue
+
+            # A new, more urgent request or a refund can change the head
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _acquire(self, tokens: int, priority: int):
+        self._ensure_dispatcher()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (priority, next(self._sequence), tokens, future))
+        self._wakeup.set()
+        started = time.monotonic()
+        try:
+            await future
+        finally:
+            self.throttle_seconds_total += time.monotonic() - started
+
+    def observe_headers(self, headers):
+        """Follow the limits and remaining capacity the server reports"""
+        if not headers:
+            return
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            try:
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                if limit and float(limit) < bucket.per_minute:
+                    bucket.per_minute = float(limit)
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if remaining is not None:
+                    bucket.clamp(float(remaining))
+            except (TypeError, ValueError):
+                continue
+
+    def settle(self, estimated_tokens: int, used_tokens: Optional[int]):
+        """Correct the token bucket once the real usage of a request is known"""
+        if used_tokens is None:
+            return
+        difference = estimated_tokens - used_tokens
+        if difference > 0:
+            self.refund(difference)
+        elif difference < 0:
+            self.tokens.take(-difference)
+
+    def refund(self, tokens: int):
+        """Give reserved tokens back, e.g. for an attempt the server rejected"""
+        self.tokens.give_back(tokens)
+        if self._wakeup:
+            self._wakeup.set()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        ceiling = min(self.backoff_max, self.backoff_base * 2**attempt)
+        return random.uniform(0, ceiling)
+
+    async def call(
+        self,
+        make_request: Callable[[], Awaitable],
+        estimated_tokens: int,
+        priority: Optional[int] = None,
+    ):
+        """
+        Run make_request() once admitted, retrying retryable failures
+
+        Every attempt reserves estimated_tokens, a failed attempt gives its
+        reservation back, a successful one is corrected with settle().
+
+        Input:
+        make_request: callable returning a new request coroutine for each attempt
+        estimated_tokens: int, prompt plus expected completion tokens
+        priority: int, default is the llm_priority context variable
+
+        Returns the request's result or raises its last error
+        """
+        if priority is None:
+            priority = llm_priority.get()
+
+        for attempt in range(self.max_retries + 1):
+            await self._acquire(estimated_tokens, priority)
+            self.in_flight += 1
+            self.requests_total += 1
+            try:
+                return await make_request()
+            except Exception as e:
+                # A failed attempt produced no usage, settle() never runs for it
+                self.refund(estimated_tokens)
+                if not is_retryable(e) or attempt == self.max_retries:
+                    self.failures_total += 1
+                    raise
+                delay = self._backoff(attempt, e)
+                self.retries_total += 1
+                if isinstance(e, openai.RateLimitError):
+                    # Everyone waits, retrying others would only get more 429s
+                    self.rate_limited_total += 1
+                    self._paused_until = max(
+                        self._paused_until, time.monotonic() + delay
+                    )
+                logger.warning(
+                    f"OpenAI request failed ({type(e).__name__}), "
+                    f"retry {attempt + 1}/{self.max_retries} in {delay:.1f}s"
+                )
+            finally:
+                self.in_flight -= 1
+            self.backoff_seconds_total += delay
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict:
+        """Queue and throttling counters for this process"""
+        return {
+            "queue_depth": sum(1 for entry in self._waiting if not entry[3].done()),
+            "in_flight": self.in_flight,
+            "requests_total": self.requests_total,
+            "retries_total": self.retries_total,
+            "rate_limited_total": self.rate_limited_total,
+            "failures_total": self.failures_total,
+            "throttle_seconds_total": round(self.throttle_seconds_total, 3),
+            "backoff_seconds_total": round(self.backoff_seconds_total, 3),
+            "rpm_limit": self.requests.per_minute,
+            "tpm_limit": self.tokens.per_minute,
+            "paused_for_seconds": round(
+                max(0.0, self._paused_until - time.monotonic()), 3
+            ),
+        }
+
+
+llm_scheduler = RequestScheduler()
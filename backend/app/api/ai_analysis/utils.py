@@ -1,24 +1,28 @@
 import re
 from typing import Dict, List
+from api.database.claim_graph import build_claim_graph
 
 
 def build_claim_tree(claims) -> Dict:
-    """Build a tree structure of claim dependencies"""
+    """
+    Build a tree structure of claim dependencies in memory
+
+    dependent_claims maps each base claim number to its full dependent subtree.
+    The analysis pipeline loads the persisted graph with load_claim_tree instead.
+    """
     claim_tree = {"base_claims": [], "dependent_claims": {}}
 
-    for claim in claims:
-        dependency_match = re.search(r"claim (\d+)", claim.text.lower())
-        if dependency_match:
-            parent_num = str(int(dependency_match.group(1))).zfill(5)
-            if parent_num not in claim_tree["dependent_claims"]:
-                claim_tree["dependent_claims"][parent_num] = [claim]
-            else:
-                claim_tree["dependent_claims"][parent_num].append(claim)
+    for row in build_claim_graph(claims):
+        if row["depth"] == 0:
+            claim_tree["base_claims"].append(row["claim"])
+            claim_tree["dependent_claims"].setdefault(row["claim"].num, [])
         else:
-            claim_tree["base_claims"].append(claim)
+            claim_tree["dependent_claims"].setdefault(row["root"].num, []).append(
+                row["claim"]
+            )
 
     print(
-        f"Base Claims: {len(claim_tree['base_claims'])}, Dependent Claims: {claim_tree['base_claims']}"
+        f"Base Claims: {len(claim_tree['base_claims'])}, Dependent Claims: {sum(len(c) for c in claim_tree['dependent_claims'].values())}"
     )
     return claim_tree
 
@@ -1,10 +1,13 @@
+import asyncio
+import functools
+import hashlib
 import json
-from typing import List, Dict, Set
+from typing import Awaitable, Callable, List, Dict, Set, Tuple
 import re
 import uuid
 from openai import AsyncOpenAI
 import os
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy.orm import Session
 from api.database.database import (
     Company,
@@ -20,8 +23,21 @@ from api.ai_analysis.ai_analysis import (
     ai_generate_company_overall_risk_assessment,
     analyze_claims_batch,
     ai_detail_product_infringement_analysis,
+    ScreeningError,
+    PROMPT_VERSION,
+    SCREENING_MODEL,
+    DETAIL_MODEL,
+    SUMMARY_MODEL,
+)
+from api.database.claim_graph import load_claim_tree
+from api.database.executor import run_in_db, run_in_writer
+from api import metrics, tracing
+from api.ai_analysis.relevance import (
+    rank_products,
+    PREFILTER_TOP_K,
+    PREFILTER_MIN_SCORE,
+    PREFILTER_VERSION,
 )
-from api.ai_analysis.utils import build_claim_tree
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,27 +46,145 @@ client = None
 if os.getenv("OPENAI_API_KEY"):
     client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Max number of per-product detail analyses in flight at once
+ANALYSIS_CONCURRENCY = int(os.getenv("ANALYSIS_CONCURRENCY", "4"))
+
+
+def compute_analysis_fingerprint(
+    claims: List[Claim], products: List[Product], top_n: int
+) -> str:
+    """Hash of every input that determines the result of a company analysis"""
+    payload = {
+        "prompt_version": PROMPT_VERSION,
+        "models": [SCREENING_MODEL, DETAIL_MODEL, SUMMARY_MODEL],
+        "top_n": top_n,
+        "prefilter": [PREFILTER_TOP_K, PREFILTER_MIN_SCORE, PREFILTER_VERSION],
+        "claims": sorted([claim.num, claim.text] for claim in claims),
+        "products": sorted(
+            [product.name, product.description or ""] for product in products
+        ),
+    }
+    return hashlib.sha256(
+        json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+def find_reusable_analysis(
+    db: Session, company: Company, patent: Patent, input_fingerprint: str
+):
+    """Return the newest analysis of the same company and patent with identical inputs"""
+    return (
+        db.query(CompanyPatentAnalysis)
+        .filter(
+            CompanyPatentAnalysis.company_id == company.company_id,
+            CompanyPatentAnalysis.patent_id == patent.patent_id,
+            CompanyPatentAnalysis.input_fingerprint == input_fingerprint,
+        )
+        .order_by(CompanyPatentAnalysis.created_at.desc())
+        .first()
+    )
+
 
+@tracing.traced("analysis.company")
 async def analyze_company_against_patent(
-    company: Company, patent: Patent, top_n=2
+    company: Company,
+    patent: Patent,
+    top_n=2,
+    concurrency=ANALYSIS_CONCURRENCY,
+    force=False,
+    on_progress: Callable[[str, int, int], Awaitable] = None,
+    claim_tree: Dict = None,
+    on_event: Callable[[str, Dict], Awaitable] = None,
 ) -> Dict:
     """
     Analyze company's top_n products with the most base claims against a patent
 
+    Unless force is set, the newest analysis with the same input fingerprint
+    (claims, products, prompt version, models and top_n) is returned as is.
+
     Input:
     company: Company
     patent: Patent
     top_n: int, default is 2
+    concurrency: int, max detail analyses running at once, default is ANALYSIS_CONCURRENCY
+    force: bool, recompute even if a matching analysis exists, default is False
+    on_progress: async callable(stage, done, total), called as the analysis moves
+        through the screening, product_analysis and summary stages, default is None
+    claim_tree: Dict, already loaded load_claim_tree() result of the patent, default is None
+    on_event: async callable(event, payload) receiving partial results as they
+        are produced: "screening" with the shortlisted products, "product_analysis"
+        with each product's analysis, "overall_risk" with the summary. With
+        on_event the model answers are streamed and "product_analysis_partial"
+        and "overall_risk_partial" carry their fields as they arrive. Default is None
 
     Returns a CompanyPatentAnalysis record
     """
+    tracing.set_attributes(
+        company=company.name,
+        patent=patent.publication_number,
+        top_n=top_n,
+        force=force,
+    )
     db = next(get_db_session())
+    metrics.ANALYSES_IN_FLIGHT.inc(kind="company")
     try:
-        claims = patent.claims.all()
-        claim_tree = build_claim_tree(claims)
-        base_claim_analyses = await base_claim_analyze_company_products(
-            company, claim_tree["base_claims"]
+
+        def load_inputs():
+            tree = claim_tree or load_claim_tree(db, patent)
+            products = (
+                db.query(Product)
+                .filter(Product.company_id == company.company_id)
+                .order_by(Product.product_id)
+                .all()
+            )
+            input_fingerprint = compute_analysis_fingerprint(
+                tree["claims"], products, top_n
+            )
+            previous_analysis = None
+            if not force:
+                previous_analysis = find_reusable_analysis(
+                    db, company, patent, input_fingerprint
+                )
+            return tree, products, input_fingerprint, previous_analysis
+
+        with tracing.start_span("analysis.load_inputs"):
+            (
+                claim_tree,
+                products,
+                input_fingerprint,
+                previous_analysis,
+            ) = await run_in_db(load_inputs)
+        tracing.set_attributes(
+            claims=len(claim_tree["claims"]),
+            base_claims=len(claim_tree["base_claims"]),
+            products=len(products),
+            reused=previous_analysis is not None,
         )
+        if not force:
+            metrics.CACHE_LOOKUPS.inc(
+                cache="analysis", result="hit" if previous_analysis else "miss"
+            )
+        if previous_analysis:
+            logger.info(
+                f"Reusing analysis {previous_analysis.company_analysis_id} "
+                f"for {company.name} / {patent.publication_number}"
+            )
+            return previous_analysis
+
+        if on_progress:
+            await on_progress("screening", 0, 1)
+        # A failed screening leaves nothing shortlisted, the result is still
+        # stored but not reused
+        screening_failed = False
+        try:
+            base_claim_analyses = await base_claim_analyze_company_products(
+                company, claim_tree["base_claims"], products=products
+            )
+        except ScreeningError as e:
+            logger.error(f"Screening failed for {company.name}: {str(e)}")
+            tracing.set_attributes(screening_failed=True)
+            screening_failed = True
+            base_claim_analyses = {}
 
         # print(f"base_claim_analyses: {base_claim_analyses}")
 
@@ -63,9 +197,6 @@ async def analyze_company_against_patent(
             created_at=datetime.now().isoformat(),
         )
 
-        db.add(company_analysis)
-        db.flush()
-
         product_patent_analyses = []
         risk_counts = {"High": 0, "Moderate": 0, "Low": 0}
         product_analyses_explanations = []
@@ -76,46 +207,96 @@ async def analyze_company_against_patent(
             reverse=True,
         )
 
+        products_by_name = {}
+        for product in products:
+            products_by_name.setdefault(product.name, product)
+
+        shortlisted_products = []
         for product_name, analysis in sorted_base_claim_analyses[:top_n]:
-            product = db.query(Product).filter(Product.name == product_name).first()
+            product = products_by_name.get(product_name)
             if not product:
                 continue
 
-            dependent_claims = []
+            # Subtrees of different base claims can share claims
+            dependent_claims = {}
             for claim_num in analysis["relevant_base_claims"]:
-                dependent_claims.extend(
-                    claim_tree["dependent_claims"].get(claim_num, [])
-                )
-            product_patent_analysis = await analyze_patent_with_single_product(
-                patent=patent,
-                product=product,
-                claims=dependent_claims,
-                company_analysis_id=company_analysis.company_analysis_id,
+                for claim in claim_tree["dependent_claims"].get(claim_num, []):
+                    dependent_claims.setdefault(claim.claim_id, claim)
+            dependent_claims = list(dependent_claims.values())
+            shortlisted_products.append((product, dependent_claims))
+
+        tracing.set_attributes(
+            detail_products=[product.name for product, _ in shortlisted_products]
+        )
+        if on_event:
+            await on_event(
+                "screening",
+                {
+                    "company_analysis_id": company_analysis.company_analysis_id,
+                    "shortlisted_products": [
+                        {
+                            "product_id": product.product_id,
+                            "product_name": product.name,
+                            "relevant_base_claims": base_claim_analyses[product.name][
+                                "relevant_base_claims"
+                            ],
+                        }
+                        for product, _ in shortlisted_products
+                    ],
+                },
             )
 
-            product_analysis = ProductPatentAnalysis(
-                product_analysis_id=str(uuid.uuid4()),
-                patent_id=patent.patent_id,
-                product_id=product.product_id,
-                company_analysis_id=company_analysis.company_analysis_id,
-                infringement_likelihood=product_patent_analysis.get(
-                    "infringement_likelihood", "Unknown"
-                ),
-                relevant_claims=json.dumps(
-                    product_patent_analysis.get("relevant_claims", [])
-                ),
-                explanation=product_patent_analysis.get(
-                    "explanation", "Initial analysis"
-                ),
-                specific_features=json.dumps(
-                    product_patent_analysis.get("specific_features", [])
-                ),
-                created_at=datetime.now().isoformat(),
+        # Rows are built as each detail analysis lands, so the product_analysis
+        # event carries the stored row. created_at is stamped by shortlist
+        # position, readers order by it, not by which model call finished first
+        product_rows = [None] * len(shortlisted_products)
+        shortlisted_at = datetime.now()
+
+        async def on_product_result(index: int, result: Dict):
+            product = shortlisted_products[index][0]
+            product_rows[index] = build_product_analysis(
+                patent,
+                product,
+                company_analysis.company_analysis_id,
+                result,
+                created_at=shortlisted_at + timedelta(microseconds=index),
             )
+            if on_event:
+                await on_event(
+                    "product_analysis",
+                    product_analysis_payload(product_rows[index], product),
+                )
 
-            db.add(product_analysis)
+        on_product_partial = None
+        if on_event:
+
+            async def on_product_partial(index: int, partial: Dict):
+                product = shortlisted_products[index][0]
+                await on_event(
+                    "product_analysis_partial",
+                    {
+                        "company_analysis_id": company_analysis.company_analysis_id,
+                        "product_id": product.product_id,
+                        "product_name": product.name,
+                        **partial,
+                    },
+                )
+
+        # Detail analyses run concurrently, results come back in shortlist order
+        await analyze_products_concurrently(
+            patent=patent,
+            product_claims=shortlisted_products,
+            company_analysis_id=company_analysis.company_analysis_id,
+            concurrency=concurrency,
+            on_progress=on_progress,
+            on_result=on_product_result,
+            on_partial=on_product_partial,
+        )
+
+        for product_analysis in product_rows:
             product_patent_analyses.append(product_analysis)
-            risk_counts[product_analysis.infringement_likelihood] += 1
+            if product_analysis.infringement_likelihood in risk_counts:
+                risk_counts[product_analysis.infringement_likelihood] += 1
             product_analyses_explanations.append(product_analysis.explanation)
 
         # Set overall risk based on highest count, if all count is 0, set to Low
@@ -125,56 +306,195 @@ async def analyze_company_against_patent(
             else "Low"
         )
 
+        if on_progress:
+            await on_progress("summary", 0, 1)
         # use ai to generate overall risk assessment base on risk counts and prodcut explanations.
-        company_analysis.overall_risk_assessment = (
-            await ai_generate_company_overall_risk_assessment(
-                company_analysis.overall_risk, product_analyses_explanations
+        on_summary_partial = None
+        if on_event:
+
+            async def on_summary_partial(text: str):
+                await on_event(
+                    "overall_risk_partial",
+                    {
+                        "company_analysis_id": company_analysis.company_analysis_id,
+                        "overall_risk": company_analysis.overall_risk,
+                        "overall_risk_assessment": text,
+                    },
+                )
+
+        with tracing.start_span(
+            "analysis.summary", overall_risk=company_analysis.overall_risk
+        ):
+            company_analysis.overall_risk_assessment = (
+                await ai_generate_company_overall_risk_assessment(
+                    company_analysis.overall_risk,
+                    product_analyses_explanations,
+                    on_partial=on_summary_partial,
+                )
+            )
+
+        if on_progress:
+            await on_progress("summary", 1, 1)
+        if on_event:
+            await on_event(
+                "overall_risk",
+                {
+                    "company_analysis_id": company_analysis.company_analysis_id,
+                    "overall_risk": company_analysis.overall_risk,
+                    "overall_risk_assessment": company_analysis.overall_risk_assessment,
+                },
+            )
+
+        # Only clean results are reusable, failed runs are recomputed next time
+        analysis_failed = (
+            screening_failed
+            or any(
+                analysis.infringement_likelihood not in risk_counts
+                for analysis in product_patent_analyses
+            )
+            or company_analysis.overall_risk_assessment.startswith(
+                ("Error generating risk assessment", "AI analysis not available")
             )
         )
+        if not analysis_failed:
+            company_analysis.input_fingerprint = input_fingerprint
 
-        db.commit()
-        db.refresh(company_analysis)
+        # Rows are written in one transaction once every model call is done
+        def save_analysis():
+            db.add(company_analysis)
+            db.add_all(product_patent_analyses)
+            db.commit()
+            db.refresh(company_analysis)
+
+        with tracing.start_span(
+            "analysis.save", product_analyses=len(product_patent_analyses)
+        ):
+            await run_in_writer(save_analysis)
+        tracing.set_attributes(overall_risk=company_analysis.overall_risk)
 
         return company_analysis
 
     except Exception as e:
         logger.error(f"Error in analyze_company_against_patent: {str(e)}")
-        db.rollback()
+        await run_in_db(db.rollback)
         raise e
     finally:
-        db.close()
+        metrics.ANALYSES_IN_FLIGHT.dec(kind="company")
+        await run_in_db(db.close)
+
+
+def build_product_analysis(
+    patent: Patent,
+    product: Product,
+    company_analysis_id: str,
+    result: Dict,
+    created_at: datetime = None,
+) -> ProductPatentAnalysis:
+    """ProductPatentAnalysis row for a detail analysis result, not yet added to a session"""
+    return ProductPatentAnalysis(
+        product_analysis_id=str(uuid.uuid4()),
+        patent_id=patent.patent_id,
+        product_id=product.product_id,
+        company_analysis_id=company_analysis_id,
+        infringement_likelihood=result.get("infringement_likelihood", "Unknown"),
+        relevant_claims=json.dumps(result.get("relevant_claims", [])),
+        explanation=result.get("explanation", "Initial analysis"),
+        specific_features=json.dumps(result.get("specific_features", [])),
+        created_at=(created_at or datetime.now()).isoformat(),
+    )
+
+
+def product_analysis_payload(row: ProductPatentAnalysis, product: Product) -> Dict:
+    """JSON-serializable form of a product analysis row"""
+    return {
+        "product_analysis_id": row.product_analysis_id,
+        "company_analysis_id": row.company_analysis_id,
+        "product_id": product.product_id,
+        "product_name": product.name,
+        "infringement_likelihood": row.infringement_likelihood,
+        "relevant_claims": json.loads(row.relevant_claims or "[]"),
+        "explanation": row.explanation,
+        "specific_features": json.loads(row.specific_features or "[]"),
+        "created_at": row.created_at,
+    }
 
 
+@tracing.traced("analysis.screening")
 async def base_claim_analyze_company_products(
-    company: Company, base_claims: List[Claim]
+    company: Company,
+    base_claims: List[Claim],
+    top_k: int = PREFILTER_TOP_K,
+    min_score: float = PREFILTER_MIN_SCORE,
+    fast_estimate: bool = False,
+    products: List[Product] = None,
 ) -> Dict:
     """
     Analyze company's products against base claims
 
+    Products are first ranked locally with BM25 and only the top_k candidates
+    scoring at least min_score are sent to the model, or the best top_k when
+    none does. With fast_estimate the local scores are returned directly and
+    no LLM call is made.
+
     Input:
     company: Company
     base_claims: List[Claim]
+    top_k: int, default is PREFILTER_TOP_K
+    min_score: float, default is PREFILTER_MIN_SCORE
+    fast_estimate: bool, default is False
+    products: List[Product], already loaded products of the company, default is company.products
 
-    Returns a dict of product name and its analysis
+    Returns a dict of product name and its analysis. Raises ScreeningError
+    when the model screening fails, see analyze_claims_batch.
     """
-    # Format all claims once
-    claims_text = "\n\n".join(
-        [f"Claim {claim.num}:\n{claim.text}" for claim in base_claims]
+    if products is None:
+        products = await run_in_db(lambda: list(company.products))
+    ranked_products = rank_products(
+        base_claims, products, top_k=top_k, min_score=min_score
     )
-
-    products_text = "\n\n".join(
-        [
-            f"Product: {product.name}\n" f"Description: {product.description}"
-            for product in company.products
-        ]
+    tracing.set_attributes(
+        company=company.name,
+        base_claims=len(base_claims),
+        products=len(products),
+        shortlisted_products=[ranked["product"].name for ranked in ranked_products],
+        fast_estimate=fast_estimate,
     )
 
     print(
-        f"Analyzing {len(list(company.products))} products for company: {company.name}"
+        f"Shortlisted {len(ranked_products)} of {len(products)} products for company: {company.name}"
     )
 
-    # Single batch analysis for all products
-    base_claim_analyses = await analyze_claims_batch(claims_text, products_text)
+    if fast_estimate:
+        # Base claims scoring at least half of the product's best claim count as relevant
+        return {
+            ranked["product"].name: {
+                "product_id": ranked["product"].product_id,
+                "relevance_score": ranked["score"],
+                "relevant_base_claims": [
+                    claim_num
+                    for claim_num, score in sorted(
+                        ranked["claim_scores"].items(), key=lambda x: -x[1]
+                    )
+                    if score > 0 and score >= ranked["score"] / 2
+                ],
+            }
+            for ranked in ranked_products
+        }
+
+    if not ranked_products:
+        return {}
+
+    # Format all claims once
+    claims_texts = [f"Claim {claim.num}:\n{claim.text}" for claim in base_claims]
+
+    products_texts = [
+        f"Product: {ranked['product'].name}\n"
+        f"Description: {ranked['product'].description}"
+        for ranked in ranked_products
+    ]
+
+    # Batch analysis for all shortlisted products, chunked if it does not fit one prompt
+    base_claim_analyses = await analyze_claims_batch(claims_texts, products_texts)
 
     return {
         product_name: {
@@ -190,11 +510,92 @@ async def base_claim_analyze_company_products(
     }
 
 
+@tracing.traced("analysis.detail")
+async def analyze_products_concurrently(
+    patent: Patent,
+    product_claims: List[Tuple[Product, List[Claim]]],
+    company_analysis_id: str = None,
+    concurrency: int = ANALYSIS_CONCURRENCY,
+    on_progress: Callable[[str, int, int], Awaitable] = None,
+    on_result: Callable[[int, Dict], Awaitable] = None,
+    on_partial: Callable[[int, Dict], Awaitable] = None,
+) -> List[Dict]:
+    """
+    Run detail analyses for several products concurrently
+
+    Input:
+    patent: Patent
+    product_claims: List of (Product, claims to analyze) pairs
+    company_analysis_id: str, default is None
+    concurrency: int, max analyses running at once, default is ANALYSIS_CONCURRENCY
+    on_progress: async callable("product_analysis", done, total), default is None
+    on_result: async callable(index, analysis) called as each product's analysis
+        finishes, index being its position in product_claims, default is None
+    on_partial: async callable(index, partial) streaming each product's answer,
+        see ai_detail_product_infringement_analysis, default is None
+
+    Returns a list of product analysis dicts in the same order as product_claims.
+    A product whose analysis raises gets an "Error" analysis instead of failing the others.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    total = len(product_claims)
+    tracing.set_attributes(products=total, concurrency=concurrency)
+    done = 0
+
+    async def run(index: int, product: Product, claims: List[Claim]) -> Dict:
+        nonlocal done
+        async with semaphore:
+            try:
+                result = await analyze_patent_with_single_product(
+                    patent=patent,
+                    product=product,
+                    claims=claims,
+                    company_analysis_id=company_analysis_id,
+                    on_partial=(
+                        functools.partial(on_partial, index) if on_partial else None
+                    ),
+                )
+            except Exception as e:
+                logger.error(f"Detail analysis failed for {product.name}: {str(e)}")
+                result = {
+                    "infringement_likelihood": "Error",
+                    "relevant_claims": [],
+                    "explanation": f"Analysis failed: {str(e)}",
+                    "specific_features": [],
+                }
+            finally:
+                done += 1
+                if on_progress:
+                    await on_progress("product_analysis", done, total)
+        if on_result:
+            await on_result(index, result)
+        return result
+
+    if on_progress:
+        await on_progress("product_analysis", 0, total)
+
+    results = await asyncio.gather(
+        *[
+            run(index, product, claims)
+            for index, (product, claims) in enumerate(product_claims)
+        ],
+        return_exceptions=True,
+    )
+
+    # Failures are turned into "Error" analyses, only cancellation gets here
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+@tracing.traced("analysis.product")
 async def analyze_patent_with_single_product(
     patent: Patent,
     product: Product,
     claims: List[Claim],
     company_analysis_id: str = None,  # Add this parameter
+    on_partial: Callable[[Dict], Awaitable] = None,
 ) -> Dict:
     """
     Analyze a patent against a single product with detailed infringement analysis
@@ -206,17 +607,22 @@ async def analyze_patent_with_single_product(
     product: Product
     claims: List[Claim]
     company_analysis_id: str, default is None
+    on_partial: async callable(partial), streams the model's answer, see
+        ai_detail_product_infringement_analysis, default is None
 
     Returns a dict of product analysis
     """
+    tracing.set_attributes(product=product.name, claims=len(claims))
     db = next(get_db_session())
+    metrics.ANALYSES_IN_FLIGHT.inc(kind="product")
     try:
-        claims_text = "\n\n".join(
-            [f"Claim {claim.num}:\n{claim.text}" for claim in claims]
-        )
+        claims_texts = [f"Claim {claim.num}:\n{claim.text}" for claim in claims]
         product_text = f"Product: {product.name}\nDescription: {product.description}"
         single_product_analysis = await ai_detail_product_infringement_analysis(
-            claims_text, product_text
+            claims_texts, product_text, on_partial=on_partial
+        )
+        tracing.set_attributes(
+            infringement_likelihood=single_product_analysis["infringement_likelihood"]
         )
         # print(f"single_product_analysis: {single_product_analysis}")
         if not company_analysis_id:
@@ -236,17 +642,21 @@ async def analyze_patent_with_single_product(
                 created_at=datetime.now().isoformat(),
             )
 
-            db.add(new_analysis)
-            db.commit()
-            db.refresh(new_analysis)
+            def save_analysis():
+                db.add(new_analysis)
+                db.commit()
+                db.refresh(new_analysis)
+
+            await run_in_writer(save_analysis)
         return single_product_analysis
 
     except Exception as e:
         logger.error(f"Error in analyze_patent_with_single_product: {str(e)}")
-        db.rollback()
+        await run_in_db(db.rollback)
         raise e
     finally:
-        db.close()
+        metrics.ANALYSES_IN_FLIGHT.dec(kind="product")
+        await run_in_db(db.close)
 
 
 # Example usage:
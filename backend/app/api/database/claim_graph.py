@@ -0,0 +1,196 @@
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from .database import Claim, ClaimDependency, Patent, engine, read_engine
+from .executor import call_in_writer
+
+# "claim 5", "claims 1-3", "claims 1 to 3", "claims 1, 2 or 4", "claim 1 or claim 2"
+CLAIM_REFERENCE_PATTERN = re.compile(
+    r"\bclaims?\s+(\d+(?:\s*(?:,|-|–|to|through|or|and|and/or)\s*(?:claims?\s+)?\d+)*)",
+    re.IGNORECASE,
+)
+CLAIM_RANGE_PATTERN = re.compile(r"(\d+)\s*(?:-|–|to|through)\s*(?:claims?\s+)?(\d+)")
+PRECEDING_CLAIMS_PATTERN = re.compile(
+    r"\b(?:any|one|each)\b[\w\s]{0,20}?\b(?:preceding|previous|foregoing|prior)\s+claims?\b",
+    re.IGNORECASE,
+)
+
+
+LEADING_DIGITS_PATTERN = re.compile(r"\s*(\d+)")
+
+
+def claim_number(claim) -> Optional[int]:
+    """
+    Numeric claim number, claim.num is stored zero padded ("00001")
+
+    Only the leading digits count, so "1a" is claim 1. Returns None when
+    there are none.
+    """
+    match = LEADING_DIGITS_PATTERN.match(str(claim.num or ""))
+    return int(match.group(1)) if match else None
+
+
+def parse_claim_references(text: str, number: int) -> List[int]:
+    """
+    Numbers of the claims a claim depends on, in ascending order
+
+    Handles single references, ranges, lists and "any preceding claim".
+    Only references to earlier claims are kept so the graph stays acyclic.
+    """
+    text = text or ""
+    references = set()
+    if PRECEDING_CLAIMS_PATTERN.search(text):
+        references.update(range(1, number))
+
+    for match in CLAIM_REFERENCE_PATTERN.finditer(text):
+        listed = match.group(1)
+        for start, end in CLAIM_RANGE_PATTERN.findall(listed):
+            references.update(range(int(start), int(end) + 1))
+        listed = CLAIM_RANGE_PATTERN.sub(" ", listed)
+        references.update(int(num) for num in re.findall(r"\d+", listed))
+
+    return sorted(ref for ref in references if 0 < ref < number)
+
+
+def build_claim_graph(claims) -> List[Dict]:
+    """
+    Compute the transitive dependency graph of a patent's claims
+
+    Every claim gets one row per base claim it ultimately depends on, with the
+    parent on the shortest path to that base claim and its depth. Base claims
+    get a single row pointing at themselves with depth 0. Claims without a
+    claim number get no rows, the rest of the patent is unaffected.
+
+    Returns a list of {"claim", "parent", "root", "depth"} dicts
+    """
+    by_number = {}
+    for claim in claims:
+        number = claim_number(claim)
+        # A claim without a number cannot be referenced, it gets no edges
+        if number is not None:
+            by_number.setdefault(number, claim)
+
+    # References only point backwards, so parents are resolved before children
+    paths = {}
+    rows = []
+    for number in sorted(by_number):
+        claim = by_number[number]
+        parents = [
+            ref
+            for ref in parse_claim_references(claim.text, number)
+            if ref in by_number
+        ]
+        if not parents:
+            paths[number] = {number: (0, None)}
+        else:
+            roots = {}
+            for parent in parents:
+                for root, (depth, _) in paths[parent].items():
+                    if root not in roots or depth + 1 < roots[root][0]:
+                        roots[root] = (depth + 1, parent)
+            paths[number] = roots
+
+        for root, (depth, parent) in sorted(paths[number].items()):
+            rows.append(
+                {
+                    "claim": claim,
+                    "parent": by_number[parent] if parent is not None else None,
+                    "root": by_number[root],
+                    "depth": depth,
+                }
+            )
+    return rows
+
+
+def claim_dependency_rows(patent_id: int, graph: List[Dict]) -> List[Dict]:
+    """claim_dependencies values of a build_claim_graph() result, claims must have ids"""
+    return [
+        {
+            "patent_id": patent_id,
+            "claim_id": row["claim"].claim_id,
+            "parent_claim_id": row["parent"].claim_id if row["parent"] else None,
+            "root_claim_id": row["root"].claim_id,
+            "depth": row["depth"],
+        }
+        for row in graph
+    ]
+
+
+def store_claim_dependencies(db: Session, patent_id: int, claims) -> int:
+    """
+    Replace the stored dependency graph of a patent, claims must have ids
+
+    Returns the number of rows written
+    """
+    db.query(ClaimDependency).filter(ClaimDependency.patent_id == patent_id).delete(
+        synchronize_session=False
+    )
+    rows = claim_dependency_rows(patent_id, build_claim_graph(claims))
+    if rows:
+        db.execute(ClaimDependency.__table__.insert(), rows)
+    return len(rows)
+
+
+def _replace_claim_dependencies(bind, patent_id: int, rows: List[Dict]):
+    table = ClaimDependency.__table__
+    with bind.begin() as connection:
+        connection.execute(table.delete().where(table.c.patent_id == patent_id))
+        connection.execute(table.insert(), rows)
+
+
+def load_claim_tree(db: Session, patent: Patent) -> Dict:
+    """
+    Load base claims and their full dependent subtrees with one indexed query
+
+    Patents ingested before the graph existed are indexed on first use, the
+    rows are committed on the writer thread and the caller's session is left
+    untouched. On a read-only session the graph is only built in memory and
+    stored by a later write.
+
+    Returns {"claims": [...], "base_claims": [...], "dependent_claims": {base claim num: [...]}}
+    """
+    rows = (
+        db.query(ClaimDependency.root_claim_id, ClaimDependency.depth, Claim)
+        .join(Claim, Claim.claim_id == ClaimDependency.claim_id)
+        .filter(ClaimDependency.patent_id == patent.patent_id)
+        .order_by(ClaimDependency.root_claim_id, ClaimDependency.depth, Claim.claim_id)
+        .all()
+    )
+    if not rows:
+        claims = db.query(Claim).filter(Claim.patent_id == patent.patent_id).all()
+        if not claims:
+            return {"claims": [], "base_claims": [], "dependent_claims": {}}
+        graph = build_claim_graph(claims)
+        # Claims without numbers give no rows, there is nothing to store
+        if graph and (read_engine is engine or db.get_bind() is not read_engine):
+            call_in_writer(
+                _replace_claim_dependencies,
+                db.get_bind(),
+                patent.patent_id,
+                claim_dependency_rows(patent.patent_id, graph),
+            )
+        rows = sorted(
+            ((row["root"].claim_id, row["depth"], row["claim"]) for row in graph),
+            key=lambda row: (row[0], row[1], row[2].claim_id),
+        )
+
+    claims = {}
+    base_claims = {}
+    dependent_claims = {}
+    for root_claim_id, depth, claim in rows:
+        claims[claim.claim_id] = claim
+        if depth == 0:
+            base_claims[claim.claim_id] = claim
+            dependent_claims.setdefault(claim.num, [])
+        else:
+            dependent_claims.setdefault(base_claims[root_claim_id].num, []).append(
+                claim
+            )
+
+    return {
+        "claims": sorted(claims.values(), key=claim_number),
+        "base_claims": sorted(base_claims.values(), key=claim_number),
+        "dependent_claims": dependent_claims,
+    }
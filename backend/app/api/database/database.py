@@ -7,25 +7,58 @@ from sqlalchemy import (
     ForeignKey,
     Text,
     Boolean,
+    Index,
+    event,
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, scoped_session
+from sqlalchemy.orm import sessionmaker, relationship, scoped_session, deferred
 import json
+import os
 from pathlib import Path
 from uuid import uuid4
 from sqlalchemy.orm import Session
+from .search import create_patent_search_index, drop_patent_search_index
+from . import profiler, storage
 
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./data/patent_db.sqlite"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./data/patent_db.sqlite")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30}
-)
+
+def _create_engine(read_only: bool = False):
+    engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={
+            "check_same_thread": False,
+            "timeout": 30,
+            "factory": profiler.ProfilingConnection,
+        },
+        **storage.engine_options(SQLALCHEMY_DATABASE_URL),
+    )
+    storage.apply_profile(engine, read_only=read_only)
+    # Per-request SQL profile, slow-query log and N+1 detection
+    event.listen(engine, "before_cursor_execute", profiler.before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", profiler.after_cursor_execute)
+    event.listen(engine, "handle_error", profiler.handle_error)
+    return engine
+
+
+engine = _create_engine()
+# Query resolvers read through their own pool of query_only connections, with
+# WAL they are not blocked by analysis commits on the writer engine
+if storage.WAL_PROFILE and storage.is_file_database(SQLALCHEMY_DATABASE_URL):
+    read_engine = _create_engine(read_only=True)
+else:
+    read_engine = engine
 
 # Create scoped session factory
 SessionLocal = scoped_session(
     sessionmaker(autocommit=False, autoflush=False, bind=engine)
 )
+# One session per read-only request, closed by the caller. Loaded objects
+# stay usable after a commit ends the read transaction, see Context.run_db
+ReadSessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=read_engine
+)
 
 Base = declarative_base()
 
@@ -36,7 +69,7 @@ class Claim(Base):
     claim_id = Column(Integer, primary_key=True)
     num = Column(String, index=True)
     text = Column(Text)
-    patent_id = Column(Integer, ForeignKey("patents.patent_id"))
+    patent_id = Column(Integer, ForeignKey("patents.patent_id"), index=True)
     patent = relationship("Patent", back_populates="claims")
 
 
@@ -53,11 +86,12 @@ class Patent(Base):
     priority_date = Column(String, nullable=True)
     application_date = Column(String, nullable=True)
     grant_date = Column(String, nullable=True)
-    abstract = Column(Text, nullable=True)
-    description = Column(Text, nullable=True)
+    # Heavy text columns are only loaded on access or when a query asks for them
+    abstract = deferred(Column(Text, nullable=True))
+    description = deferred(Column(Text, nullable=True))
     jurisdictions = Column(String, nullable=True)
     classifications = Column(String, nullable=True)
-    citations = Column(String, nullable=True)
+    citations = deferred(Column(String, nullable=True))
     image_urls = Column(String, nullable=True)
     landscapes = Column(String, nullable=True)
     created_at = Column(String, nullable=True)
@@ -66,36 +100,69 @@ class Patent(Base):
     citations_non_patent = Column(String, nullable=True)
     provenance = Column(String, nullable=True)
     attachment_urls = Column(String, nullable=True)
-    application_events = Column(String, nullable=True)
+    application_events = deferred(Column(String, nullable=True))
     claims = relationship(
         "Claim",
         back_populates="patent",
         cascade="all, delete-orphan",
         lazy="dynamic",  # This is important for relay-style pagination
     )
+    claim_dependencies = relationship(
+        "ClaimDependency", cascade="all, delete-orphan", lazy="dynamic"
+    )
 
-    def __init__(self, **kwargs):
-        claims_data = None
-        if "claims" in kwargs:
-            if isinstance(kwargs["claims"], str):
-                claims_data = json.loads(kwargs["claims"])
-            else:
-                claims_data = kwargs["claims"]
-            kwargs.pop("claims")
+    @classmethod
+    def split_record(cls, record: dict):
+        """
+        Split a raw patent record into column values and its claims list
+
+        Unknown keys are dropped and list/dict fields are stored as JSON strings.
+        """
+        claims_data = record.get("claims") or []
+        if isinstance(claims_data, str):
+            claims_data = json.loads(claims_data)
 
-        valid_fields = self.__table__.columns.keys()
-        filtered_kwargs = {k: v for k, v in kwargs.items() if k in valid_fields}
+        valid_fields = cls.__table__.columns.keys()
+        filtered_kwargs = {
+            k: v for k, v in record.items() if k in valid_fields and k != "claims"
+        }
 
         for field in ["inventors", "classifications", "citations", "image_urls"]:
             if isinstance(filtered_kwargs.get(field), (dict, list)):
                 filtered_kwargs[field] = json.dumps(filtered_kwargs[field])
 
+        return filtered_kwargs, claims_data
+
+    def __init__(self, **kwargs):
+        filtered_kwargs, claims_data = self.split_record(kwargs)
+
         super().__init__(**filtered_kwargs)
 
         # Create claims after patent is initialized
-        if claims_data:
-            for claim in claims_data:
-                self.claims.append(Claim(num=claim["num"], text=claim["text"]))
+        for claim in claims_data:
+            self.claims.append(Claim(num=claim["num"], text=claim["text"]))
+
+
+class ClaimDependency(Base):
+    """Precomputed claim dependency graph, one row per (claim, base claim) pair"""
+
+    __tablename__ = "claim_dependencies"
+
+    claim_dependency_id = Column(Integer, primary_key=True)
+    patent_id = Column(Integer, ForeignKey("patents.patent_id"), nullable=False)
+    claim_id = Column(Integer, ForeignKey("claims.claim_id"), nullable=False)
+    parent_claim_id = Column(Integer, ForeignKey("claims.claim_id"), nullable=True)
+    root_claim_id = Column(Integer, ForeignKey("claims.claim_id"), nullable=False)
+    depth = Column(Integer, nullable=False)  # 0 for base claims
+
+    __table_args__ = (
+        Index(
+            "ix_claim_dependencies_patent_root_depth",
+            "patent_id",
+            "root_claim_id",
+            "depth",
+        ),
+    )
 
 
 class Company(Base):
@@ -127,6 +194,7 @@ class ProductPatentAnalysis(Base):
         String(36),
         ForeignKey("company_patent_analyses.company_analysis_id"),
         nullable=True,
+        index=True,
     )
     infringement_likelihood = Column(String)  # High, Medium, Low
     relevant_claims = Column(String)  # JSON string of claim numbers
@@ -156,6 +224,8 @@ class CompanyPatentAnalysis(Base):
     created_at = Column(String)
     is_saved = Column(Boolean, default=False)
     is_saved_at = Column(String, nullable=True)
+    # Hash of claims, products, prompt version and models, used to reuse results
+    input_fingerprint = Column(String(64), nullable=True, index=True)
 
     patent = relationship("Patent", backref="company_patent_analyses")
     company = relationship("Company", backref="company_patent_analyses")
@@ -163,17 +233,94 @@ class CompanyPatentAnalysis(Base):
         "ProductPatentAnalysis",
         back_populates="company_analysis",
         foreign_keys=[ProductPatentAnalysis.company_analysis_id],
-        lazy="joined",
     )
 
+    __table_args__ = (
+        Index("ix_company_patent_analyses_saved", "is_saved", "created_at"),
+    )
+
+
+class AnalysisBatch(Base):
+    """Portfolio run of many patents against many companies, one job per pair"""
+
+    __tablename__ = "analysis_batches"
+
+    batch_id = Column(String(36), primary_key=True, default=lambda: str(uuid4()))
+    params = Column(String)  # JSON string of the requested patents and companies
+    pairs_total = Column(Integer, default=0)
+    created_at = Column(String)
+
+    jobs = relationship("AnalysisJob", back_populates="batch", lazy="dynamic")
+
+
+class AnalysisJob(Base):
+    """Background company analysis, persisted so it survives restarts"""
+
+    __tablename__ = "analysis_jobs"
+
+    job_id = Column(String(36), primary_key=True, default=lambda: str(uuid4()))
+    status = Column(String, index=True)  # queued, running, succeeded, failed, cancelled
+    priority = Column(Integer, default=0)  # lower runs first
+    batch_id = Column(
+        String(36), ForeignKey("analysis_batches.batch_id"), nullable=True, index=True
+    )
+    stage = Column(String, nullable=True)  # screening, product_analysis, summary
+    progress_done = Column(Integer, default=0)
+    progress_total = Column(Integer, default=0)
+    params = Column(String)  # JSON string of the analysis arguments
+    cancel_requested = Column(Boolean, default=False)
+    company_analysis_id = Column(
+        String(36),
+        ForeignKey("company_patent_analyses.company_analysis_id"),
+        nullable=True,
+    )
+    error = Column(String, nullable=True)
+    # host:pid of the process running the job and when it last reported in
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(String, nullable=True)
+    created_at = Column(String)
+    started_at = Column(String, nullable=True)
+    finished_at = Column(String, nullable=True)
+
+    batch = relationship("AnalysisBatch", back_populates="jobs")
+
+
+class IngestCheckpoint(Base):
+    """Progress of a bulk ingest source, committed together with each batch"""
+
+    __tablename__ = "ingest_checkpoints"
+
+    source = Column(String, primary_key=True)
+    records_done = Column(Integer, default=0)
+    completed = Column(Boolean, default=False)
+    updated_at = Column(String, nullable=True)
+
+
+class SchemaVersion(Base):
+    """Applied migrations, see migrations.py"""
+
+    __tablename__ = "schema_version"
+
+    version = Column(Integer, primary_key=True)
+    name = Column(String)
+    applied_at = Column(String)
+    duration_ms = Column(Integer, nullable=True)
+
+
+# Full-text index over patents and claims, kept in sync by triggers
+event.listen(Base.metadata, "after_create", create_patent_search_index)
+event.listen(Base.metadata, "before_drop", drop_patent_search_index)
+
 
 def create_fresh_db():
     """Creates a fresh database with initial data"""
     print("Creating fresh database...")
 
-    # Drop and create all tables
+    from .migrations import migrate
+
+    # Drop all tables, the empty database is created at the latest version
     Base.metadata.drop_all(bind=engine)
-    Base.metadata.create_all(bind=engine)
+    migrate(engine)
     print("Schema created successfully")
 
     # Initialize with company and patent data
@@ -181,73 +328,14 @@ def create_fresh_db():
     print("Fresh database created with initial data")
 
 
-def update_schema():
-    """Updates schema without affecting existing data"""
-    print("Updating database schema...")
-    try:
-        # First ensure all tables exist
-        Base.metadata.create_all(bind=engine)
-        print("Base tables verified")
-
-        # Get all models from Base
-        for table in Base.metadata.sorted_tables:
-            table_name = table.name
-            print(f"\nChecking table: {table_name}")
-
-            # Get expected columns from model
-            model_columns = {col.name: col for col in table.columns}
-
-            # Get existing columns from database
-            with engine.connect() as conn:
-                result = conn.execute(f"PRAGMA table_info('{table_name}')")
-                existing_columns = {row[1]: row for row in result.fetchall()}
-
-                # Check for missing columns
-                for col_name, col in model_columns.items():
-                    if col_name not in existing_columns:
-                        print(f"Adding column {col_name} to {table_name}")
-
-                        # Get column type for SQLite
-                        col_type = str(col.type)
-                        if isinstance(col.type, Boolean):
-                            col_type = "BOOLEAN"
-
-                        # Get default value if any
-                        default_value = ""
-                        if col.default is not None:
-                            if isinstance(col.default.arg, bool):
-                                default_value = (
-                                    f" DEFAULT {1 if col.default.arg else 0}"
-                                )
-                            else:
-                                default_value = f" DEFAULT {col.default.arg}"
-
-                        # Construct and execute ALTER TABLE statement
-                        alter_stmt = f"""
-                            ALTER TABLE {table_name} 
-                            ADD COLUMN {col_name} {col_type}{default_value}
-                        """
-                        try:
-                            conn.execute(alter_stmt)
-                            conn.commit()
-                            print(f"Successfully added column {col_name}")
-                        except Exception as e:
-                            print(f"Error adding column {col_name}: {e}")
-                            continue
-
-        print("\nSchema update complete")
-
-    except Exception as e:
-        print(f"Error in schema update: {e}")
-        raise
-
-
 def init_db(fresh=False):
-    """Main initialization function"""
+    """Create the database or apply pending migrations, see migrations.py"""
+    from .migrations import migrate
+
     if fresh:
         create_fresh_db()
     else:
-        update_schema()
+        migrate(engine)
 
 
 def get_db():
@@ -267,58 +355,31 @@ def get_db_session():
 
 
 def initialize_company_and_patent():
+    """Stream patents and companies from DATA_DIR, resuming an interrupted ingest"""
+    from .ingest import DATA_DIR, ingest_patents, ingest_companies
+
     db = SessionLocal()
     try:
-        # Check if database is empty
-        if not db.query(Patent).first():
-            print("Database is empty, loading initial data...")
-
-            # Load patents
-            patents_file = Path("/app/data/patents.json")
-            if patents_file.exists():
-                with open(patents_file, "r") as f:
-                    patents = json.load(f)
-                    print(f"Found {len(patents)} patents to insert")
-                    for patent in patents:
-                        try:
-                            db_patent = Patent(**patent)
-                            db.add(db_patent)
-                        except Exception as e:
-                            print(f"Error inserting patent: {e}")
-                            print(f"Patent data: {patent}")
-                            raise e
-                db.commit()
-                print("Patents data loaded successfully")
-            else:
-                print("Patents file not found")
-
-            # Load companies and products
-            if not db.query(Company).first():
-                products_file = Path("/app/data/company_products.json")
-                if products_file.exists():
-                    with open(products_file, "r") as f:
-                        companies_list = json.load(f).get("companies")
-                        print(f"Found {len(companies_list)} companies to insert")
-                        for company_data in companies_list:
-                            company_name = company_data.get("name")
-                            product_list = company_data.get("products")
-
-                            company = Company(name=company_name)
-                            db.add(company)
-                            db.flush()
-
-                            for product_data in product_list:
-                                product = Product(
-                                    name=product_data["name"],
-                                    description=product_data.get("description"),
-                                    company_id=company.company_id,
-                                )
-                                db.add(product)
-                    db.commit()
-                    print("Companies and products loaded successfully")
-                else:
-                    print("Company products file not found")
-        else:
-            print("Database already contains data, skipping initialization")
+        has_data = db.query(Patent).first() is not None
+        has_checkpoint = db.query(IngestCheckpoint).first() is not None
     finally:
         db.close()
+
+    # Databases loaded before checkpoints existed are left alone
+    if has_data and not has_checkpoint:
+        print("Database already contains data, skipping initialization")
+        return
+
+    patents_file = DATA_DIR / "patents.json"
+    if patents_file.exists():
+        ingest_patents(patents_file)
+        print("Patents data loaded successfully")
+    else:
+        print("Patents file not found")
+
+    products_file = DATA_DIR / "company_products.json"
+    if products_file.exists():
+        ingest_companies(products_file)
+        print("Companies and products loaded successfully")
+    else:
+        print("Company products file not found")
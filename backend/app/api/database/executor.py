@@ -0,0 +1,69 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .storage import WAL_PROFILE
+
+# Threads that run blocking SQLAlchemy work for the async resolvers
+DB_THREAD_POOL_SIZE = int(os.getenv("DB_THREAD_POOL_SIZE", "8"))
+
+db_executor = ThreadPoolExecutor(
+    max_workers=DB_THREAD_POOL_SIZE, thread_name_prefix="db"
+)
+# Analysis commits queue on one thread instead of contending for SQLite's
+# write lock, the default storage profile keeps them on the shared pool
+WRITER_THREAD_PREFIX = "db-writer"
+db_writer = (
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix=WRITER_THREAD_PREFIX)
+    if WAL_PROFILE
+    else db_executor
+)
+
+
+async def run_in_db(fn, *args, **kwargs):
+    """
+    Run blocking database work on the bounded DB thread pool
+
+    Context variables of the caller are visible inside fn. A Session must
+    not be used by two calls at the same time, see Context.run_db.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        db_executor, functools.partial(context.run, fn, *args, **kwargs)
+    )
+
+
+def call_in_writer(fn, *args, **kwargs):
+    """
+    run_in_writer for blocking code, waits for fn on the writer thread
+
+    Runs fn inline on the writer thread itself and with the default storage
+    profile, where waiting on the shared pool from one of its threads could
+    deadlock.
+    """
+    if db_writer is db_executor or threading.current_thread().name.startswith(
+        WRITER_THREAD_PREFIX
+    ):
+        return fn(*args, **kwargs)
+    context = contextvars.copy_context()
+    return db_writer.submit(
+        functools.partial(context.run, fn, *args, **kwargs)
+    ).result()
+
+
+async def run_in_writer(fn, *args, **kwargs):
+    """
+    Run database work that commits on the single writer thread
+
+    Writes are serialized in submission order, a long read on db_executor
+    never delays them and two commits never wait on each other's lock.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        db_writer, functools.partial(context.run, fn, *args, **kwargs)
+    )
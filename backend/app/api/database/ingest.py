@@ -0,0 +1,363 @@
+import json
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import DataError, IntegrityError
+
+from .database import (
+    engine,
+    Patent,
+    Claim,
+    ClaimDependency,
+    Company,
+    Product,
+    IngestCheckpoint,
+)
+from .claim_graph import build_claim_graph
+
+DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data"))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))
+READ_CHUNK_SIZE = 1 << 16
+# Errors caused by a record's content, which skip the record. Anything else,
+# such as a locked database or a full disk, stops the ingest without moving
+# the checkpoint so a resume retries the batch
+RECORD_ERRORS = (IntegrityError, DataError, KeyError, ValueError, TypeError)
+
+ClaimRecord = namedtuple("ClaimRecord", ["claim_id", "num", "text"])
+
+
+def iter_json_array(path, key: str = None) -> Iterator[dict]:
+    """
+    Yield the items of a JSON array one at a time without loading the file
+
+    Input:
+    path: str or Path
+    key: str, name of a top level field holding the array, default is the
+         document itself being an array
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = ""
+        position = 0
+        eof = False
+
+        def read_more(size=READ_CHUNK_SIZE) -> bool:
+            nonlocal buffer, position, eof
+            chunk = f.read(size)
+            if not chunk:
+                eof = True
+                return False
+            buffer = buffer[position:] + chunk
+            position = 0
+            return True
+
+        # Find the opening bracket of the array
+        marker = f'"{key}"' if key else "["
+        while True:
+            index = buffer.find(marker, position)
+            if index >= 0:
+                position = index + len(marker)
+                break
+            position = max(0, len(buffer) - len(marker))
+            if not read_more():
+                raise ValueError(f"No JSON array found in {path}")
+        if key:
+            while True:
+                index = buffer.find("[", position)
+                if index >= 0:
+                    position = index + 1
+                    break
+                position = len(buffer)
+                if not read_more():
+                    raise ValueError(f"No JSON array for {key} in {path}")
+
+        read_size = READ_CHUNK_SIZE
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position >= len(buffer):
+                if not read_more():
+                    raise ValueError(f"Unterminated JSON array in {path}")
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Item not fully buffered yet, read geometrically larger chunks
+                if eof or not read_more(read_size):
+                    raise
+                read_size *= 2
+                continue
+            read_size = READ_CHUNK_SIZE
+            position = end
+            yield item
+
+
+def _batches(items: Iterator, batch_size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _next_id(connection, column) -> int:
+    return (connection.execute(select(func.max(column))).scalar() or 0) + 1
+
+
+def _load_checkpoint(connection, source: str) -> Dict:
+    row = connection.execute(
+        select(IngestCheckpoint.records_done, IngestCheckpoint.completed).where(
+            IngestCheckpoint.source == source
+        )
+    ).first()
+    if row is None:
+        return {"records_done": 0, "completed": False}
+    return {"records_done": row[0], "completed": bool(row[1])}
+
+
+def _save_checkpoint(connection, source: str, records_done: int, completed=False):
+    table = IngestCheckpoint.__table__
+    values = {
+        "records_done": records_done,
+        "completed": completed,
+        "updated_at": datetime.now().isoformat(),
+    }
+    updated = connection.execute(
+        table.update().where(table.c.source == source).values(**values)
+    ).rowcount
+    if not updated:
+        connection.execute(table.insert().values(source=source, **values))
+
+
+class _ProgressReporter:
+    """Prints records/second after every committed batch"""
+
+    def __init__(self, label: str, report: Callable = print):
+        self.label = label
+        self.report = report
+        self.started = time.monotonic()
+        self.records = 0
+        self.skipped = 0
+
+    def update(self, records: int, skipped: int, records_done: int):
+        self.records += records
+        self.skipped += skipped
+        elapsed = time.monotonic() - self.started
+        rate = self.records / elapsed if elapsed else 0.0
+        self.report(
+            f"{self.label}: {records_done} records done, "
+            f"{rate:.0f} records/s, {self.skipped} skipped"
+        )
+
+
+def _patent_rows(
+    records: List[dict], patent_id: int, claim_id: int, report: Callable = print
+):
+    """
+    Build insert rows for a batch of raw patent records
+
+    Returns (patent rows, claim rows, dependency rows, skipped count)
+    """
+    columns = Patent.__table__.columns.keys()
+    patent_rows, claim_rows, dependency_rows = [], [], []
+    skipped = 0
+    for record in records:
+        try:
+            fields, claims_data = Patent.split_record(record)
+            claims = [
+                ClaimRecord(claim_id + i, str(claim["num"]), claim["text"])
+                for i, claim in enumerate(claims_data)
+            ]
+            graph = build_claim_graph(claims)
+        except RECORD_ERRORS as e:
+            report(f"Skipping patent {record.get('publication_number')}: {e}")
+            skipped += 1
+            continue
+
+        # executemany needs every row to carry the same keys
+        row = {column: fields.get(column) for column in columns}
+        row["patent_id"] = patent_id
+        patent_rows.append(row)
+        claim_rows.extend(
+            {
+                "claim_id": claim.claim_id,
+                "num": claim.num,
+                "text": claim.text,
+                "patent_id": patent_id,
+            }
+            for claim in claims
+        )
+        dependency_rows.extend(
+            {
+                "patent_id": patent_id,
+                "claim_id": edge["claim"].claim_id,
+                "parent_claim_id": edge["parent"].claim_id if edge["parent"] else None,
+                "root_claim_id": edge["root"].claim_id,
+                "depth": edge["depth"],
+            }
+            for edge in graph
+        )
+        patent_id += 1
+        claim_id += len(claims)
+    return patent_rows, claim_rows, dependency_rows, skipped
+
+
+def _insert_patents(connection, records: List[dict], report: Callable = print) -> int:
+    """Insert a batch of patents with claims and claim graph, returns skipped count"""
+    patent_rows, claim_rows, dependency_rows, skipped = _patent_rows(
+        records,
+        _next_id(connection, Patent.patent_id),
+        _next_id(connection, Claim.claim_id),
+        report,
+    )
+    # Claims go in before their patents so the full-text trigger on patents
+    # indexes all claim text at once instead of once per claim
+    if claim_rows:
+        connection.execute(Claim.__table__.insert(), claim_rows)
+    if patent_rows:
+        connection.execute(Patent.__table__.insert(), patent_rows)
+    if dependency_rows:
+        connection.execute(ClaimDependency.__table__.insert(), dependency_rows)
+    return skipped
+
+
+def _insert_companies(connection, records: List[dict], report: Callable = print) -> int:
+    """Insert a batch of companies with their products, returns skipped count"""
+    company_id = _next_id(connection, Company.company_id)
+    company_rows, product_rows = [], []
+    skipped = 0
+    for record in records:
+        name = record.get("name")
+        if not name:
+            skipped += 1
+            continue
+        company_rows.append({"company_id": company_id, "name": name})
+        product_rows.extend(
+            {
+                "name": product["name"],
+                "description": product.get("description"),
+                "company_id": company_id,
+            }
+            for product in record.get("products") or []
+        )
+        company_id += 1
+    if company_rows:
+        connection.execute(Company.__table__.insert(), company_rows)
+    if product_rows:
+        connection.execute(Product.__table__.insert(), product_rows)
+    return skipped
+
+
+def _ingest(
+    source: str,
+    records: Iterator[dict],
+    insert_batch: Callable,
+    batch_size: int,
+    resume: bool,
+    report: Callable,
+) -> Dict:
+    """
+    Insert records in batches, committing each batch with its checkpoint
+
+    A batch that fails on a record's content is retried one record at a time
+    so a bad record only costs itself. Other errors are raised with the
+    checkpoint left before the batch.
+    """
+    with engine.begin() as connection:
+        checkpoint = _load_checkpoint(connection, source)
+    if checkpoint["completed"] and resume:
+        report(f"{source}: already ingested, skipping")
+        return {"records_done": checkpoint["records_done"], "skipped": 0}
+
+    records_done = checkpoint["records_done"] if resume else 0
+    if records_done:
+        report(f"{source}: resuming after {records_done} records")
+
+    progress = _ProgressReporter(source, report)
+    for index, batch in enumerate(_batches(records, batch_size)):
+        if (index + 1) * batch_size <= records_done:
+            continue
+        batch = batch[max(0, records_done - index * batch_size) :]
+        try:
+            with engine.begin() as connection:
+                skipped = insert_batch(connection, batch, report)
+                _save_checkpoint(connection, source, records_done + len(batch))
+        except RECORD_ERRORS as e:
+            report(f"{source}: batch failed ({e}), retrying record by record")
+            skipped = 0
+            for position, record in enumerate(batch, start=1):
+                try:
+                    with engine.begin() as connection:
+                        skipped += insert_batch(connection, [record], report)
+                        _save_checkpoint(connection, source, records_done + position)
+                except RECORD_ERRORS as record_error:
+                    report(f"Skipping bad record in {source}: {record_error}")
+                    skipped += 1
+                    with engine.begin() as connection:
+                        _save_checkpoint(connection, source, records_done + position)
+        records_done += len(batch)
+        progress.update(len(batch), skipped, records_done)
+
+    with engine.begin() as connection:
+        _save_checkpoint(connection, source, records_done, completed=True)
+    return {"records_done": records_done, "skipped": progress.skipped}
+
+
+def ingest_patents(
+    path=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    resume: bool = True,
+    report: Callable = print,
+) -> Dict:
+    """
+    Stream patents.json into the database in bounded memory
+
+    Input:
+    path: str or Path, default is DATA_DIR/patents.json
+    batch_size: int, records per insert batch and commit, default is INGEST_BATCH_SIZE
+    resume: bool, continue after the last committed batch, default is True
+    report: Callable, receives progress lines, default is print
+
+    Returns a dict with records_done and skipped counts
+    """
+    path = Path(path or DATA_DIR / "patents.json")
+    return _ingest(
+        f"patents:{path.name}",
+        iter_json_array(path),
+        _insert_patents,
+        batch_size,
+        resume,
+        report,
+    )
+
+
+def ingest_companies(
+    path=None,
+    batch_size: int = INGEST_BATCH_SIZE,
+    resume: bool = True,
+    report: Callable = print,
+) -> Dict:
+    """
+    Stream the companies array of company_products.json into the database
+
+    Input and return value are the same as ingest_patents
+    """
+    path = Path(path or DATA_DIR / "company_products.json")
+    return _ingest(
+        f"companies:{path.name}",
+        iter_json_array(path, key="companies"),
+        _insert_companies,
+        batch_size,
+        resume,
+        report,
+    )
@@ -0,0 +1,267 @@
+import logging
+import os
+import time
+from collections import namedtuple
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import Boolean
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from .database import (
+    AnalysisJob,
+    Base,
+    Claim,
+    ClaimDependency,
+    CompanyPatentAnalysis,
+    Patent,
+    ProductPatentAnalysis,
+    SchemaVersion,
+)
+from .claim_graph import store_claim_dependencies
+
+logger = logging.getLogger(__name__)
+
+# Rows per transaction when a migration backfills a table, each batch
+# commits so readers and the analysis writer are never locked out for long
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "500"))
+
+Migration = namedtuple("Migration", ["version", "name", "upgrade"])
+
+MIGRATIONS: List[Migration] = []
+
+
+def migration(version: int, name: str):
+    """
+    Register upgrade(engine) as a schema migration
+
+    Versions are applied in ascending order and recorded in schema_version.
+    A migration must be safe to run again, for two workers starting at once
+    or a run interrupted between its work and its schema_version row.
+    """
+
+    def register(upgrade: Callable):
+        MIGRATIONS.append(Migration(version, name, upgrade))
+        MIGRATIONS.sort(key=lambda item: item.version)
+        return upgrade
+
+    return register
+
+
+def _column_ddl(column) -> str:
+    column_type = "BOOLEAN" if isinstance(column.type, Boolean) else str(column.type)
+    default = ""
+    if column.default is not None and not callable(column.default.arg):
+        value = column.default.arg
+        if isinstance(value, bool):
+            value = int(value)
+        elif isinstance(value, str):
+            value = "'" + value.replace("'", "''") + "'"
+        default = f" DEFAULT {value}"
+    return f"{column.name} {column_type}{default}"
+
+
+def add_missing_columns(engine, table) -> List[str]:
+    """Add columns of a model that its table lacks, returns their names"""
+    with engine.begin() as connection:
+        existing = {
+            row[1]
+            for row in connection.exec_driver_sql(f"PRAGMA table_info('{table.name}')")
+        }
+        added = []
+        for column in table.columns:
+            if column.name not in existing:
+                connection.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ADD COLUMN {_column_ddl(column)}"
+                )
+                added.append(column.name)
+    if added:
+        logger.info(f"Added {', '.join(added)} to {table.name}")
+    return added
+
+
+def create_index(engine, index):
+    """Create a model's index if it is missing, one transaction per index"""
+    started = time.perf_counter()
+    index.create(bind=engine, checkfirst=True)
+    logger.info(
+        f"Index {index.name} ready in {(time.perf_counter() - started) * 1000:.0f}ms"
+    )
+
+
+def backfill_in_batches(
+    engine, select_batch: Callable, apply_batch: Callable, label: str
+) -> int:
+    """
+    Backfill a table in keyset-ordered batches, one transaction per batch
+
+    Input:
+    engine: Engine the batches run on
+    select_batch: fn(session, after_key, limit) returning the next batch of
+                  keys in ascending order, after_key is None for the first
+    apply_batch: fn(session, keys) writing the rows of a batch
+    label: str, name used in the progress log
+
+    Returns the number of keys processed
+    """
+    after_key = None
+    done = 0
+    while True:
+        db = Session(bind=engine)
+        try:
+            keys = select_batch(db, after_key, MIGRATION_BATCH_SIZE)
+            if not keys:
+                break
+            apply_batch(db, keys)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        after_key = keys[-1]
+        done += len(keys)
+        logger.info(f"Backfilled {label}: {done} done")
+    return done
+
+
+@migration(1, "baseline")
+def baseline(engine):
+    """
+    Bring a database created before versioned migrations up to the models
+
+    Creates missing tables, adds missing columns and creates missing indexes,
+    as update_schema did on every start.
+    """
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        add_missing_columns(engine, table)
+        # Indexes declared on columns added above are not created by create_all
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+@migration(2, "analysis lookup indexes")
+def analysis_lookup_indexes(engine):
+    """Indexes for the saved analyses list and product analyses by company analysis"""
+    for table in (ProductPatentAnalysis.__table__, CompanyPatentAnalysis.__table__):
+        for index in table.indexes:
+            create_index(engine, index)
+
+
+@migration(3, "backfill claim dependencies")
+def backfill_claim_dependencies(engine):
+    """
+    Index the claim graph of patents ingested before claim_dependencies existed
+
+    load_claim_tree would otherwise build and commit it on first use.
+    """
+
+    def select_batch(db, after_patent_id, limit):
+        query = db.query(Patent.patent_id).filter(
+            ~db.query(ClaimDependency.claim_dependency_id)
+            .filter(ClaimDependency.patent_id == Patent.patent_id)
+            .exists()
+        )
+        if after_patent_id is not None:
+            query = query.filter(Patent.patent_id > after_patent_id)
+        return [row[0] for row in query.order_by(Patent.patent_id).limit(limit).all()]
+
+    def apply_batch(db, patent_ids):
+        claims_by_patent: Dict[int, list] = {}
+        for claim in db.query(Claim).filter(Claim.patent_id.in_(patent_ids)):
+            claims_by_patent.setdefault(claim.patent_id, []).append(claim)
+        for patent_id, claims in claims_by_patent.items():
+            store_claim_dependencies(db, patent_id, claims)
+
+    backfill_in_batches(engine, select_batch, apply_batch, "claim dependencies")
+
+
+@migration(4, "analysis job owner")
+def analysis_job_owner(engine):
+    """Owner and heartbeat of running jobs, so processes do not take over live jobs"""
+    add_missing_columns(engine, AnalysisJob.__table__)
+
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(connection) -> int:
+    """Highest applied migration, 0 for a database without schema_version"""
+    try:
+        version = connection.exec_driver_sql(
+            "SELECT max(version) FROM schema_version"
+        ).scalar()
+    except OperationalError:
+        return 0
+    return version or 0
+
+
+def _has_tables(connection) -> bool:
+    return (
+        connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patents'"
+        ).first()
+        is not None
+    )
+
+
+def _record(engine, item: Migration, duration_ms: int = None):
+    with engine.begin() as connection:
+        connection.execute(
+            SchemaVersion.__table__.insert().prefix_with("OR IGNORE"),
+            {
+                "version": item.version,
+                "name": item.name,
+                "applied_at": datetime.now().isoformat(),
+                "duration_ms": duration_ms,
+            },
+        )
+
+
+def migrate(engine) -> int:
+    """
+    Apply pending migrations, returns the schema version
+
+    When the schema is current this is a single query. An empty database is
+    created from the models and stamped with the latest version, since the
+    models already include every migration.
+    """
+    with engine.connect() as connection:
+        version = current_version(connection)
+        if version >= LATEST_VERSION:
+            return version
+        fresh = version == 0 and not _has_tables(connection)
+
+    if fresh:
+        Base.metadata.create_all(bind=engine)
+        for item in MIGRATIONS:
+            _record(engine, item)
+        logger.info(f"Created schema at version {LATEST_VERSION}")
+        return LATEST_VERSION
+
+    for item in MIGRATIONS:
+        if item.version <= version:
+            continue
+        logger.info(f"Applying migration {item.version}: {item.name}")
+        started = time.perf_counter()
+        item.upgrade(engine)
+        duration_ms = int((time.perf_counter() - started) * 1000)
+        _record(engine, item, duration_ms)
+        logger.info(f"Migration {item.version} applied in {duration_ms}ms")
+        version = item.version
+    return version
+
+
+def applied_migrations(engine) -> List[Dict]:
+    """Rows of schema_version, oldest first"""
+    with engine.connect() as connection:
+        if current_version(connection) == 0:
+            return []
+        return [
+            dict(row._mapping)
+            for row in connection.execute(
+                SchemaVersion.__table__.select().order_by(SchemaVersion.version)
+            )
+        ]
@@ -0,0 +1,206 @@
+import contextvars
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged as they finish
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+# The same statement shape this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "5"))
+# Add the request's SQL summary to GraphQL responses (extensions and X-SQL-Profile header)
+SQL_PROFILE_IN_RESPONSE = (
+    os.getenv("SQL_PROFILE_IN_RESPONSE", "false").lower() == "true"
+)
+# Statements kept per request, later ones are only counted
+MAX_PROFILED_STATEMENTS = 2000
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Statement with literals replaced by ? and IN lists collapsed, one line"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?...)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+@lru_cache(maxsize=2048)
+def sql_fingerprint(statement: str) -> str:
+    """Short stable hash of the normalized statement"""
+    return hashlib.sha1(normalize_sql(statement).encode("utf-8")).hexdigest()[:12]
+
+
+class StatementRecord:
+    __slots__ = ("fingerprint", "statement", "duration_ms", "rows")
+
+    def __init__(self, fingerprint: str, statement: str, duration_ms: float, rows):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.duration_ms = duration_ms
+        self.rows = rows
+
+
+class RequestProfile:
+    """
+    Statements executed while serving one request
+
+    Input:
+    name: str, request label used in log lines, e.g. the GraphQL operation name
+    """
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self.statements: List[StatementRecord] = []
+        self.statement_count = 0
+        self.total_ms = 0.0
+
+    def record(self, record: StatementRecord):
+        self.statement_count += 1
+        self.total_ms += record.duration_ms
+        if len(self.statements) < MAX_PROFILED_STATEMENTS:
+            self.statements.append(record)
+
+    def repeated_statements(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> List[Dict]:
+        """Statement shapes executed at least threshold times, most frequent first"""
+        groups = {}
+        for record in self.statements:
+            group = groups.setdefault(
+                record.fingerprint,
+                {
+                    "fingerprint": record.fingerprint,
+                    "sql": normalize_sql(record.statement),
+                    "count": 0,
+                    "total_ms": 0.0,
+                },
+            )
+            group["count"] += 1
+            group["total_ms"] += record.duration_ms
+        repeated = [group for group in groups.values() if group["count"] >= threshold]
+        for group in repeated:
+            group["total_ms"] = round(group["total_ms"], 3)
+        return sorted(repeated, key=lambda group: -group["count"])
+
+    def summary(self, slowest: int = 5) -> Dict:
+        return {
+            "statements": self.statement_count,
+            "total_ms": round(self.total_ms, 3),
+            "rows": sum(record.rows or 0 for record in self.statements),
+            "slowest": [
+                {
+                    "fingerprint": record.fingerprint,
+                    "sql": normalize_sql(record.statement),
+                    "duration_ms": round(record.duration_ms, 3),
+                    "rows": record.rows,
+                }
+                for record in sorted(
+                    self.statements, key=lambda record: -record.duration_ms
+                )[:slowest]
+            ],
+            "n_plus_one": self.repeated_statements(),
+        }
+
+    def header_value(self) -> str:
+        return (
+            f"statements={self.statement_count}; "
+            f"time_ms={self.total_ms:.1f}; "
+            f"n_plus_one={len(self.repeated_statements())}"
+        )
+
+
+# A mutable profile object, so DB pool threads running with a copy of the
+# request context record into the same profile
+_current_profile = contextvars.ContextVar("sql_profile", default=None)
+
+
+def current_profile() -> Optional[RequestProfile]:
+    return _current_profile.get()
+
+
+@contextmanager
+def profile_request(name: str = ""):
+    """Record the statements executed in the block, report likely N+1 patterns at the end"""
+    profile = RequestProfile(name)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+        for group in profile.repeated_statements():
+            logger.warning(
+                f"Possible N+1 in {name or 'request'}: {group['count']}x "
+                f"({group['total_ms']}ms) {group['sql'][:300]}"
+            )
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Adds fetched rows to the statement record, SELECT row counts are only known once fetched"""
+
+    record: Optional[StatementRecord] = None
+
+    def _count(self, rows):
+        if self.record is not None:
+            self.record.rows = (self.record.rows or 0) + len(rows)
+        return rows
+
+    def fetchone(self):
+        row = super().fetchone()
+        if row is not None and self.record is not None:
+            self.record.rows = (self.record.rows or 0) + 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        return self._count(super().fetchmany(*args, **kwargs))
+
+    def fetchall(self):
+        return self._count(super().fetchall())
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """sqlite3 connection factory handing out ProfilingCursor"""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration_ms = (time.perf_counter() - conn.info["query_started"].pop()) * 1000
+    # DML reports affected rows now, SELECT rows are counted by the cursor
+    rows = cursor.rowcount if cursor.rowcount >= 0 else None
+    record = StatementRecord(sql_fingerprint(statement), statement, duration_ms, rows)
+    if isinstance(cursor, ProfilingCursor):
+        cursor.record = record
+
+    profile = _current_profile.get()
+    if profile is not None:
+        profile.record(record)
+
+    if duration_ms >= SLOW_QUERY_MS:
+        logger.warning(
+            f"Slow SQL ({duration_ms:.1f}ms, {record.fingerprint}"
+            f"{f', {rows} rows' if rows is not None else ''}): "
+            f"{normalize_sql(statement)[:500]}"
+        )
+
+
+def handle_error(exception_context):
+    """Drop the start time of a statement that failed"""
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
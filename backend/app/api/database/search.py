@@ -0,0 +1,189 @@
+import re
+import logging
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+PATENT_SEARCH_TABLE = "patents_fts"
+
+# bm25() column weights for title, abstract, assignee, claims
+SEARCH_COLUMN_WEIGHTS = (10.0, 4.0, 2.0, 1.0)
+SNIPPET_OPEN = "<mark>"
+SNIPPET_CLOSE = "</mark>"
+SNIPPET_TOKENS = 12
+
+_CLAIMS_OF_PATENT = (
+    "(SELECT group_concat(text, ' ') FROM claims WHERE claims.patent_id = {})"
+)
+
+SEARCH_INDEX_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {PATENT_SEARCH_TABLE} USING fts5(
+        title, abstract, assignee, claims, tokenize = 'porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patents_fts_after_insert AFTER INSERT ON patents
+    BEGIN
+        INSERT INTO {PATENT_SEARCH_TABLE} (rowid, title, abstract, assignee, claims)
+        VALUES (new.patent_id, new.title, new.abstract, new.assignee,
+                {_CLAIMS_OF_PATENT.format("new.patent_id")});
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patents_fts_after_update
+    AFTER UPDATE OF title, abstract, assignee ON patents
+    BEGIN
+        UPDATE {PATENT_SEARCH_TABLE}
+        SET title = new.title, abstract = new.abstract, assignee = new.assignee
+        WHERE rowid = new.patent_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS patents_fts_after_delete AFTER DELETE ON patents
+    BEGIN
+        DELETE FROM {PATENT_SEARCH_TABLE} WHERE rowid = old.patent_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS claims_fts_after_insert AFTER INSERT ON claims
+    BEGIN
+        UPDATE {PATENT_SEARCH_TABLE}
+        SET claims = coalesce(claims || ' ', '') || new.text
+        WHERE rowid = new.patent_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS claims_fts_after_update
+    AFTER UPDATE OF text, patent_id ON claims
+    BEGIN
+        UPDATE {PATENT_SEARCH_TABLE}
+        SET claims = {_CLAIMS_OF_PATENT.format("old.patent_id")}
+        WHERE rowid = old.patent_id;
+        UPDATE {PATENT_SEARCH_TABLE}
+        SET claims = {_CLAIMS_OF_PATENT.format("new.patent_id")}
+        WHERE rowid = new.patent_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS claims_fts_after_delete AFTER DELETE ON claims
+    BEGIN
+        UPDATE {PATENT_SEARCH_TABLE}
+        SET claims = {_CLAIMS_OF_PATENT.format("old.patent_id")}
+        WHERE rowid = old.patent_id;
+    END
+    """,
+]
+
+
+def search_index_exists(connection) -> bool:
+    return (
+        connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": PATENT_SEARCH_TABLE},
+        ).first()
+        is not None
+    )
+
+
+def create_patent_search_index(target, connection, **kw):
+    """
+    Create the FTS5 table and the triggers that keep it in sync with
+    patents and claims. Populates the index when it did not exist yet.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    try:
+        existed = search_index_exists(connection)
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(text(statement))
+        if not existed:
+            rebuild_patent_search_index(connection)
+    except OperationalError as e:
+        # SQLite built without FTS5, searchPatents falls back to ILIKE
+        logger.warning(f"Patent full-text index unavailable: {e}")
+
+
+def drop_patent_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.execute(text(f"DROP TABLE IF EXISTS {PATENT_SEARCH_TABLE}"))
+
+
+def rebuild_patent_search_index(connection):
+    """Repopulate the full-text index from the patents and claims tables"""
+    connection.execute(text(f"DELETE FROM {PATENT_SEARCH_TABLE}"))
+    connection.execute(
+        text(
+            f"""
+            INSERT INTO {PATENT_SEARCH_TABLE} (rowid, title, abstract, assignee, claims)
+            SELECT patent_id, title, abstract, assignee,
+                   {_CLAIMS_OF_PATENT.format("patents.patent_id")}
+            FROM patents
+            """
+        )
+    )
+
+
+def _prefix_terms(value: str) -> str:
+    """Quote each word of user input as an FTS5 prefix term"""
+    return " ".join(f'"{token}"*' for token in re.findall(r"\w+", value or ""))
+
+
+def build_match_query(query: str, assignee: str = None) -> Optional[str]:
+    """Turn free text into an FTS5 MATCH expression, all words required"""
+    terms = _prefix_terms(query)
+    if not terms:
+        return None
+    assignee_terms = _prefix_terms(assignee)
+    if assignee_terms:
+        return f"({terms}) AND assignee : ({assignee_terms})"
+    return terms
+
+
+def search_patents(
+    db, query: str, assignee: str = None, limit: int = 10
+) -> Optional[List[Tuple[int, str]]]:
+    """
+    Full-text search over title, abstract, assignee and claims
+
+    Input:
+    db: Session
+    query: str, words are matched as prefixes
+    assignee: str, optional assignee filter
+    limit: int, default is 10
+
+    Returns a list of (patent_id, highlighted snippet) ranked by BM25, or
+    None when the full-text index is unavailable
+    """
+    match = build_match_query(query, assignee)
+    if not match:
+        return []
+    weights = ", ".join(str(weight) for weight in SEARCH_COLUMN_WEIGHTS)
+    try:
+        rows = db.execute(
+            text(
+                f"""
+                SELECT rowid,
+                       snippet({PATENT_SEARCH_TABLE}, -1, :open, :close, '…', :tokens)
+                FROM {PATENT_SEARCH_TABLE}
+                WHERE {PATENT_SEARCH_TABLE} MATCH :match
+                ORDER BY bm25({PATENT_SEARCH_TABLE}, {weights})
+                LIMIT :limit
+                """
+            ),
+            {
+                "open": SNIPPET_OPEN,
+                "close": SNIPPET_CLOSE,
+                "tokens": SNIPPET_TOKENS,
+                "match": match,
+                "limit": limit,
+            },
+        ).fetchall()
+    except OperationalError as e:
+        logger.warning(f"Full-text search failed, falling back to ILIKE: {e}")
+        return None
+    return [(row[0], row[1]) for row in rows]
@@ -0,0 +1,64 @@
+import logging
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+# "wal": WAL journal, the pragmas below, a read-only connection pool for
+# queries and one writer thread for analysis commits.
+# "default": SQLite's rollback journal and a single engine, as before.
+SQLITE_STORAGE_PROFILE = os.getenv("SQLITE_STORAGE_PROFILE", "wal").lower()
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 << 20)))
+# Negative values are KiB, -65536 is 64 MiB of page cache per connection
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+# Idle connections kept open per engine, reused connections keep their page cache
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+
+WAL_PROFILE = SQLITE_STORAGE_PROFILE == "wal"
+
+
+def is_file_database(url: str) -> bool:
+    return url.startswith("sqlite") and ":memory:" not in url and url != "sqlite://"
+
+
+def engine_options(url: str) -> dict:
+    """Extra create_engine arguments of the storage profile"""
+    if not (WAL_PROFILE and is_file_database(url)):
+        return {}
+    # Overflow is unbounded: sessions hold their connection across awaits and
+    # check out on db_executor, so a bounded pool can leave every DB thread
+    # waiting for a connection whose session is waiting for a thread
+    return {
+        "poolclass": QueuePool,
+        "pool_size": SQLITE_POOL_SIZE,
+        "max_overflow": -1,
+    }
+
+
+def _pragma_listener(read_only: bool):
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not read_only:
+                # Persistent in the database file, readers pick it up from there
+                cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+            cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+            cursor.execute(f"PRAGMA temp_store={SQLITE_TEMP_STORE}")
+            if read_only:
+                cursor.execute("PRAGMA query_only=ON")
+        finally:
+            cursor.close()
+
+    return on_connect
+
+
+def apply_profile(engine, read_only: bool = False):
+    """Run the profile's pragmas on every new connection of engine"""
+    if WAL_PROFILE and is_file_database(str(engine.url)):
+        event.listen(engine, "connect", _pragma_listener(read_only))
@@ -1,6 +1,9 @@
+import asyncio
 from typing import Optional
 from sqlalchemy.orm import Session
 from .. import database
+from ..database.executor import run_in_db, run_in_writer
+from .loaders import Loaders
 from dataclasses import dataclass
 
 
@@ -9,12 +12,48 @@ class Context:
     """Context class that can be safely serialized"""
 
     db: Session = None
+    read_only: bool = False
+    _loaders: Optional[Loaders] = None
+    _db_lock: Optional[asyncio.Lock] = None
 
     def get(self, *args, **kwargs):
         """Required by SQLAlchemyConnectionField - returns the database session
         regardless of arguments passed"""
         return self.db
 
+    async def run_db(self, fn, *args, **kwargs):
+        """Run fn(db, *args) on the DB thread pool, one call at a time per request
+        because resolvers of the same request share a single session. A
+        read-only session gives its connection back to the pool after each call"""
+        async with self._lock():
+            return await run_in_db(self._call, fn, *args, **kwargs)
+
+    async def run_write(self, fn, *args, **kwargs):
+        """run_db for resolvers that commit, on the single writer thread"""
+        async with self._lock():
+            return await run_in_writer(self._call, fn, *args, **kwargs)
+
+    def _lock(self) -> asyncio.Lock:
+        if self._db_lock is None:
+            self._db_lock = asyncio.Lock()
+        return self._db_lock
+
+    def _call(self, fn, *args, **kwargs):
+        try:
+            return fn(self.db, *args, **kwargs)
+        finally:
+            if self.read_only:
+                # Ends the read transaction, so the connection is not held
+                # while the request awaits other resolvers
+                self.db.commit()
+
+    @property
+    def loaders(self) -> Loaders:
+        """Request-scoped DataLoaders, created on first use"""
+        if self._loaders is None:
+            self._loaders = Loaders(self.run_db)
+        return self._loaders
+
 
 def get_context() -> Context:
     """Get context without dependency injection"""
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from graphql import DocumentNode, GraphQLError, GraphQLSchema, parse, validate
+
+from .. import metrics
+
+# Parsed and validated documents kept in memory, keyed by query hash
+DOCUMENT_CACHE_SIZE = int(os.getenv("GRAPHQL_DOCUMENT_CACHE_SIZE", "256"))
+# Query texts registered through automatic persisted queries
+PERSISTED_QUERY_CACHE_SIZE = int(os.getenv("PERSISTED_QUERY_CACHE_SIZE", "1000"))
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+class PersistedQueryError(Exception):
+    """
+    Request that cannot be served from the persisted query store
+
+    The message and code follow the Apollo automatic persisted queries
+    protocol, so clients know to resend the hash with the full query text.
+    """
+
+    def __init__(self, message: str, code: str):
+        super().__init__(message)
+        self.code = code
+
+    def to_dict(self):
+        return {"message": str(self), "extensions": {"code": self.code}}
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(query.encode("utf-8")).hexdigest()
+
+
+class _LRU:
+    """Thread-safe LRU mapping"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._items: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value):
+        if self.capacity <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DocumentCache:
+    """
+    Parsed and validated documents keyed by the sha256 of the query text
+
+    Validation errors are cached with the document, they only depend on the
+    query and the schema, which does not change while the process runs.
+
+    Input:
+    schema: GraphQLSchema documents are validated against
+    capacity: int, number of documents kept
+    """
+
+    def __init__(self, schema: GraphQLSchema, capacity: int = DOCUMENT_CACHE_SIZE):
+        self.schema = schema
+        self._documents = _LRU(capacity)
+
+    def get(
+        self, query: str, key: str = None
+    ) -> Tuple[Optional[DocumentNode], List[GraphQLError]]:
+        """Document and validation errors for query, document is None on syntax errors"""
+        key = key or query_hash(query)
+        cached = self._documents.get(key)
+        metrics.CACHE_LOOKUPS.inc(
+            cache="graphql_document", result="miss" if cached is None else "hit"
+        )
+        if cached is not None:
+            return cached
+
+        try:
+            document = parse(query)
+        except GraphQLError as e:
+            # Not cached, a client looping on a broken query should not evict good ones
+            return None, [e]
+        entry = (document, validate(self.schema, document))
+        self._documents.put(key, entry)
+        return entry
+
+    def clear(self):
+        self._documents.clear()
+
+
+class PersistedQueryStore:
+    """
+    Query texts by sha256 hash for automatic persisted queries
+
+    A client first sends only extensions.persistedQuery.sha256Hash. If the hash
+    is unknown it gets PersistedQueryNotFound and resends the hash together
+    with the query, which registers it for later requests.
+    """
+
+    def __init__(self, capacity: int = PERSISTED_QUERY_CACHE_SIZE):
+        self._queries = _LRU(capacity)
+
+    def resolve(
+        self, query: Optional[str], extensions: Optional[dict]
+    ) -> Tuple[str, str]:
+        """
+        Query text and its hash for a request body
+
+        Input:
+        query: str, query text, None when the client sends only the hash
+        extensions: dict, the request's extensions field
+        Output:
+        tuple of query text and sha256 hash
+        """
+        persisted = (extensions or {}).get("persistedQuery")
+        if not persisted:
+            if not query:
+                raise PersistedQueryError("Must provide query string", "BAD_REQUEST")
+            return query, query_hash(query)
+
+        if persisted.get("version", 1) != 1:
+            raise PersistedQueryError(
+                "Unsupported persisted query version", "PERSISTED_QUERY_NOT_SUPPORTED"
+            )
+        sha256_hash = str(persisted.get("sha256Hash") or "").lower()
+        if not sha256_hash:
+            raise PersistedQueryError("Missing sha256Hash", "BAD_REQUEST")
+
+        if query:
+            if query_hash(query) != sha256_hash:
+                raise PersistedQueryError(
+                    "provided sha does not match query", "BAD_REQUEST"
+                )
+            self._queries.put(sha256_hash, query)
+            return query, sha256_hash
+
+        stored = self._queries.get(sha256_hash)
+        metrics.CACHE_LOOKUPS.inc(
+            cache="persisted_query", result="miss" if stored is None else "hit"
+        )
+        if stored is None:
+            raise PersistedQueryError(
+                PERSISTED_QUERY_NOT_FOUND, "PERSISTED_QUERY_NOT_FOUND"
+            )
+        return stored, sha256_hash
+
+    def clear(self):
+        self._queries.clear()
+
+
+persisted_queries = PersistedQueryStore()
@@ -0,0 +1,120 @@
+from collections import defaultdict
+from typing import Callable, Iterable, List
+
+from aiodataloader import DataLoader
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+from ..database import database
+
+
+class ModelLoader(DataLoader):
+    """Loads rows of a model by key with one IN (...) query per batch"""
+
+    def __init__(self, run_db: Callable, model, key_column):
+        super().__init__()
+        self.run_db = run_db
+        self.model = model
+        self.key_column = key_column
+
+    def query(self, db, keys: List) -> List:
+        return db.query(self.model).filter(self.key_column.in_(keys)).all()
+
+    async def batch_load_fn(self, keys: List) -> List:
+        rows = await self.run_db(self.query, keys)
+        by_key = {getattr(row, self.key_column.key): row for row in rows}
+        return [by_key.get(key) for key in keys]
+
+
+class ProjectedModelLoader(ModelLoader):
+    """
+    ModelLoader loading only the columns the query selects, see load_columns
+
+    Keys are (key, columns) pairs. One query per batch loads the union of the
+    columns asked for, every other column, including the heavy text columns
+    deferred on the model, stays deferred.
+    """
+
+    def load_columns(self, key, columns: Iterable[str]):
+        return self.load((key, tuple(sorted(columns))))
+
+    def query(self, db, keys: List) -> List:
+        columns = {column.key for column in inspect(self.model).primary_key}
+        for _, selected in keys:
+            columns.update(selected)
+        return (
+            db.query(self.model)
+            .options(
+                load_only(*[getattr(self.model, name) for name in sorted(columns)])
+            )
+            .filter(self.key_column.in_(list(dict.fromkeys(key for key, _ in keys))))
+            .all()
+        )
+
+    async def batch_load_fn(self, keys: List) -> List:
+        rows = await self.run_db(self.query, keys)
+        by_key = {getattr(row, self.key_column.key): row for row in rows}
+        return [by_key.get(key) for key, _ in keys]
+
+
+class ForeignKeyLoader(DataLoader):
+    """Loads the rows referencing each key, grouped into one list per key"""
+
+    def __init__(self, run_db: Callable, model, foreign_key_column, order_by=None):
+        super().__init__()
+        self.run_db = run_db
+        self.model = model
+        self.foreign_key_column = foreign_key_column
+        self.order_by = order_by
+
+    def query(self, db, keys: List) -> List:
+        query = db.query(self.model).filter(self.foreign_key_column.in_(keys))
+        if self.order_by is not None:
+            query = query.order_by(self.order_by)
+        return query.all()
+
+    async def batch_load_fn(self, keys: List) -> List[List]:
+        grouped = defaultdict(list)
+        for row in await self.run_db(self.query, keys):
+            grouped[getattr(row, self.foreign_key_column.key)].append(row)
+        return [grouped.get(key, []) for key in keys]
+
+
+class Loaders:
+    """DataLoaders of one GraphQL request, they share the request's session
+
+    run_db runs a function with that session on the DB thread pool"""
+
+    def __init__(self, run_db: Callable):
+        self.company = ModelLoader(
+            run_db, database.Company, database.Company.company_id
+        )
+        self.product = ModelLoader(
+            run_db, database.Product, database.Product.product_id
+        )
+        self.patent = ProjectedModelLoader(
+            run_db, database.Patent, database.Patent.patent_id
+        )
+        self.company_analysis = ModelLoader(
+            run_db,
+            database.CompanyPatentAnalysis,
+            database.CompanyPatentAnalysis.company_analysis_id,
+        )
+        self.products_by_company = ForeignKeyLoader(
+            run_db,
+            database.Product,
+            database.Product.company_id,
+            order_by=database.Product.product_id,
+        )
+        self.product_analyses_by_company_analysis = ForeignKeyLoader(
+            run_db,
+            database.ProductPatentAnalysis,
+            database.ProductPatentAnalysis.company_analysis_id,
+            order_by=database.ProductPatentAnalysis.created_at,
+        )
+        self.jobs_by_batch = ForeignKeyLoader(
+            run_db,
+            database.AnalysisJob,
+            database.AnalysisJob.batch_id,
+            order_by=database.AnalysisJob.created_at,
+        )
@@ -1,6 +1,12 @@
 import graphene
 from datetime import datetime
-from .types import ValidationResult, ProductAnalysisResult, CompanyPatentAnalysis
+from .types import (
+    ValidationResult,
+    ProductAnalysisResult,
+    CompanyPatentAnalysis,
+    AnalysisJob,
+    AnalysisBatch,
+)
 from ..database import database
 
 import logging
@@ -9,14 +15,30 @@ from ..analysis import (
     analyze_company_against_patent,
     analyze_patent_with_single_product,
 )
+from ..jobs import job_queue
 import json
 
 logger = logging.getLogger(__name__)
 
 
+def find_patent_and_product(db, publication_number, product_name):
+    """Look up a patent by publication number and a product by name"""
+    patent = (
+        db.query(database.Patent)
+        .filter(database.Patent.publication_number == publication_number)
+        .first()
+    )
+    product = (
+        db.query(database.Product).filter(database.Product.name == product_name).first()
+    )
+    return patent, product
+
+
 class AnalyzeCompanyAgainstPatentInput(graphene.InputObjectType):
     patent_publication_number = graphene.String(required=True)
     company_name = graphene.String(required=True)
+    top_n = graphene.Int(default_value=2)
+    force = graphene.Boolean(default_value=False)
 
 
 class AnalyzeProductAgainstPatentInput(graphene.InputObjectType):
@@ -24,6 +46,13 @@ class AnalyzeProductAgainstPatentInput(graphene.InputObjectType):
     product_name = graphene.String(required=True)
 
 
+class AnalyzePortfolioInput(graphene.InputObjectType):
+    patent_publication_numbers = graphene.List(graphene.String, required=True)
+    company_names = graphene.List(graphene.String, required=True)
+    top_n = graphene.Int(default_value=2)
+    force = graphene.Boolean(default_value=False)
+
+
 class ValidateInput(graphene.InputObjectType):
     patent_id = graphene.String(required=True)
     product_name = graphene.String(required=True)
@@ -37,18 +66,8 @@ class Mutation(graphene.ObjectType):
     async def resolve_analyze_product_patent(self, info, input):
         try:
             logger.info(f"Starting analysis for {input.patent_id}")
-            db = info.context.db
-
-            patent = (
-                db.query(database.Patent)
-                .filter(database.Patent.publication_number == input.patent_id)
-                .first()
-            )
-
-            product = (
-                db.query(database.Product)
-                .filter(database.Product.name == input.product_name)
-                .first()
+            patent, product = await info.context.run_db(
+                find_patent_and_product, input.patent_id, input.product_name
             )
 
             if not patent or not product:
@@ -96,28 +115,30 @@ class Mutation(graphene.ObjectType):
     ):
         try:
             logger.info(f"Starting analysis for {input.patent_publication_number}")
-            db = info.context.db
 
-            patent = (
-                db.query(database.Patent)
-                .filter(
-                    database.Patent.publication_number
-                    == input.patent_publication_number
+            def find_patent_and_company(db):
+                patent = (
+                    db.query(database.Patent)
+                    .filter(
+                        database.Patent.publication_number
+                        == input.patent_publication_number
+                    )
+                    .first()
                 )
-                .first()
-            )
+                company = (
+                    db.query(database.Company)
+                    .filter(database.Company.name == input.company_name)
+                    .first()
+                )
+                return patent, company
 
-            company = (
-                db.query(database.Company)
-                .filter(database.Company.name == input.company_name)
-                .first()
-            )
+            patent, company = await info.context.run_db(find_patent_and_company)
 
             if not patent or not company:
                 raise Exception("Patent or company not found")
 
             company_patent_analysis = await analyze_company_against_patent(
-                company, patent, top_n=2
+                company, patent, top_n=input.top_n, force=input.force
             )
 
             return company_patent_analysis
@@ -127,28 +148,97 @@ class Mutation(graphene.ObjectType):
             logger.error(traceback.format_exc())
             raise
 
+    enqueue_company_analysis = graphene.Field(
+        AnalysisJob, input=AnalyzeCompanyAgainstPatentInput(required=True)
+    )
+
+    async def resolve_enqueue_company_analysis(
+        self, info, input: AnalyzeCompanyAgainstPatentInput
+    ):
+        """Queue a company analysis and return its job right away"""
+        try:
+            logger.info(f"Queueing analysis for {input.patent_publication_number}")
+
+            def inputs_exist(db):
+                return (
+                    db.query(database.Patent.patent_id)
+                    .filter(
+                        database.Patent.publication_number
+                        == input.patent_publication_number
+                    )
+                    .first()
+                    is not None
+                    and db.query(database.Company.company_id)
+                    .filter(database.Company.name == input.company_name)
+                    .first()
+                    is not None
+                )
+
+            if not await info.context.run_db(inputs_exist):
+                raise Exception("Patent or company not found")
+
+            return await job_queue.enqueue(
+                input.patent_publication_number,
+                input.company_name,
+                top_n=input.top_n,
+                force=input.force,
+            )
+
+        except Exception as e:
+            logger.error(f"Error queueing analysis: {e}")
+            logger.error(traceback.format_exc())
+            raise
+
+    analyze_portfolio = graphene.Field(
+        AnalysisBatch, input=AnalyzePortfolioInput(required=True)
+    )
+
+    async def resolve_analyze_portfolio(self, info, input: AnalyzePortfolioInput):
+        """Queue every (patent, company) pair of the input as one batch"""
+        try:
+            logger.info(
+                f"Queueing portfolio of {len(input.patent_publication_numbers)} patents "
+                f"and {len(input.company_names)} companies"
+            )
+            return await job_queue.enqueue_batch(
+                input.patent_publication_numbers,
+                input.company_names,
+                top_n=input.top_n,
+                force=input.force,
+            )
+
+        except Exception as e:
+            logger.error(f"Error queueing portfolio analysis: {e}")
+            logger.error(traceback.format_exc())
+            raise
+
+    cancel_job = graphene.Field(AnalysisJob, job_id=graphene.String(required=True))
+
+    async def resolve_cancel_job(self, info, job_id):
+        try:
+            job = await job_queue.cancel(job_id)
+            if not job:
+                raise Exception("Job not found")
+            return job
+
+        except Exception as e:
+            logger.error(f"Error cancelling job: {e}")
+            logger.error(traceback.format_exc())
+            raise
+
     validate_inputs = graphene.Field(
         ValidationResult, input=ValidateInput(required=True)
     )
 
-    def resolve_validate_inputs(self, info, input):
+    async def resolve_validate_inputs(self, info, input):
         try:
             logger.info(f"Starting validation for {input.patent_id}")
-            db = info.context.db
-            if not db:
+            if not info.context.db:
                 logger.error("No database session in context")
                 raise Exception("Database session not available")
 
-            patent = (
-                db.query(database.Patent)
-                .filter(database.Patent.publication_number == input.patent_id)
-                .first()
-            )
-
-            product = (
-                db.query(database.Product)
-                .filter(database.Product.name == input.product_name)
-                .first()
+            patent, product = await info.context.run_db(
+                find_patent_and_product, input.patent_id, input.product_name
             )
 
             if not patent:
@@ -193,29 +283,33 @@ class Mutation(graphene.ObjectType):
         is_saved=graphene.Boolean(required=True),
     )
 
-    def resolve_toggle_save_analysis(self, info, company_analysis_id, is_saved):
+    async def resolve_toggle_save_analysis(self, info, company_analysis_id, is_saved):
         try:
-            db = info.context.db
-            analysis = (
-                db.query(database.CompanyPatentAnalysis)
-                .filter(
-                    database.CompanyPatentAnalysis.company_analysis_id
-                    == company_analysis_id
+
+            def toggle_save(db):
+                analysis = (
+                    db.query(database.CompanyPatentAnalysis)
+                    .filter(
+                        database.CompanyPatentAnalysis.company_analysis_id
+                        == company_analysis_id
+                    )
+                    .first()
                 )
-                .first()
-            )
 
-            if not analysis:
-                raise Exception("Analysis not found")
+                if not analysis:
+                    raise Exception("Analysis not found")
+
+                analysis.is_saved = is_saved
+                if is_saved:
+                    analysis.is_saved_at = datetime.now().isoformat()
+                else:
+                    analysis.is_saved_at = None
 
-            analysis.is_saved = is_saved
-            if is_saved:
-                analysis.is_saved_at = datetime.now().isoformat()
-            else:
-                analysis.is_saved_at = None
+                db.commit()
+                db.refresh(analysis)
+                return analysis
 
-            db.commit()
-            return analysis
+            return await info.context.run_write(toggle_save)
 
         except Exception as e:
             logger.error(f"Error toggling save status: {e}")
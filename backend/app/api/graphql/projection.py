@@ -0,0 +1,52 @@
+from typing import Set
+
+from graphene.utils.str_converters import to_camel_case
+from graphql import FieldNode, FragmentSpreadNode, InlineFragmentNode
+from sqlalchemy import inspect
+from sqlalchemy.orm import load_only
+
+
+def selected_fields(info) -> Set[str]:
+    """GraphQL names of the fields selected directly under the resolved field"""
+    names = set()
+
+    def collect(selection_set):
+        for selection in selection_set.selections:
+            if isinstance(selection, FieldNode):
+                names.add(selection.name.value)
+            elif isinstance(selection, InlineFragmentNode):
+                collect(selection.selection_set)
+            elif isinstance(selection, FragmentSpreadNode):
+                collect(info.fragments[selection.name.value].selection_set)
+
+    for field_node in info.field_nodes:
+        if field_node.selection_set:
+            collect(field_node.selection_set)
+    return names
+
+
+def selected_columns(info, object_type) -> Set[str]:
+    """Model column attributes backing the selected fields of a SQLAlchemyObjectType"""
+    model = object_type._meta.model
+    columns = {column.key for column in inspect(model).column_attrs}
+    attributes = {to_camel_case(name): name for name in object_type._meta.fields}
+    return {
+        attributes[name]
+        for name in selected_fields(info)
+        if attributes.get(name) in columns
+    }
+
+
+def column_projection(info, object_type):
+    """
+    Loader option that loads only the columns the query asks for
+
+    Every other column, including the heavy text columns deferred on the
+    model, stays deferred. The primary key is always loaded.
+    """
+    model = object_type._meta.model
+    columns = selected_columns(info, object_type)
+    primary_key = [column.key for column in inspect(model).primary_key]
+    return load_only(
+        *[getattr(model, name) for name in sorted(columns | set(primary_key))]
+    )
@@ -1,6 +1,16 @@
 import graphene
-from .types import Patent, Company, CompanyPatentAnalysis
-from ..database import database
+from .types import (
+    Patent,
+    Company,
+    CompanyPatentAnalysis,
+    ProductRelevanceEstimate,
+    AnalysisJob,
+    AnalysisBatch,
+)
+from ..database import database, search
+from .projection import column_projection
+from ..analysis import base_claim_analyze_company_products
+from ..database.claim_graph import load_claim_tree
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,12 +25,13 @@ class Query(graphene.ObjectType):
         limit=graphene.Int(default_value=10),
     )
 
-    def resolve_patent(self, info, publication_number):
+    async def resolve_patent(self, info, publication_number):
         try:
             logger.info(f"Resolving patent: {publication_number}")
-            db = info.context.db
-            return (
-                db.query(database.Patent)
+            projection = column_projection(info, Patent)
+            return await info.context.run_db(
+                lambda db: db.query(database.Patent)
+                .options(projection)
                 .filter(database.Patent.publication_number == publication_number)
                 .first()
             )
@@ -28,35 +39,63 @@ class Query(graphene.ObjectType):
             logger.error(f"Error resolving patent: {e}")
             raise
 
-    def resolve_search_patents(self, info, query=None, assignee=None, limit=10):
+    async def resolve_search_patents(self, info, query=None, assignee=None, limit=10):
         try:
             logger.info(f"Searching patents: query={query}, assignee={assignee}")
-            db = info.context.db
-            query_obj = db.query(database.Patent)
+            projection = column_projection(info, Patent)
 
-            if query:
-                query_obj = query_obj.filter(
-                    database.Patent.title.ilike(f"%{query}%")
-                    | database.Patent.abstract.ilike(f"%{query}%")
-                )
+            def search_patents(db):
+                if query:
+                    hits = search.search_patents(
+                        db, query, assignee=assignee, limit=limit
+                    )
+                    if hits is not None:
+                        matches = (
+                            db.query(database.Patent)
+                            .options(projection)
+                            .filter(
+                                database.Patent.patent_id.in_(
+                                    [patent_id for patent_id, _ in hits]
+                                )
+                            )
+                        )
+                        patents = {patent.patent_id: patent for patent in matches}
+                        results = []
+                        for patent_id, snippet in hits:
+                            if patent_id in patents:
+                                patents[patent_id].search_snippet = snippet
+                                results.append(patents[patent_id])
+                        return results
 
-            if assignee:
-                query_obj = query_obj.filter(
-                    database.Patent.assignee.ilike(f"%{assignee}%")
-                )
+                # ILIKE scan when there is no query text or no full-text index
+                query_obj = db.query(database.Patent).options(projection)
+
+                if query:
+                    query_obj = query_obj.filter(
+                        database.Patent.title.ilike(f"%{query}%")
+                        | database.Patent.abstract.ilike(f"%{query}%")
+                    )
+
+                if assignee:
+                    query_obj = query_obj.filter(
+                        database.Patent.assignee.ilike(f"%{assignee}%")
+                    )
+
+                return query_obj.limit(limit).all()
 
-            return query_obj.limit(limit).all()
+            return await info.context.run_db(search_patents)
         except Exception as e:
             logger.error(f"Error searching patents: {e}")
             raise
 
     companies = graphene.List(Company)
 
-    def resolve_companies(self, info):
+    async def resolve_companies(self, info):
         try:
             logger.info("Fetching companies")
-            db = info.context.db
-            return db.query(database.Company).all()
+            return await info.context.run_db(
+                lambda db: db.query(database.Company).all()
+            )
         except Exception as e:
             logger.error(f"Error fetching companies: {e}")
             raise
@@ -66,12 +105,11 @@ class Query(graphene.ObjectType):
         CompanyPatentAnalysis, company_analysis_id=graphene.String(required=True)
     )
 
-    def resolve_company_analysis(self, info, company_analysis_id):
+    async def resolve_company_analysis(self, info, company_analysis_id):
         try:
             logger.info(f"Fetching company analysis: {company_analysis_id}")
-            db = info.context.db
-            return (
-                db.query(database.CompanyPatentAnalysis)
+            return await info.context.run_db(
+                lambda db: db.query(database.CompanyPatentAnalysis)
                 .filter(
                     database.CompanyPatentAnalysis.company_analysis_id
                     == company_analysis_id
@@ -84,11 +122,10 @@ class Query(graphene.ObjectType):
 
     saved_analyses = graphene.List(CompanyPatentAnalysis)
 
-    def resolve_saved_analyses(self, info):
+    async def resolve_saved_analyses(self, info):
         try:
-            db = info.context.db
-            return (
-                db.query(database.CompanyPatentAnalysis)
+            return await info.context.run_db(
+                lambda db: db.query(database.CompanyPatentAnalysis)
                 .filter(database.CompanyPatentAnalysis.is_saved == True)
                 .order_by(database.CompanyPatentAnalysis.created_at.desc())
                 .all()
@@ -96,3 +133,78 @@ class Query(graphene.ObjectType):
         except Exception as e:
             logger.error(f"Error fetching saved analyses: {e}")
             raise
+
+    job = graphene.Field(AnalysisJob, job_id=graphene.String(required=True))
+
+    async def resolve_job(self, info, job_id):
+        try:
+            return await info.context.run_db(
+                lambda db: db.query(database.AnalysisJob)
+                .filter(database.AnalysisJob.job_id == job_id)
+                .first()
+            )
+        except Exception as e:
+            logger.error(f"Error fetching job: {e}")
+            raise
+
+    batch = graphene.Field(AnalysisBatch, batch_id=graphene.String(required=True))
+
+    async def resolve_batch(self, info, batch_id):
+        try:
+            return await info.context.run_db(
+                lambda db: db.query(database.AnalysisBatch)
+                .filter(database.AnalysisBatch.batch_id == batch_id)
+                .first()
+            )
+        except Exception as e:
+            logger.error(f"Error fetching batch: {e}")
+            raise
+
+    estimate_product_relevance = graphene.List(
+        ProductRelevanceEstimate,
+        publication_number=graphene.String(required=True),
+        company_name=graphene.String(required=True),
+        limit=graphene.Int(default_value=10),
+    )
+
+    async def resolve_estimate_product_relevance(
+        self, info, publication_number, company_name, limit=10
+    ):
+        """Fast, zero-LLM estimate of which products are relevant to a patent"""
+        try:
+
+            def load_inputs(db):
+                patent = (
+                    db.query(database.Patent)
+                    .filter(database.Patent.publication_number == publication_number)
+                    .first()
+                )
+                company = (
+                    db.query(database.Company)
+                    .filter(database.Company.name == company_name)
+                    .first()
+                )
+                if not patent or not company:
+                    raise Exception("Patent or company not found")
+                return company, load_claim_tree(db, patent), company.products
+
+            company, claim_tree, products = await info.context.run_db(load_inputs)
+            estimates = await base_claim_analyze_company_products(
+                company,
+                claim_tree["base_claims"],
+                top_k=limit,
+                fast_estimate=True,
+                products=products,
+            )
+            return [
+                ProductRelevanceEstimate(
+                    product_id=estimate["product_id"],
+                    product_name=product_name,
+                    relevance_score=estimate["relevance_score"],
+                    relevant_base_claims=estimate["relevant_base_claims"],
+                )
+                for product_name, estimate in estimates.items()
+            ]
+        except Exception as e:
+            logger.error(f"Error estimating product relevance: {e}")
+            raise
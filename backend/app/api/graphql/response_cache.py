@@ -0,0 +1,475 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, FrozenSet, Optional
+
+from graphql import (
+    DocumentNode,
+    FieldNode,
+    FragmentDefinitionNode,
+    FragmentSpreadNode,
+    GraphQLSchema,
+    InlineFragmentNode,
+    OperationType,
+    get_named_type,
+    get_operation_ast,
+    is_object_type,
+)
+from sqlalchemy import event, func, select
+
+from .. import metrics
+from ..database.database import IngestCheckpoint, SchemaVersion
+from ..graphql_schema import schema
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+# Bounds of the cache, whichever is reached first evicts the least recently used
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(32 << 20)))
+# Commits of other processes, cli.py ingest and migrate, are not seen by the
+# commit listeners below. Lookups check the marker those commands write at
+# most this often and drop every entry when it moved
+RESPONSE_CACHE_SYNC_SECONDS = float(os.getenv("RESPONSE_CACHE_SYNC_SECONDS", "2"))
+# Max age of a response, bounds staleness after writes neither check sees,
+# such as a manual sqlite3 session. 0 keeps responses until invalidated
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "600"))
+
+# Generation bumped when every table counts as written
+_ALL_TABLES = "*"
+
+# Read-only root fields whose responses are cached, with tables they read
+# besides those of the types in the selection set
+CACHEABLE_FIELDS = {
+    "patent": frozenset(),
+    "searchPatents": frozenset({"patents_fts"}),
+    "companies": frozenset(),
+    "savedAnalyses": frozenset(),
+}
+
+_WRITE_STATEMENT = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?"
+    r"|DELETE\s+FROM|DROP\s+TABLE(?:\s+IF\s+EXISTS)?|ALTER\s+TABLE)\s+[\"`\[]?(\w+)",
+    re.IGNORECASE,
+)
+
+
+def _model_table(graphql_type) -> Optional[str]:
+    model = getattr(getattr(graphql_type, "graphene_type", None), "_meta", None)
+    model = getattr(model, "model", None)
+    return model.__table__.name if model is not None else None
+
+
+def _collect_tables(
+    schema: GraphQLSchema,
+    parent_type,
+    selection_set,
+    fragments: Dict[str, FragmentDefinitionNode],
+    tables: set,
+):
+    for selection in selection_set.selections:
+        if isinstance(selection, FieldNode):
+            field = parent_type.fields.get(selection.name.value)
+            if field is None:
+                continue
+            field_type = get_named_type(field.type)
+            table = _model_table(field_type)
+            if table:
+                tables.add(table)
+            if selection.selection_set and is_object_type(field_type):
+                _collect_tables(
+                    schema, field_type, selection.selection_set, fragments, tables
+                )
+        elif isinstance(selection, (InlineFragmentNode, FragmentSpreadNode)):
+            fragment = (
+                selection
+                if isinstance(selection, InlineFragmentNode)
+                else fragments.get(selection.name.value)
+            )
+            if fragment is None:
+                continue
+            fragment_type = parent_type
+            if fragment.type_condition is not None:
+                fragment_type = schema.get_type(fragment.type_condition.name.value)
+            if is_object_type(fragment_type):
+                _collect_tables(
+                    schema, fragment_type, fragment.selection_set, fragments, tables
+                )
+
+
+def cacheable_tables(
+    schema: GraphQLSchema, document: DocumentNode, operation_name: Optional[str]
+) -> Optional[FrozenSet[str]]:
+    """
+    Tables a query operation reads, None if its response must not be cached
+
+    Only queries whose root fields are all in CACHEABLE_FIELDS are cached.
+    Every SQLAlchemy-backed type reachable from the selection set adds its
+    table, so nested claims or products tie the response to those tables too.
+    """
+    operation = get_operation_ast(document, operation_name or None)
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+    fragments = {
+        definition.name.value: definition
+        for definition in document.definitions
+        if isinstance(definition, FragmentDefinitionNode)
+    }
+    tables = set()
+    for selection in operation.selection_set.selections:
+        if not isinstance(selection, FieldNode):
+            return None
+        name = selection.name.value
+        if name == "__typename":
+            continue
+        if name not in CACHEABLE_FIELDS:
+            return None
+        tables.update(CACHEABLE_FIELDS[name])
+    _collect_tables(
+        schema, schema.query_type, operation.selection_set, fragments, tables
+    )
+    return frozenset(tables)
+
+
+class CacheLookup:
+    """
+    Result of ResponseCache.lookup for one request
+
+    cached holds the serialized response on a hit. On a miss store() caches
+    the data once the request has executed without errors.
+    """
+
+    def __init__(self, cache, key=None, tables=None, generations=None, cached=None):
+        self.cache = cache
+        self.key = key
+        self.tables = tables
+        self.generations = generations
+        self.cached = cached
+
+    @property
+    def cacheable(self) -> bool:
+        return self.key is not None
+
+    def store(self, data):
+        if self.key is not None and self.cached is None:
+            self.cache.put(self.key, self.tables, self.generations, data)
+
+
+class ResponseCache:
+    """
+    Serialized responses of read-only queries, invalidated by table writes
+
+    Entries are keyed by (query hash, operation name, variables), the query
+    hash covering the selection set, and tagged with the tables they read.
+    A committed write to a table drops the entries tagged with it. Every table
+    also has a generation counter: a response computed while a write
+    committed is not stored, so a read racing a write cannot cache stale data.
+
+    Writes of other processes are caught through external_marker, see
+    watch_external, and responses older than ttl are not served.
+
+    Input:
+    schema: GraphQLSchema, used to work out the tables of an operation
+    capacity: int, number of responses kept
+    max_bytes: int, total size of the serialized responses kept
+    ttl: float, max age of a response in seconds, 0 for no limit
+    """
+
+    def __init__(
+        self,
+        schema: GraphQLSchema,
+        capacity: int = RESPONSE_CACHE_SIZE,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        enabled: bool = RESPONSE_CACHE_ENABLED,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+    ):
+        self.schema = schema
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.ttl = ttl
+        self._external_marker: Optional[Callable] = None
+        self._external_seen = None
+        self._external_checked_at = 0.0
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._by_table: Dict[str, set] = {}
+        self._generations: Dict[str, int] = {}
+        self._tables_by_operation: "OrderedDict[tuple, Optional[FrozenSet]]" = (
+            OrderedDict()
+        )
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "stale_stores": 0,
+            "evictions": 0,
+            "invalidated_entries": 0,
+            "expired": 0,
+            "external_invalidations": 0,
+        }
+        self._invalidations = deque(maxlen=50)
+
+    def _operation_tables(
+        self, document: DocumentNode, query_key: str, operation_name: Optional[str]
+    ) -> Optional[FrozenSet[str]]:
+        key = (query_key, operation_name)
+        with self._lock:
+            if key in self._tables_by_operation:
+                self._tables_by_operation.move_to_end(key)
+                return self._tables_by_operation[key]
+        tables = cacheable_tables(self.schema, document, operation_name)
+        with self._lock:
+            self._tables_by_operation[key] = tables
+            while len(self._tables_by_operation) > max(self.capacity, 64):
+                self._tables_by_operation.popitem(last=False)
+        return tables
+
+    def lookup(
+        self,
+        document: DocumentNode,
+        query_key: str,
+        operation_name: Optional[str],
+        variables: Optional[dict],
+    ) -> CacheLookup:
+        """Cached response for a request, or a handle to store it once executed"""
+        if not self.enabled:
+            return CacheLookup(self)
+        tables = self._operation_tables(document, query_key, operation_name)
+        if tables is None:
+            return CacheLookup(self)
+        self._check_external()
+
+        key = (
+            query_key,
+            operation_name or "",
+            json.dumps(variables or {}, sort_keys=True, default=str),
+        )
+        with self._lock:
+            entry = self._entries.get(key)
+            if (
+                entry is not None
+                and self.ttl > 0
+                and time.monotonic() - entry[2] > self.ttl
+            ):
+                self._remove(key)
+                self._stats["expired"] += 1
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+            generations = {
+                table: self._generations.get(table, 0)
+                for table in (*tables, _ALL_TABLES)
+            }
+        metrics.CACHE_LOOKUPS.inc(
+            cache="graphql_response", result="miss" if entry is None else "hit"
+        )
+        return CacheLookup(
+            self, key, tables, generations, entry[0] if entry is not None else None
+        )
+
+    def put(self, key: tuple, tables: FrozenSet[str], generations: Dict, data):
+        body = json.dumps({"data": data}, separators=(",", ":")).encode("utf-8")
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if any(
+                self._generations.get(table, 0) != generation
+                for table, generation in generations.items()
+            ):
+                self._stats["stale_stores"] += 1
+                return
+            self._remove(key)
+            self._entries[key] = (body, tables, time.monotonic())
+            self._bytes += len(body)
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self._stats["stores"] += 1
+            while self._entries and (
+                len(self._entries) > self.capacity or self._bytes > self.max_bytes
+            ):
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key: tuple) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        body, tables, _ = entry
+        self._bytes -= len(body)
+        for table in tables:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+        return True
+
+    def invalidate(self, tables, reason: str = "write"):
+        """Drop the responses that read any of tables"""
+        tables = set(tables)
+        if not tables:
+            return
+        with self._lock:
+            removed = 0
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.pop(table, ())):
+                    removed += self._remove(key)
+            self._stats["invalidated_entries"] += removed
+            self._invalidations.append(
+                {
+                    "time": time.time(),
+                    "tables": sorted(tables),
+                    "entries": removed,
+                    "reason": reason,
+                }
+            )
+        for table in tables:
+            metrics.RESPONSE_CACHE_INVALIDATIONS.inc(table=table)
+        if removed:
+            logger.info(
+                f"Response cache: {reason} to {', '.join(sorted(tables))} "
+                f"dropped {removed} entries"
+            )
+
+    def watch_external(self, marker: Callable):
+        """
+        Drop every entry when marker() changes, checked on lookup at most
+        every RESPONSE_CACHE_SYNC_SECONDS
+
+        marker: callable returning a value that changes with each write of
+        another process
+        """
+        self._external_marker = marker
+        self._external_seen = None
+        self._external_checked_at = 0.0
+
+    def _check_external(self):
+        if self._external_marker is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._external_checked_at < RESPONSE_CACHE_SYNC_SECONDS:
+                return
+            self._external_checked_at = now
+        try:
+            seen = self._external_marker()
+        except Exception as e:
+            logger.error(f"Response cache: checking external writes failed: {e}")
+            return
+        with self._lock:
+            previous, self._external_seen = self._external_seen, seen
+            if previous is None or previous == seen:
+                return
+            self._stats["external_invalidations"] += 1
+        self.invalidate_all(reason="external write")
+
+    def invalidate_all(self, reason: str = "write"):
+        """Drop every response, including those being computed"""
+        with self._lock:
+            removed = len(self._entries)
+            self._generations[_ALL_TABLES] = self._generations.get(_ALL_TABLES, 0) + 1
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+            self._stats["invalidated_entries"] += removed
+            self._invalidations.append(
+                {
+                    "time": time.time(),
+                    "tables": [_ALL_TABLES],
+                    "entries": removed,
+                    "reason": reason,
+                }
+            )
+        metrics.RESPONSE_CACHE_INVALIDATIONS.inc(table=_ALL_TABLES)
+        logger.info(f"Response cache: {reason} dropped {removed} entries")
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "generations": dict(self._generations),
+                "recent_invalidations": list(self._invalidations),
+            }
+
+
+# Tables written on a connection, invalidated once the connection is handed
+# back to the pool: commit events fire before the commit reaches SQLite, and
+# a read in between would still see the old rows
+_WRITTEN_KEY = "response_cache_written"
+_COMMITTED_KEY = "response_cache_committed"
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    match = _WRITE_STATEMENT.match(statement)
+    if match:
+        conn.info.setdefault(_WRITTEN_KEY, set()).add(match.group(1).lower())
+
+
+def _on_commit(conn):
+    written = conn.info.pop(_WRITTEN_KEY, None)
+    if written:
+        conn.info.setdefault(_COMMITTED_KEY, set()).update(written)
+
+
+def _on_rollback(conn):
+    conn.info.pop(_WRITTEN_KEY, None)
+
+
+def _make_checkin_listener(cache: ResponseCache):
+    def on_checkin(dbapi_connection, connection_record):
+        committed = connection_record.info.pop(_COMMITTED_KEY, None)
+        if committed:
+            cache.invalidate(committed, reason="commit")
+
+    return on_checkin
+
+
+query_responses = ResponseCache(schema.graphql_schema)
+
+
+def external_writes_marker(engine) -> Callable:
+    """
+    Latest ingest batch and migration, both committed in the same
+    transaction as the rows they write
+    """
+    statement = select(
+        select(func.max(IngestCheckpoint.updated_at)).scalar_subquery(),
+        select(func.max(SchemaVersion.applied_at)).scalar_subquery(),
+    )
+
+    def marker():
+        with engine.connect() as connection:
+            return tuple(connection.execute(statement).one())
+
+    return marker
+
+
+def track_writes(engine, cache: ResponseCache = None):
+    """
+    Invalidate cache entries when a transaction on engine commits writes,
+    or when another process ingests or migrates the database
+    """
+    cache = cache or query_responses
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "commit", _on_commit)
+    event.listen(engine, "rollback", _on_rollback)
+    event.listen(engine.pool, "checkin", _make_checkin_listener(cache))
+    cache.watch_external(external_writes_marker(engine))
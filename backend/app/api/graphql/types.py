@@ -1,6 +1,8 @@
 import graphene
 from graphene_sqlalchemy import SQLAlchemyObjectType, SQLAlchemyConnectionField
 from ..database import database
+from .. import jobs
+from .projection import selected_columns
 
 import json
 
@@ -35,11 +37,20 @@ class Patent(SQLAlchemyObjectType):
         model = database.Patent
         interfaces = (graphene.relay.Node,)
         id = graphene.ID(source="patent_id")
+        exclude_fields = ("claim_dependencies",)
 
     claims = graphene.Field(ClaimConnection)
+    search_snippet = graphene.String(
+        description="Highlighted match, only set on searchPatents results"
+    )
 
-    def resolve_claims(self, info):
-        claims_list = self.claims.all() if self.claims else []
+    def resolve_search_snippet(self, info):
+        return getattr(self, "search_snippet", None)
+
+    async def resolve_claims(self, info):
+        claims_list = await info.context.run_db(
+            lambda db: self.claims.all() if self.claims else []
+        )
 
         # Create connection manually
         edges = [
@@ -66,6 +77,11 @@ class Product(SQLAlchemyObjectType):
         interfaces = (graphene.relay.Node,)
         id = graphene.ID(source="product_id")
 
+    company = graphene.Field(lambda: Company)
+
+    def resolve_company(self, info):
+        return info.context.loaders.company.load(self.company_id)
+
 
 class Company(SQLAlchemyObjectType):
     class Meta:
@@ -76,7 +92,7 @@ class Company(SQLAlchemyObjectType):
     products = graphene.List(Product)
 
     def resolve_products(self, info):
-        return self.products
+        return info.context.loaders.products_by_company.load(self.company_id)
 
 
 # Analysis Types
@@ -112,6 +128,15 @@ class ProductAnalysisResult(graphene.ObjectType):
     created_at = graphene.String()
 
 
+class ProductRelevanceEstimate(graphene.ObjectType):
+    """Local BM25 relevance of a product to a patent's base claims, no LLM involved"""
+
+    product_id = graphene.Int()
+    product_name = graphene.String()
+    relevance_score = graphene.Float()
+    relevant_base_claims = graphene.List(graphene.String)
+
+
 class CompanyAnalysisResult(graphene.ObjectType):
     """Result of analyzing a company against a patent"""
 
@@ -130,6 +155,23 @@ class ProductPatentAnalysis(SQLAlchemyObjectType):
         interfaces = (graphene.relay.Node,)
         id = graphene.ID(source="product_analysis_id")
 
+    product = graphene.Field(lambda: Product)
+    patent = graphene.Field(lambda: Patent)
+    company_analysis = graphene.Field(lambda: CompanyPatentAnalysis)
+
+    def resolve_product(self, info):
+        return info.context.loaders.product.load(self.product_id)
+
+    def resolve_patent(self, info):
+        return info.context.loaders.patent.load_columns(
+            self.patent_id, selected_columns(info, Patent)
+        )
+
+    def resolve_company_analysis(self, info):
+        if not self.company_analysis_id:
+            return None
+        return info.context.loaders.company_analysis.load(self.company_analysis_id)
+
     # Add resolvers for JSON fields
     relevant_claims_list = graphene.List(graphene.String)
     specific_features_list = graphene.List(graphene.String)
@@ -154,9 +196,76 @@ class CompanyPatentAnalysis(SQLAlchemyObjectType):
 
     # Use SQLAlchemyConnectionField for edge-node traversal
     product_analyses = SQLAlchemyConnectionField(ProductAnalysisConnection)
+    company = graphene.Field(Company)
+    patent = graphene.Field(Patent)
+
+    async def resolve_product_analyses(self, info, **kwargs):
+        return await info.context.loaders.product_analyses_by_company_analysis.load(
+            self.company_analysis_id
+        )
+
+    def resolve_company(self, info):
+        return info.context.loaders.company.load(self.company_id)
+
+    def resolve_patent(self, info):
+        return info.context.loaders.patent.load_columns(
+            self.patent_id, selected_columns(info, Patent)
+        )
+
+
+class AnalysisJob(SQLAlchemyObjectType):
+    """Background company analysis, poll it with the job query"""
+
+    class Meta:
+        model = database.AnalysisJob
+        interfaces = (graphene.relay.Node,)
+        id = graphene.ID(source="job_id")
+        exclude_fields = ("batch",)
+
+    company_analysis = graphene.Field(CompanyPatentAnalysis)
+
+    def resolve_company_analysis(self, info):
+        if not self.company_analysis_id:
+            return None
+        return info.context.loaders.company_analysis.load(self.company_analysis_id)
+
+
+class BatchProgress(graphene.ObjectType):
+    """Job counts of a batch, status is queued, running or completed"""
+
+    status = graphene.String()
+    total = graphene.Int()
+    queued = graphene.Int()
+    running = graphene.Int()
+    succeeded = graphene.Int()
+    failed = graphene.Int()
+    cancelled = graphene.Int()
+    pairs_per_minute = graphene.Float()
+
+
+class AnalysisBatch(SQLAlchemyObjectType):
+    """Portfolio analysis, one job per (patent, company) pair"""
+
+    class Meta:
+        model = database.AnalysisBatch
+        interfaces = (graphene.relay.Node,)
+        id = graphene.ID(source="batch_id")
+        exclude_fields = ("jobs",)
+
+    progress = graphene.Field(BatchProgress)
+    jobs = graphene.List(AnalysisJob)
+    missing_patents = graphene.List(graphene.String)
+    missing_companies = graphene.List(graphene.String)
+
+    async def resolve_progress(self, info):
+        progress = await info.context.run_db(jobs.batch_progress, self)
+        return BatchProgress(**progress)
+
+    def resolve_jobs(self, info):
+        return info.context.loaders.jobs_by_batch.load(self.batch_id)
+
+    def resolve_missing_patents(self, info):
+        return json.loads(self.params).get("missing_patents", [])
 
-    def resolve_product_analyses(self, info, **kwargs):
-        # Add session to info.context
-        if not hasattr(info.context, "get"):
-            setattr(info.context, "get", lambda: info.context.db)
-        return self.product_analyses
+    def resolve_missing_companies(self, info):
+        return json.loads(self.params).get("missing_companies", [])
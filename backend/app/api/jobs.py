@@ -0,0 +1,623 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from api.database.database import (
+    AnalysisBatch,
+    AnalysisJob,
+    Company,
+    Patent,
+    SessionLocal,
+)
+from api.database.claim_graph import load_claim_tree
+from api.database.executor import run_in_db, run_in_writer
+from api.analysis import analyze_company_against_patent
+from api import metrics, tracing
+from api.ai_analysis.scheduler import (
+    BATCH_PRIORITY,
+    INTERACTIVE_PRIORITY,
+    request_priority,
+)
+
+logger = logging.getLogger(__name__)
+
+# Max number of background analyses running at once
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Claim trees kept in memory for batch jobs, batches run patent by patent
+CLAIM_TREE_CACHE_SIZE = int(os.getenv("CLAIM_TREE_CACHE_SIZE", "32"))
+# Running jobs write a heartbeat, a starting process only requeues a running
+# job whose heartbeat is older than JOB_STALE_SECONDS, so it never takes over
+# jobs of a live server or CLI
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "90"))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+UNFINISHED_STATUSES = (QUEUED, RUNNING)
+
+
+def _update_job(job_id: str, **fields) -> Optional[AnalysisJob]:
+    """Write fields of a job row and return the refreshed row"""
+    db = SessionLocal()
+    try:
+        job = db.query(AnalysisJob).filter(AnalysisJob.job_id == job_id).first()
+        if not job:
+            return None
+        for name, value in fields.items():
+            setattr(job, name, value)
+        db.commit()
+        db.refresh(job)
+        return job
+    finally:
+        SessionLocal.remove()
+
+
+def _touch_jobs(job_ids: List[str]) -> List[str]:
+    """
+    Refresh the heartbeat of jobs this process is running
+
+    Returns the ids of those jobs that another process asked to cancel
+    """
+    db = SessionLocal()
+    try:
+        owned = db.query(AnalysisJob).filter(
+            AnalysisJob.job_id.in_(job_ids), AnalysisJob.owner == WORKER_ID
+        )
+        owned.update(
+            {AnalysisJob.heartbeat_at: datetime.now().isoformat()},
+            synchronize_session=False,
+        )
+        db.commit()
+        return [
+            job_id
+            for (job_id,) in owned.filter(AnalysisJob.cancel_requested.is_(True))
+            .with_entities(AnalysisJob.job_id)
+            .all()
+        ]
+    finally:
+        SessionLocal.remove()
+
+
+def batch_progress(db: Session, batch: AnalysisBatch) -> Dict:
+    """
+    Job counts and throughput of a batch
+
+    Returns a dict with the count of each job status, the batch status
+    (queued, running or completed) and finished pairs per minute
+    """
+    counts = dict(
+        db.query(AnalysisJob.status, func.count(AnalysisJob.job_id))
+        .filter(AnalysisJob.batch_id == batch.batch_id)
+        .group_by(AnalysisJob.status)
+        .all()
+    )
+    first_started, last_finished = (
+        db.query(func.min(AnalysisJob.started_at), func.max(AnalysisJob.finished_at))
+        .filter(AnalysisJob.batch_id == batch.batch_id)
+        .one()
+    )
+    finished = sum(counts.get(status, 0) for status in (SUCCEEDED, FAILED))
+    unfinished = sum(counts.get(status, 0) for status in UNFINISHED_STATUSES)
+
+    pairs_per_minute = 0.0
+    if first_started and finished:
+        end = datetime.now() if unfinished else datetime.fromisoformat(last_finished)
+        minutes = (end - datetime.fromisoformat(first_started)).total_seconds() / 60
+        pairs_per_minute = finished / minutes if minutes > 0 else 0.0
+
+    if not unfinished:
+        status = "completed"
+    elif counts.get(RUNNING) or finished:
+        status = RUNNING
+    else:
+        status = QUEUED
+
+    return {
+        "status": status,
+        "total": batch.pairs_total,
+        "queued": counts.get(QUEUED, 0),
+        "running": counts.get(RUNNING, 0),
+        "succeeded": counts.get(SUCCEEDED, 0),
+        "failed": counts.get(FAILED, 0),
+        "cancelled": counts.get(CANCELLED, 0),
+        "pairs_per_minute": pairs_per_minute,
+    }
+
+
+class JobQueue:
+    """
+    In-process queue of company analyses run by a fixed pool of asyncio workers
+
+    Job state and progress live in the analysis_jobs table, so a restarted
+    server picks unfinished jobs up again. Jobs interrupted while running are
+    restarted from the beginning, finished steps are cheap to redo thanks to
+    the LLM response cache and analysis reuse. A running job records its
+    owning process and a heartbeat, only jobs whose owner stopped reporting
+    are taken over, so the server and the CLI can share the table.
+
+    Jobs run in priority order, batch pairs share the same workers as
+    interactive jobs but queue behind them.
+
+    Input:
+    workers: int, number of jobs running at once
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS):
+        self.workers = max(1, workers)
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._sequence = itertools.count()
+        self._worker_tasks = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancelling = set()
+        self._claim_trees = OrderedDict()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    def _put(self, priority: int, job_id: str):
+        # The sequence number keeps FIFO order within a priority
+        self._queue.put_nowait((priority, next(self._sequence), job_id))
+
+    def stats(self) -> Dict:
+        """Jobs waiting and running in this process"""
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "running": len(self._running),
+        }
+
+    async def start(self, batch_id: str = None, resume: bool = True):
+        """
+        Start the workers and requeue jobs left unfinished by a previous run
+
+        Queued jobs and running jobs with a stale heartbeat are picked up,
+        jobs running in a live process are left to it.
+
+        Input:
+        batch_id: str, only resume the jobs of this batch, default is all jobs
+        resume: bool, pick up unfinished jobs at all, default is True
+        """
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+
+        def load_unfinished():
+            db = SessionLocal()
+            try:
+                query = db.query(AnalysisJob).filter(
+                    AnalysisJob.status.in_(UNFINISHED_STATUSES)
+                )
+                if batch_id:
+                    query = query.filter(AnalysisJob.batch_id == batch_id)
+                jobs = query.order_by(
+                    AnalysisJob.priority, AnalysisJob.created_at
+                ).all()
+                stale_before = (
+                    datetime.now() - timedelta(seconds=JOB_STALE_SECONDS)
+                ).isoformat()
+                resumed = []
+                for job in jobs:
+                    if (
+                        job.status == RUNNING
+                        and job.heartbeat_at
+                        and job.heartbeat_at >= stale_before
+                    ):
+                        continue
+                    if job.cancel_requested:
+                        job.status = CANCELLED
+                        job.finished_at = datetime.now().isoformat()
+                    else:
+                        job.status = QUEUED
+                        job.owner = None
+                        resumed.append((job.priority or 0, job.job_id))
+                db.commit()
+                return resumed
+            finally:
+                SessionLocal.remove()
+
+        if resume:
+            resumed = await run_in_writer(load_unfinished)
+            for priority, job_id in resumed:
+                self._put(priority, job_id)
+            if resumed:
+                logger.info(f"Resuming {len(resumed)} unfinished analysis jobs")
+
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+
+    async def stop(self):
+        """Stop the workers, running jobs stay unfinished and resume on next start"""
+        tasks = list(self._worker_tasks)
+        if self._heartbeat_task is not None:
+            tasks.append(self._heartbeat_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._heartbeat_task = None
+
+    async def _heartbeat(self):
+        # Also delivers cancelJob requests made through another process, which
+        # can only set cancel_requested on jobs this process runs
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            if not self._running:
+                continue
+            try:
+                cancel_requested = await run_in_writer(_touch_jobs, list(self._running))
+            except Exception as e:
+                logger.error(f"Analysis job heartbeat failed: {str(e)}")
+                continue
+            for job_id in cancel_requested:
+                logger.info(f"Cancelling analysis job {job_id} as requested")
+                await self._cancel_running(job_id)
+
+    async def _cancel_running(self, job_id: str) -> bool:
+        """Cancel the task of a job running in this process, False if there is none"""
+        task = self._running.get(job_id)
+        if not task:
+            return False
+        self._cancelling.add(job_id)
+        task.cancel()
+        await asyncio.wait({task})
+        return True
+
+    async def enqueue(
+        self, patent_publication_number: str, company_name: str, top_n=2, force=False
+    ) -> AnalysisJob:
+        """Persist a queued company analysis job and hand it to the workers"""
+        params = {
+            "patent_publication_number": patent_publication_number,
+            "company_name": company_name,
+            "top_n": top_n,
+            "force": force,
+        }
+
+        def create_job():
+            db = SessionLocal()
+            try:
+                job = self._new_job(params, INTERACTIVE_PRIORITY)
+                db.add(job)
+                db.commit()
+                db.refresh(job)
+                return job
+            finally:
+                SessionLocal.remove()
+
+        job = await run_in_writer(create_job)
+        self._schedule([(job.priority, job.job_id)])
+        return job
+
+    async def enqueue_batch(
+        self,
+        patent_publication_numbers: List[str],
+        company_names: List[str],
+        top_n=2,
+        force=False,
+    ) -> AnalysisBatch:
+        """
+        Queue one job per (patent, company) pair of the cross product
+
+        Duplicate and unknown publication numbers and company names are
+        dropped, unknown ones are listed in the batch params. Pairs are
+        queued patent by patent so consecutive jobs share a claim tree.
+
+        Returns the AnalysisBatch record
+        """
+        patent_publication_numbers = list(dict.fromkeys(patent_publication_numbers))
+        company_names = list(dict.fromkeys(company_names))
+
+        def create_batch():
+            db = SessionLocal()
+            try:
+                known_patents = {
+                    number
+                    for (number,) in db.query(Patent.publication_number).filter(
+                        Patent.publication_number.in_(patent_publication_numbers)
+                    )
+                }
+                known_companies = {
+                    name
+                    for (name,) in db.query(Company.name).filter(
+                        Company.name.in_(company_names)
+                    )
+                }
+                patents = [n for n in patent_publication_numbers if n in known_patents]
+                companies = [n for n in company_names if n in known_companies]
+                if not patents or not companies:
+                    raise Exception("No known patent and company to analyze")
+
+                batch = AnalysisBatch(
+                    params=json.dumps(
+                        {
+                            "patent_publication_numbers": patents,
+                            "company_names": companies,
+                            "top_n": top_n,
+                            "force": force,
+                            "missing_patents": [
+                                n
+                                for n in patent_publication_numbers
+                                if n not in known_patents
+                            ],
+                            "missing_companies": [
+                                n for n in company_names if n not in known_companies
+                            ],
+                        }
+                    ),
+                    pairs_total=len(patents) * len(companies),
+                    created_at=datetime.now().isoformat(),
+                )
+                db.add(batch)
+                db.flush()
+                jobs = [
+                    self._new_job(
+                        {
+                            "patent_publication_number": patent,
+                            "company_name": company,
+                            "top_n": top_n,
+                            "force": force,
+                        },
+                        BATCH_PRIORITY,
+                        batch_id=batch.batch_id,
+                    )
+                    for patent in patents
+                    for company in companies
+                ]
+                db.add_all(jobs)
+                db.commit()
+                db.refresh(batch)
+                return batch, [(job.priority, job.job_id) for job in jobs]
+            finally:
+                SessionLocal.remove()
+
+        batch, jobs = await run_in_writer(create_batch)
+        self._schedule(jobs)
+        logger.info(f"Queued batch {batch.batch_id} with {batch.pairs_total} pairs")
+        return batch
+
+    @staticmethod
+    def _new_job(params: Dict, priority: int, batch_id: str = None) -> AnalysisJob:
+        return AnalysisJob(
+            status=QUEUED,
+            priority=priority,
+            batch_id=batch_id,
+            progress_done=0,
+            progress_total=0,
+            params=json.dumps(params),
+            cancel_requested=False,
+            created_at=datetime.now().isoformat(),
+        )
+
+    def _schedule(self, jobs: List[Tuple[int, str]]):
+        """Hand (priority, job id) pairs to the workers"""
+        if self._queue is None:
+            logger.warning("Job queue not started, jobs run after the next start")
+            return
+        for priority, job_id in jobs:
+            self._put(priority, job_id)
+
+    async def wait_for_batch(
+        self, batch_id: str, poll_interval: float = 5.0, report: Callable = print
+    ) -> Dict:
+        """Wait until no job of the batch is queued or running, reporting progress"""
+
+        def load_progress():
+            db = SessionLocal()
+            try:
+                batch = (
+                    db.query(AnalysisBatch)
+                    .filter(AnalysisBatch.batch_id == batch_id)
+                    .first()
+                )
+                if not batch:
+                    raise Exception(f"Batch not found: {batch_id}")
+                return batch_progress(db, batch)
+            finally:
+                SessionLocal.remove()
+
+        while True:
+            progress = await run_in_db(load_progress)
+            done = progress["succeeded"] + progress["failed"] + progress["cancelled"]
+            report(
+                f"Batch {batch_id}: {done}/{progress['total']} pairs done "
+                f"({progress['failed']} failed), "
+                f"{progress['pairs_per_minute']:.1f} pairs/min"
+            )
+            if progress["status"] == "completed":
+                return progress
+            await asyncio.sleep(poll_interval)
+
+    async def cancel(self, job_id: str) -> Optional[AnalysisJob]:
+        """
+        Cancel a queued or running job, finished jobs are returned unchanged
+
+        A job running in another process is flagged with cancel_requested and
+        stays running until that process sees the flag on its next heartbeat.
+
+        Returns the job or None if it does not exist
+        """
+
+        def request_cancel():
+            db = SessionLocal()
+            try:
+                job = db.query(AnalysisJob).filter(AnalysisJob.job_id == job_id).first()
+                if not job:
+                    return None
+                if job.status == QUEUED:
+                    job.status = CANCELLED
+                    job.finished_at = datetime.now().isoformat()
+                elif job.status == RUNNING:
+                    job.cancel_requested = True
+                db.commit()
+                db.refresh(job)
+                return job
+            finally:
+                SessionLocal.remove()
+
+        job = await run_in_writer(request_cancel)
+        if job and job.status == RUNNING and await self._cancel_running(job_id):
+            job = await run_in_db(_update_job, job_id)
+        return job
+
+    async def _worker(self):
+        while True:
+            _, _, job_id = await self._queue.get()
+            try:
+                task = asyncio.create_task(self._run(job_id))
+                self._running[job_id] = task
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    # Cancelled jobs end the job task, not the worker
+                    if job_id not in self._cancelling:
+                        raise
+                finally:
+                    self._running.pop(job_id, None)
+                    self._cancelling.discard(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Analysis job worker error for {job_id}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    @tracing.traced("job.run")
+    async def _run(self, job_id: str):
+        tracing.set_attributes(job_id=job_id)
+
+        def claim_job() -> bool:
+            db = SessionLocal()
+            try:
+                # Conditional update so a concurrent cancel of a queued job wins
+                claimed = (
+                    db.query(AnalysisJob)
+                    .filter(AnalysisJob.job_id == job_id, AnalysisJob.status == QUEUED)
+                    .update(
+                        {
+                            AnalysisJob.status: RUNNING,
+                            AnalysisJob.started_at: datetime.now().isoformat(),
+                            AnalysisJob.owner: WORKER_ID,
+                            AnalysisJob.heartbeat_at: datetime.now().isoformat(),
+                        },
+                        synchronize_session=False,
+                    )
+                )
+                db.commit()
+                return bool(claimed)
+            finally:
+                SessionLocal.remove()
+
+        def start_job():
+            db = SessionLocal()
+            try:
+                job = db.query(AnalysisJob).filter(AnalysisJob.job_id == job_id).first()
+                params = json.loads(job.params)
+                batch_id = job.batch_id
+                priority = job.priority or INTERACTIVE_PRIORITY
+                patent = (
+                    db.query(Patent)
+                    .filter(
+                        Patent.publication_number == params["patent_publication_number"]
+                    )
+                    .first()
+                )
+                claim_tree = None
+                if patent and batch_id:
+                    claim_tree = self._claim_trees.get(patent.patent_id)
+                    metrics.CACHE_LOOKUPS.inc(
+                        cache="claim_tree",
+                        result="miss" if claim_tree is None else "hit",
+                    )
+                    if claim_tree is None:
+                        claim_tree = load_claim_tree(db, patent)
+                company = (
+                    db.query(Company)
+                    .filter(Company.name == params["company_name"])
+                    .first()
+                )
+                return params, priority, patent, company, claim_tree
+            finally:
+                SessionLocal.remove()
+
+        if not await run_in_writer(claim_job):
+            return
+        params, priority, patent, company, claim_tree = await run_in_db(start_job)
+        tracing.set_attributes(
+            priority=priority,
+            patent=params["patent_publication_number"],
+            company=params["company_name"],
+        )
+        if claim_tree is not None:
+            self._claim_trees[patent.patent_id] = claim_tree
+            self._claim_trees.move_to_end(patent.patent_id)
+            while len(self._claim_trees) > CLAIM_TREE_CACHE_SIZE:
+                self._claim_trees.popitem(last=False)
+
+        async def on_progress(stage: str, done: int, total: int):
+            await run_in_writer(
+                _update_job,
+                job_id,
+                stage=stage,
+                progress_done=done,
+                progress_total=total,
+            )
+
+        try:
+            if not patent or not company:
+                raise Exception("Patent or company not found")
+            # Lower values run first, for the queue and for the job's LLM requests
+            with request_priority(priority):
+                company_analysis = await analyze_company_against_patent(
+                    company,
+                    patent,
+                    top_n=params.get("top_n", 2),
+                    force=params.get("force", False),
+                    on_progress=on_progress,
+                    claim_tree=claim_tree,
+                )
+            await run_in_writer(
+                _update_job,
+                job_id,
+                status=SUCCEEDED,
+                company_analysis_id=company_analysis.company_analysis_id,
+                finished_at=datetime.now().isoformat(),
+            )
+        except asyncio.CancelledError:
+            if job_id in self._cancelling:
+                await run_in_writer(
+                    _update_job,
+                    job_id,
+                    status=CANCELLED,
+                    finished_at=datetime.now().isoformat(),
+                )
+            else:
+                # Shutting down, the job is picked up again on the next start
+                await run_in_writer(_update_job, job_id, status=QUEUED, owner=None)
+            raise
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} failed: {str(e)}")
+            tracing.current_span().record_error(e)
+            await run_in_writer(
+                _update_job,
+                job_id,
+                status=FAILED,
+                error=str(e),
+                finished_at=datetime.now().isoformat(),
+            )
+
+
+job_queue = JobQueue()
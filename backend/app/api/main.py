@@ -1,11 +1,18 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from .database import database
 from .graphql_schema import schema
 from .graphql.context import Context
+from .graphql import documents, response_cache
+from .database.executor import run_in_db
+from .database import profiler
+from .jobs import job_queue
+from . import metrics, streaming, tracing
 import logging
 import traceback
-from graphql import graphql
+from graphql import ExecutionResult, OperationType, execute, get_operation_ast
+from inspect import isawaitable
 from openai import AsyncOpenAI
 import os
 
@@ -14,6 +21,17 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = FastAPI()
+metrics.instrument_engine(database.engine)
+metrics.instrument_engine(database.read_engine)
+tracing.instrument_database(database.engine)
+tracing.instrument_database(database.read_engine)
+response_cache.track_writes(database.engine)
+document_cache = documents.DocumentCache(schema.graphql_schema)
+
+
+def is_query(document, operation_name: str) -> bool:
+    operation = get_operation_ast(document, operation_name or None)
+    return operation is not None and operation.operation == OperationType.QUERY
 
 
 # Initialize database on startup
@@ -23,12 +41,18 @@ async def startup_event():
     try:
         database.init_db()
         logger.info("Database initialized successfully")
+        await job_queue.start()
     except Exception as e:
         logger.error(f"Error initializing database: {e}")
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise e
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await job_queue.stop()
+
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -41,32 +65,82 @@ app.add_middleware(
 
 # GraphQL endpoint
 @app.post("/graphql")
-async def graphql_endpoint(request: Request):
+async def graphql_endpoint(request: Request, response: Response):
+    context = None
     try:
         data = await request.json()
         operation_name = data.get("operationName", "")
         logger.info(f"GraphQL Operation: {operation_name}")
 
+        try:
+            query, query_key = documents.persisted_queries.resolve(
+                data.get("query"), data.get("extensions")
+            )
+        except documents.PersistedQueryError as e:
+            return {"errors": [e.to_dict()]}
+
         context = Context()
-        context.db = next(database.get_db())
 
         try:
-            result = await graphql(
-                schema.graphql_schema,
-                data.get("query"),
-                context_value=context,
-                operation_name=operation_name,
-                variable_values=data.get("variables"),
-            )
+            with profiler.profile_request(operation_name) as sql_profile:
+                with metrics.track_graphql_request(operation_name) as request_metrics:
+                    with tracing.start_span(
+                        "graphql.request", operation=operation_name
+                    ) as span:
+                        document, errors = document_cache.get(query, query_key)
+                        cache_lookup = None
+                        if not errors:
+                            cache_lookup = response_cache.query_responses.lookup(
+                                document,
+                                query_key,
+                                operation_name,
+                                data.get("variables"),
+                            )
+                        if cache_lookup is not None and cache_lookup.cached:
+                            span.set_attributes(response_cache="hit")
+                            return Response(
+                                cache_lookup.cached,
+                                media_type="application/json",
+                                headers={"X-Response-Cache": "hit"},
+                            )
+                        if errors:
+                            result = ExecutionResult(data=None, errors=errors)
+                        else:
+                            # Read-only session for queries, the writer's for mutations
+                            context.read_only = is_query(document, operation_name)
+                            context.db = (
+                                database.ReadSessionLocal()
+                                if context.read_only
+                                else next(database.get_db())
+                            )
+                            result = execute(
+                                schema.graphql_schema,
+                                document,
+                                context_value=context,
+                                operation_name=operation_name,
+                                variable_values=data.get("variables"),
+                                middleware=[
+                                    metrics.resolver_timing_middleware,
+                                    tracing.resolver_tracing_middleware,
+                                ],
+                            )
+                            if isawaitable(result):
+                                result = await result
+                        if result.errors:
+                            request_metrics.failed = True
+                            span.set_status("error", str(result.errors[0]))
 
+            body = {"data": result.data}
             if result.errors:
                 logger.error(f"GraphQL Errors: {result.errors}")
-                return {
-                    "data": result.data,
-                    "errors": [str(error) for error in result.errors],
-                }
-
-            return {"data": result.data}
+                body["errors"] = [str(error) for error in result.errors]
+            elif cache_lookup is not None and cache_lookup.cacheable:
+                cache_lookup.store(result.data)
+                response.headers["X-Response-Cache"] = "miss"
+            if profiler.SQL_PROFILE_IN_RESPONSE:
+                body["extensions"] = {"sql": sql_profile.summary()}
+                response.headers["X-SQL-Profile"] = sql_profile.header_value()
+            return body
 
         except Exception as e:
             logger.error(f"Execution error: {e}")
@@ -78,8 +152,28 @@ async def graphql_endpoint(request: Request):
         logger.error(traceback.format_exc())
         return {"errors": [str(e)]}
     finally:
-        if hasattr(context, "db"):
-            context.db.close()
+        if context is not None and context.db is not None:
+            await run_in_db(context.db.close)
+
+
+@app.get("/analysis/stream")
+async def stream_analysis(
+    patentPublicationNumber: str,
+    companyName: str,
+    topN: int = 2,
+    force: bool = False,
+):
+    """
+    Analyze a company against a patent, streaming partial results as
+    Server-Sent Events, see streaming.analysis_events for the event types
+    """
+    return StreamingResponse(
+        streaming.analysis_events(
+            patentPublicationNumber, companyName, top_n=topN, force=force
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 # GraphiQL interface
@@ -145,3 +239,46 @@ async def test_openai():
     except Exception as e:
         logger.error(f"OpenAI API test failed: {str(e)}")
         return {"status": "error", "message": f"OpenAI API test failed: {str(e)}"}
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus metrics of this process"""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit ratio, size and recent invalidations of the GraphQL response cache"""
+    return response_cache.query_responses.stats()
+
+
+@app.get("/traces")
+async def list_traces(limit: int = 50, name: str = None):
+    """Newest traces kept in memory, name filters on the root span name"""
+    return tracing.exporter.recent(limit=limit, name=name)
+
+
+@app.get("/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """One trace with its spans nested under their parents"""
+    trace = tracing.exporter.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace
+
+
+@app.get("/llm-cache/stats")
+async def llm_cache_stats():
+    """Hit/miss counters of the LLM response cache"""
+    from .ai_analysis.cache import llm_cache
+
+    return llm_cache.stats()
+
+
+@app.get("/llm-scheduler/stats")
+async def llm_scheduler_stats():
+    """Queue depth, retries and throttle time of the OpenAI request scheduler"""
+    from .ai_analysis.scheduler import llm_scheduler
+
+    return llm_scheduler.stats()
@@ -0,0 +1,452 @@
+import math
+import threading
+import time
+from contextlib import contextmanager
+from inspect import isawaitable
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import event
+
+from .database.profiler import current_profile
+
+# Prometheus text exposition format served by /metrics
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+    60,
+    120,
+    300,
+)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Registry:
+    """Metrics rendered together by /metrics"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    """
+    Base of the metric types, one value per combination of label values
+
+    Input:
+    name: str, metric name
+    documentation: str, HELP text
+    labelnames: sequence of label names, values are passed as keyword arguments
+    function: callable returning the value, or a dict of label value tuples to
+        values, read at scrape time instead of stored values
+    """
+
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        function: Optional[Callable] = None,
+        registry: Registry = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._values = {}
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def _key(self, labels: Dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {_escape(self.documentation)}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def values(self) -> Dict[tuple, float]:
+        if self.function is None:
+            with self._lock:
+                return dict(self._values)
+        value = self.function()
+        if isinstance(value, dict):
+            return {tuple(str(part) for part in key): v for key, v in value.items()}
+        return {(): value}
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for key, value in sorted(self.values().items()):
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_in_progress(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        registry: Registry = REGISTRY,
+    ):
+        super().__init__(name, documentation, labelnames, registry=registry)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][index] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block in seconds"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        with self._lock:
+            states = {
+                key: (list(counts), total, count)
+                for key, (counts, total, count) in self._values.items()
+            }
+        bucket_names = self.labelnames + ("le",)
+        for key, (counts, total, count) in sorted(states.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(bucket_names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+# GraphQL
+GRAPHQL_REQUEST_SECONDS = Histogram(
+    "graphql_request_duration_seconds",
+    "GraphQL request latency by operation name",
+    ["operation", "status"],
+)
+GRAPHQL_RESOLVER_SECONDS = Histogram(
+    "graphql_resolver_duration_seconds",
+    "Latency of root and async GraphQL resolvers",
+    ["field"],
+)
+GRAPHQL_REQUESTS_IN_FLIGHT = Gauge(
+    "graphql_requests_in_flight", "GraphQL requests being executed"
+)
+GRAPHQL_SQL_QUERIES = Histogram(
+    "graphql_sql_queries_per_request",
+    "SQL statements executed per GraphQL request",
+    ["operation"],
+    buckets=COUNT_BUCKETS,
+)
+SQL_QUERIES = Counter("sql_queries_total", "SQL statements executed")
+
+# LLM calls, stage is screening, detail or summary
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "OpenAI request latency including rate limit waits and retries",
+    ["stage", "model"],
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds",
+    "Time from sending a streamed OpenAI request to its first text",
+    ["stage", "model"],
+)
+LLM_PROMPT_TOKENS = Counter(
+    "llm_prompt_tokens_total", "Prompt tokens reported by OpenAI", ["stage", "model"]
+)
+LLM_COMPLETION_TOKENS = Counter(
+    "llm_completion_tokens_total",
+    "Completion tokens reported by OpenAI",
+    ["stage", "model"],
+)
+LLM_ERRORS = Counter(
+    "llm_errors_total", "Failed OpenAI requests and invalid answers", ["stage", "error"]
+)
+
+# Analysis pipeline
+ANALYSIS_STAGE_SECONDS = Histogram(
+    "analysis_stage_duration_seconds",
+    "Duration of the screening, detail and summary stages of an analysis",
+    ["stage"],
+)
+ANALYSES_IN_FLIGHT = Gauge(
+    "analyses_in_flight", "Company and product analyses running", ["kind"]
+)
+
+# Caches: llm responses, reusable analyses and batch claim trees
+CACHE_LOOKUPS = Counter(
+    "cache_lookups_total", "Cache lookups by result", ["cache", "result"]
+)
+
+
+def _cache_hit_ratios() -> Dict[tuple, float]:
+    totals = {}
+    for (cache, result), count in CACHE_LOOKUPS.values().items():
+        hits, lookups = totals.get(cache, (0, 0))
+        totals[cache] = (hits + (count if result == "hit" else 0), lookups + count)
+    return {
+        (cache,): hits / lookups if lookups else 0.0
+        for cache, (hits, lookups) in totals.items()
+    }
+
+
+Gauge(
+    "cache_hit_ratio",
+    "Hits over lookups since the process started",
+    ["cache"],
+    function=_cache_hit_ratios,
+)
+RESPONSE_CACHE_INVALIDATIONS = Counter(
+    "response_cache_invalidations_total",
+    "Committed writes that invalidated cached GraphQL responses, by table",
+    ["table"],
+)
+
+
+def _response_cache_stat(name: str) -> Callable:
+    def read():
+        from .graphql.response_cache import query_responses
+
+        return query_responses.stats()[name]
+
+    return read
+
+
+Gauge(
+    "response_cache_entries",
+    "GraphQL responses cached",
+    function=_response_cache_stat("entries"),
+)
+Gauge(
+    "response_cache_bytes",
+    "Size of the cached GraphQL responses",
+    function=_response_cache_stat("bytes"),
+)
+Counter(
+    "response_cache_stale_stores_total",
+    "Responses not cached because a write committed while they were computed",
+    function=_response_cache_stat("stale_stores"),
+)
+
+
+def _scheduler_stat(name: str) -> Callable:
+    def read():
+        from .ai_analysis.scheduler import llm_scheduler
+
+        return llm_scheduler.stats()[name]
+
+    return read
+
+
+def _job_queue_stat(name: str) -> Callable:
+    def read():
+        from .jobs import job_queue
+
+        return job_queue.stats()[name]
+
+    return read
+
+
+Gauge(
+    "llm_requests_in_flight",
+    "OpenAI requests sent and not answered",
+    function=_scheduler_stat("in_flight"),
+)
+Gauge(
+    "llm_queue_depth",
+    "OpenAI requests waiting for rate limit capacity",
+    function=_scheduler_stat("queue_depth"),
+)
+Counter(
+    "llm_retries_total",
+    "OpenAI request retries",
+    function=_scheduler_stat("retries_total"),
+)
+Counter(
+    "llm_rate_limited_total",
+    "OpenAI 429 responses",
+    function=_scheduler_stat("rate_limited_total"),
+)
+Gauge(
+    "analysis_jobs_queued",
+    "Background analysis jobs waiting for a worker",
+    function=_job_queue_stat("queued"),
+)
+Gauge(
+    "analysis_jobs_running",
+    "Background analysis jobs running",
+    function=_job_queue_stat("running"),
+)
+
+
+def _count_sql_query(conn, cursor, statement, parameters, context, executemany):
+    SQL_QUERIES.inc()
+
+
+def instrument_engine(engine):
+    """Count the SQL statements executed through engine"""
+    if not event.contains(engine, "before_cursor_execute", _count_sql_query):
+        event.listen(engine, "before_cursor_execute", _count_sql_query)
+
+
+class GraphQLRequestMetrics:
+    """Outcome of a request, set by the caller inside track_graphql_request"""
+
+    def __init__(self):
+        self.failed = False
+
+
+@contextmanager
+def track_graphql_request(operation_name: str):
+    """
+    Record latency, SQL statement count and in-flight state of a GraphQL request
+
+    The statement count comes from the SQL profile of the request, so the
+    block must run inside profiler.profile_request().
+    """
+    operation = operation_name or "anonymous"
+    request = GraphQLRequestMetrics()
+    started = time.perf_counter()
+    GRAPHQL_REQUESTS_IN_FLIGHT.inc()
+    try:
+        yield request
+    except BaseException:
+        request.failed = True
+        raise
+    finally:
+        GRAPHQL_REQUESTS_IN_FLIGHT.dec()
+        GRAPHQL_REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            operation=operation,
+            status="error" if request.failed else "ok",
+        )
+        profile = current_profile()
+        if profile is not None:
+            GRAPHQL_SQL_QUERIES.observe(profile.statement_count, operation=operation)
+
+
+def resolver_timing_middleware(next_, root, info, **args):
+    """
+    graphql-core middleware timing root fields and async resolvers
+
+    Synchronous attribute lookups on nested objects are left untimed, they are
+    cheap and would dominate the number of observations.
+    """
+    field = f"{info.parent_type.name}.{info.field_name}"
+    started = time.perf_counter()
+    result = next_(root, info, **args)
+    if isawaitable(result):
+
+        async def timed():
+            try:
+                return await result
+            finally:
+                GRAPHQL_RESOLVER_SECONDS.observe(
+                    time.perf_counter() - started, field=field
+                )
+
+        return timed()
+    if root is None:
+        GRAPHQL_RESOLVER_SECONDS.observe(time.perf_counter() - started, field=field)
+    return result
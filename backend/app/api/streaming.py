@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+from typing import AsyncIterator, Dict
+
+from sqlalchemy.orm import joinedload
+
+from .analysis import analyze_company_against_patent, product_analysis_payload
+from .database import database
+from .database.executor import run_in_db
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Comment lines sent while waiting on the model, so proxies keep the stream open
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+
+_DONE = object()
+
+
+def format_event(event: str, data: Dict) -> str:
+    """One Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _find_patent_and_company(patent_publication_number: str, company_name: str):
+    db = database.SessionLocal()
+    try:
+        patent = (
+            db.query(database.Patent)
+            .filter(database.Patent.publication_number == patent_publication_number)
+            .first()
+        )
+        company = (
+            db.query(database.Company)
+            .filter(database.Company.name == company_name)
+            .first()
+        )
+        return patent, company
+    finally:
+        database.SessionLocal.remove()
+
+
+def _load_result(company_analysis_id: str) -> Dict:
+    """Stored analysis with its product analyses, as sent in the complete event"""
+    db = database.ReadSessionLocal()
+    try:
+        company_analysis = (
+            db.query(database.CompanyPatentAnalysis)
+            .options(
+                joinedload(database.CompanyPatentAnalysis.product_analyses).joinedload(
+                    database.ProductPatentAnalysis.product
+                )
+            )
+            .filter(
+                database.CompanyPatentAnalysis.company_analysis_id
+                == company_analysis_id
+            )
+            .one()
+        )
+        return {
+            "company_analysis_id": company_analysis.company_analysis_id,
+            "overall_risk": company_analysis.overall_risk,
+            "overall_risk_assessment": company_analysis.overall_risk_assessment,
+            "created_at": company_analysis.created_at,
+            # Shortlist order, as in the productAnalyses resolver
+            "product_analyses": [
+                product_analysis_payload(row, row.product)
+                for row in sorted(
+                    company_analysis.product_analyses,
+                    key=lambda row: row.created_at or "",
+                )
+            ],
+        }
+    finally:
+        db.close()
+
+
+async def analysis_events(
+    patent_publication_number: str,
+    company_name: str,
+    top_n: int = 2,
+    force: bool = False,
+) -> AsyncIterator[str]:
+    """
+    Run a company analysis and yield its progress as Server-Sent Events
+
+    Events, in order:
+    progress: {stage, done, total} as the analysis moves through its stages
+    screening: products shortlisted for detail analysis
+    product_analysis_partial: fields of a product's answer while it streams,
+        likelihood and claims first, then the explanation as it grows
+    product_analysis: each product's analysis as soon as its model call returns
+    overall_risk_partial: the summary text while it streams
+    overall_risk: the overall risk and its summary
+    complete: the stored analysis with all product analyses, also sent alone
+        when an earlier analysis is reused
+    error: {message} if the analysis fails
+
+    The analysis is cancelled if the client disconnects.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    async def on_progress(stage: str, done: int, total: int):
+        await queue.put(("progress", {"stage": stage, "done": done, "total": total}))
+
+    async def on_event(event: str, payload: Dict):
+        await queue.put((event, payload))
+
+    @tracing.traced("analysis.stream")
+    async def run():
+        tracing.set_attributes(patent=patent_publication_number, company=company_name)
+        try:
+            patent, company = await run_in_db(
+                _find_patent_and_company, patent_publication_number, company_name
+            )
+            if not patent or not company:
+                raise Exception("Patent or company not found")
+            company_analysis = await analyze_company_against_patent(
+                company,
+                patent,
+                top_n=top_n,
+                force=force,
+                on_progress=on_progress,
+                on_event=on_event,
+            )
+            result = await run_in_db(_load_result, company_analysis.company_analysis_id)
+            await queue.put(("complete", result))
+        except Exception as e:
+            logger.error(f"Streamed analysis failed: {e}")
+            tracing.current_span().record_error(e)
+            await queue.put(("error", {"message": str(e)}))
+        finally:
+            await queue.put((_DONE, None))
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            try:
+                event, payload = await asyncio.wait_for(
+                    queue.get(), timeout=SSE_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event is _DONE:
+                break
+            yield format_event(event, payload)
+    finally:
+        if not task.done():
+            logger.info(
+                f"Client left, cancelling streamed analysis of "
+                f"{company_name} / {patent_publication_number}"
+            )
+            task.cancel()
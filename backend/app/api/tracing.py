@@ -0,0 +1,349 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() != "false"
+# Number of traces kept in memory by the ring buffer exporter
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Spans beyond this are dropped so one huge batch cannot fill memory
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "2000"))
+
+
+class Span:
+    """
+    One timed operation in a trace
+
+    Input:
+    name: str
+    trace_id: str, shared by every span of the trace
+    parent_id: str, span_id of the parent, None for the root span
+    attributes: dict of JSON-serializable values
+    """
+
+    def __init__(
+        self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict
+    ):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.error = None
+        self.start_time = time.time()
+        self.duration_ms = None
+        self._started = time.perf_counter()
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add_to_attribute(self, key: str, amount: int = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    def set_status(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+
+    def record_error(self, error: BaseException):
+        if isinstance(error, asyncio.CancelledError):
+            self.set_status("cancelled")
+            return
+        self.set_status("error", f"{type(error).__name__}: {error}")
+
+    def end(self):
+        self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        exporter.export(self)
+
+    def to_dict(self) -> Dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class _NoopSpan:
+    """Stand-in when tracing is disabled or no span is active"""
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def add_to_attribute(self, key: str, amount: int = 1):
+        pass
+
+    def set_status(self, status: str, error: str = None):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class RingBufferExporter:
+    """
+    Keeps the spans of the most recent traces in memory
+
+    Spans arrive as they end, so a trace shows its finished spans while its
+    root is still running. The oldest trace is dropped once capacity is reached.
+
+    Input:
+    capacity: int, number of traces kept
+    max_spans: int, spans kept per trace
+    """
+
+    def __init__(self, capacity: int = TRACE_BUFFER_SIZE, max_spans=TRACE_MAX_SPANS):
+        self.capacity = capacity
+        self.max_spans = max_spans
+        self._traces: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        with self._lock:
+            trace = self._traces.get(span.trace_id)
+            if trace is None:
+                trace = self._traces[span.trace_id] = {"spans": [], "dropped": 0}
+                while len(self._traces) > self.capacity:
+                    self._traces.popitem(last=False)
+            if len(trace["spans"]) < self.max_spans:
+                trace["spans"].append(span.to_dict())
+            else:
+                trace["dropped"] += 1
+
+    def _summary(self, trace_id: str, trace: Dict) -> Dict:
+        spans = trace["spans"]
+        root = next((span for span in spans if span["parent_id"] is None), None)
+        first = min(spans, key=lambda span: span["start_time"])
+        return {
+            "trace_id": trace_id,
+            "name": root["name"] if root else first["name"],
+            "start_time": (root or first)["start_time"],
+            "duration_ms": root["duration_ms"] if root else None,
+            "status": root["status"] if root else "in_progress",
+            "span_count": len(spans),
+            "dropped_spans": trace["dropped"],
+            "error_count": sum(1 for span in spans if span["status"] == "error"),
+        }
+
+    def recent(self, limit: int = 50, name: str = None) -> List[Dict]:
+        """Summaries of the newest traces, optionally only those whose root name matches"""
+        with self._lock:
+            traces = [
+                (trace_id, {"spans": list(trace["spans"]), "dropped": trace["dropped"]})
+                for trace_id, trace in self._traces.items()
+            ]
+        summaries = [self._summary(trace_id, trace) for trace_id, trace in traces]
+        if name:
+            summaries = [summary for summary in summaries if name in summary["name"]]
+        summaries.sort(key=lambda summary: summary["start_time"], reverse=True)
+        return summaries[:limit]
+
+    def get(self, trace_id: str) -> Optional[Dict]:
+        """A trace with its spans nested under their parents, None if unknown"""
+        with self._lock:
+            trace = self._traces.get(trace_id)
+            if trace is None:
+                return None
+            spans = [dict(span) for span in trace["spans"]]
+            dropped = trace["dropped"]
+
+        by_id = {span["span_id"]: span for span in spans}
+        roots = []
+        for span in sorted(spans, key=lambda span: span["start_time"]):
+            span.setdefault("children", [])
+            parent = by_id.get(span["parent_id"])
+            if parent is None:
+                roots.append(span)
+            else:
+                parent.setdefault("children", []).append(span)
+        return {
+            **self._summary(trace_id, {"spans": spans, "dropped": dropped}),
+            "spans": roots,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+exporter = RingBufferExporter()
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def current_span():
+    """The active span, or a no-op span outside of any trace"""
+    return _current_span.get() or NOOP_SPAN
+
+
+def set_attributes(**attributes):
+    """Add attributes to the active span"""
+    current_span().set_attributes(**attributes)
+
+
+def _new_span(name: str, attributes: Dict) -> Span:
+    parent = _current_span.get()
+    if parent is None:
+        return Span(name, uuid4().hex, None, attributes)
+    return Span(name, parent.trace_id, parent.span_id, attributes)
+
+
+@contextmanager
+def start_span(name: str, **attributes):
+    """
+    Run the block in a new span, child of the active span if there is one
+
+    Asyncio tasks and DB pool threads started inside the block inherit the
+    span through the context, so their spans become its children.
+    """
+    if not TRACING_ENABLED:
+        yield NOOP_SPAN
+        return
+    span = _new_span(name, attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.record_error(e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+def traced(name: str):
+    """Decorator running an async function in a span of the given name"""
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with start_span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def resolver_tracing_middleware(next_, root, info, **args):
+    """graphql-core middleware giving every root field resolver its own span"""
+    if root is not None or not TRACING_ENABLED:
+        return next_(root, info, **args)
+    field = f"{info.parent_type.name}.{info.field_name}"
+    span = _new_span(f"graphql.resolve {field}", {"field": field})
+    token = _current_span.set(span)
+    try:
+        result = next_(root, info, **args)
+    except BaseException as e:
+        span.record_error(e)
+        span.end()
+        raise
+    finally:
+        _current_span.reset(token)
+    if not asyncio.iscoroutine(result):
+        span.end()
+        return result
+
+    async def traced_result():
+        token = _current_span.set(span)
+        try:
+            return await result
+        except BaseException as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    return traced_result()
+
+
+# DB flush and commit spans, opened and closed by session events in the
+# thread running the session, which carries a copy of the caller's context
+_SESSION_SPANS_KEY = "_trace_spans"
+
+
+def _open_session_span(session, name: str, **attributes):
+    if not TRACING_ENABLED or _current_span.get() is None:
+        return
+    span = _new_span(name, attributes)
+    token = _current_span.set(span)
+    session.info.setdefault(_SESSION_SPANS_KEY, []).append((name, span, token))
+
+
+def _close_session_span(session, name: str):
+    spans = session.info.get(_SESSION_SPANS_KEY)
+    if not spans or spans[-1][0] != name:
+        return
+    _, span, token = spans.pop()
+    _current_span.reset(token)
+    span.end()
+
+
+def _before_flush(session, flush_context, instances):
+    _open_session_span(
+        session,
+        "db.flush",
+        new=len(session.new),
+        dirty=len(session.dirty),
+        deleted=len(session.deleted),
+    )
+
+
+def _after_flush_postexec(session, flush_context):
+    _close_session_span(session, "db.flush")
+
+
+def _before_commit(session):
+    _open_session_span(session, "db.commit")
+
+
+def _after_commit(session):
+    _close_session_span(session, "db.commit")
+
+
+def _after_rollback(session):
+    """A failed flush or commit never gets its closing event, close them here"""
+    spans = session.info.get(_SESSION_SPANS_KEY)
+    while spans:
+        _, span, token = spans.pop()
+        span.set_status("error", "rolled back")
+        _current_span.reset(token)
+        span.end()
+
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    span = _current_span.get()
+    if span is not None:
+        span.add_to_attribute("db.statements")
+
+
+def instrument_database(engine):
+    """Trace session flushes and commits and count statements per span"""
+    for target, name, listener in (
+        (Session, "before_flush", _before_flush),
+        (Session, "after_flush_postexec", _after_flush_postexec),
+        (Session, "before_commit", _before_commit),
+        (Session, "after_commit", _after_commit),
+        (Session, "after_rollback", _after_rollback),
+        (engine, "before_cursor_execute", _count_statement),
+    ):
+        if not event.contains(target, name, listener):
+            event.listen(target, name, listener)
@@ -0,0 +1,181 @@
+"""
+Synthetic corpus in the same format as data/patents.json and data/company_products.json
+
+Run:
+    python -m benchmarks.corpus --scale 100k --out data/benchmarks/100k
+"""
+
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, Iterator
+
+SCALES = {"1k": 1_000, "100k": 100_000, "1m": 1_000_000}
+PATENTS_PER_COMPANY = 50
+PRODUCTS_PER_COMPANY = 5
+
+WORDS = (
+    "system method device apparatus network wireless signal data processing "
+    "module interface controller sensor memory storage user client server "
+    "request response message channel protocol packet frequency antenna "
+    "battery power circuit voltage display image video audio camera optical "
+    "shopping list advertisement product item merchant payment transaction "
+    "account identifier token encryption key authentication verification "
+    "vehicle engine brake steering navigation location position map route "
+    "medical patient dose sensor implant catheter fluid valve pump chamber "
+    "polymer compound composition layer substrate coating film fiber "
+    "learning model training inference neural feature vector score ranking "
+    "search query index database record field schema cache queue thread"
+).split()
+PREAMBLES = ("A method", "A system", "An apparatus", "A non-transitory medium")
+ASSIGNEE_SUFFIXES = ("Inc.", "Corp.", "LLC", "Ltd.", "GmbH", "Co.")
+
+
+def words(rng: random.Random, count: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(count))
+
+
+def company_name(index: int) -> str:
+    return f"Company {index:07d} {ASSIGNEE_SUFFIXES[index % len(ASSIGNEE_SUFFIXES)]}"
+
+
+def claim_text(rng: random.Random, number: int, base_numbers) -> str:
+    """Base claim or a dependent claim referring back like real claim sets do"""
+    if not base_numbers or rng.random() < 0.2:
+        base_numbers.append(number)
+        steps = "; ".join(words(rng, rng.randint(8, 16)) for _ in range(3))
+        return f"{number}. {rng.choice(PREAMBLES)} comprising: {steps}."
+
+    roll = rng.random()
+    if roll < 0.6 or number == 2:
+        reference = f"claim {rng.randint(base_numbers[-1], number - 1)}"
+    elif roll < 0.8:
+        start = rng.randint(1, number - 1)
+        reference = f"claims {start}-{rng.randint(start, number - 1)}"
+    elif roll < 0.95:
+        first, second = sorted(rng.sample(range(1, number), 2))
+        reference = f"claim {first} or claim {second}"
+    else:
+        reference = "any preceding claim"
+    return f"{number}. The method of {reference}, wherein {words(rng, rng.randint(10, 25))}."
+
+
+def patent_record(rng: random.Random, index: int, companies: int) -> Dict:
+    base_numbers = []
+    claims = [
+        {"num": f"{number:05d}", "text": claim_text(rng, number, base_numbers)}
+        for number in range(1, rng.randint(8, 24) + 1)
+    ]
+    year = 2000 + index % 24
+    return {
+        "id": str(index + 1),
+        "publication_number": f"US-{10_000_000 + index}-B2",
+        "title": words(rng, rng.randint(6, 12)).capitalize(),
+        "ai_summary": "",
+        "raw_source_url": "",
+        "assignee": company_name(rng.randrange(companies)),
+        "inventors": json.dumps(
+            [{"first_name": "", "last_name": words(rng, 2).upper()}]
+        ),
+        "priority_date": f"{year}-01-15",
+        "application_date": f"{year}-06-01",
+        "grant_date": f"{year + 2}-03-26",
+        "abstract": words(rng, rng.randint(60, 120)),
+        "description": words(rng, rng.randint(150, 300)),
+        "claims": json.dumps(claims),
+        "jurisdictions": "US",
+        "classifications": json.dumps({"ipcr": ["G06Q  30/00"]}),
+        "application_events": "",
+        "citations": json.dumps({"citations": []}),
+        "image_urls": "[]",
+        "landscapes": "",
+        "created_at": "2024-04-10 04:34:47",
+        "updated_at": "2024-04-10 04:34:47",
+        "publish_date": f"{year + 2}-03-26",
+        "citations_non_patent": "",
+        "provenance": "synthetic",
+        "attachment_urls": "None",
+    }
+
+
+def company_record(rng: random.Random, index: int) -> Dict:
+    return {
+        "name": company_name(index),
+        "products": [
+            {
+                "name": f"{words(rng, 2).title()} {product + 1}",
+                "description": words(rng, rng.randint(10, 30)),
+            }
+            for product in range(PRODUCTS_PER_COMPANY)
+        ],
+    }
+
+
+def _write_array(path: Path, records: Iterator[Dict], prefix="[", suffix="]"):
+    """Stream records as a JSON array so memory stays flat at any scale"""
+    with open(path, "w") as f:
+        f.write(prefix + "\n")
+        for position, record in enumerate(records):
+            if position:
+                f.write(",\n")
+            f.write(json.dumps(record))
+        f.write("\n" + suffix + "\n")
+
+
+def parse_scale(scale) -> int:
+    """Named scale (1k, 100k, 1m) or a plain number of patents"""
+    if isinstance(scale, int):
+        return scale
+    return SCALES.get(scale.lower()) or int(scale)
+
+
+def generate_corpus(out_dir, patents: int, seed: int = 0) -> Dict:
+    """
+    Write patents.json and company_products.json for a synthetic corpus
+
+    Input:
+    out_dir: str or Path, created if missing
+    patents: int, number of patents, companies scale with it
+    seed: int, the same seed always gives the same corpus
+
+    Returns a dict with the patent, company and product counts
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    companies = max(10, patents // PATENTS_PER_COMPANY)
+
+    rng = random.Random(seed)
+    _write_array(
+        out_dir / "patents.json",
+        (patent_record(rng, index, companies) for index in range(patents)),
+    )
+    _write_array(
+        out_dir / "company_products.json",
+        (company_record(rng, index) for index in range(companies)),
+        prefix='{"companies": [',
+        suffix="]}",
+    )
+    return {
+        "patents": patents,
+        "companies": companies,
+        "products": companies * PRODUCTS_PER_COMPANY,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic patent corpus")
+    parser.add_argument("--scale", default="1k", help="1k, 100k, 1m or a number")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    counts = generate_corpus(args.out, parse_scale(args.scale), args.seed)
+    print(
+        f"Wrote {counts['patents']} patents, {counts['companies']} companies "
+        f"and {counts['products']} products to {args.out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
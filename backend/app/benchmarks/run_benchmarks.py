@@ -0,0 +1,475 @@
+"""
+Micro-benchmarks for ingest, claim trees, resolvers and GraphQL execution
+
+Generates (or reuses) a synthetic corpus, loads it into a scratch SQLite
+database and writes timings to a JSON file that can be compared between
+commits.
+
+Run from backend/app:
+    python -m benchmarks.run_benchmarks --scale 1k
+    python -m benchmarks.run_benchmarks --scale 100k --compare previous.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from types import SimpleNamespace
+from uuid import uuid4
+
+from .corpus import generate_corpus, parse_scale
+
+SAMPLE_PATENTS = 200
+SEARCH_TERMS = (
+    "wireless signal",
+    "shopping list",
+    "neural",
+    "battery circuit",
+    "payment token",
+    "vehicle navigation",
+    "catheter valve",
+    "search index",
+)
+
+SEARCH_PATENTS = """
+query SearchPatents($query: String, $limit: Int) {
+  searchPatents(query: $query, limit: $limit) {
+    patentId
+    publicationNumber
+    title
+  }
+}
+"""
+
+PATENT_WITH_CLAIMS = """
+query GetPatent($publicationNumber: String!) {
+  patent(publicationNumber: $publicationNumber) {
+    patentId
+    publicationNumber
+    title
+    abstract
+    assignee
+    claims {
+      edges {
+        node {
+          num
+          text
+        }
+      }
+    }
+  }
+}
+"""
+
+SAVED_ANALYSES = """
+query GetSavedAnalyses {
+  savedAnalyses {
+    companyAnalysisId
+    company {
+      companyId
+      name
+    }
+    patent {
+      publicationNumber
+      title
+    }
+    overallRisk
+    overallRiskAssessment
+    createdAt
+    isSaved
+    isSavedAt
+    productAnalyses {
+      edges {
+        node {
+          infringementLikelihood
+          explanation
+          specificFeaturesList
+          relevantClaimsList
+          product {
+            name
+            description
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+
+def summarize(durations, items_per_iteration=1):
+    """Timing statistics in milliseconds for a list of durations in seconds"""
+    ordered = sorted(durations)
+    milliseconds = [duration * 1000 for duration in ordered]
+    median = statistics.median(milliseconds)
+    return {
+        "iterations": len(ordered),
+        "items_per_iteration": items_per_iteration,
+        "mean_ms": round(statistics.mean(milliseconds), 4),
+        "median_ms": round(median, 4),
+        "p95_ms": round(milliseconds[max(0, int(len(ordered) * 0.95 + 0.5) - 1)], 4),
+        "min_ms": round(milliseconds[0], 4),
+        "max_ms": round(milliseconds[-1], 4),
+        "stdev_ms": round(statistics.pstdev(milliseconds), 4),
+        "items_per_second": round(items_per_iteration * 1000 / median, 2)
+        if median
+        else None,
+    }
+
+
+def measure(fn, repeat, warmup=1, items_per_iteration=1):
+    for _ in range(warmup):
+        fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return summarize(durations, items_per_iteration)
+
+
+async def measure_async(fn, repeat, warmup=1, items_per_iteration=1):
+    for _ in range(warmup):
+        await fn()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await fn()
+        durations.append(time.perf_counter() - started)
+    return summarize(durations, items_per_iteration)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def seed_saved_analyses(database, count, rng):
+    """Saved analyses with product rows, written directly since they need no LLM"""
+    with database.engine.begin() as connection:
+        patent_ids = [
+            row[0]
+            for row in connection.execute(
+                database.Patent.__table__.select()
+                .with_only_columns([database.Patent.patent_id])
+                .limit(count * 10)
+            )
+        ]
+        products = connection.execute(
+            database.Product.__table__.select()
+            .with_only_columns(
+                [database.Product.product_id, database.Product.company_id]
+            )
+            .limit(count * 10)
+        ).fetchall()
+        company_rows, product_rows = [], []
+        for index in range(count):
+            company_analysis_id = str(uuid4())
+            patent_id = rng.choice(patent_ids)
+            product_id, company_id = rng.choice(products)
+            created_at = datetime(2024, 1, 1, 0, 0, index % 60).isoformat()
+            company_rows.append(
+                {
+                    "company_analysis_id": company_analysis_id,
+                    "patent_id": patent_id,
+                    "company_id": company_id,
+                    "overall_risk": rng.choice(["High", "Moderate", "Low"]),
+                    "overall_risk_assessment": "Synthetic assessment " * 20,
+                    "created_at": created_at,
+                    "is_saved": True,
+                    "is_saved_at": created_at,
+                    "input_fingerprint": None,
+                }
+            )
+            for _ in range(2):
+                product_rows.append(
+                    {
+                        "product_analysis_id": str(uuid4()),
+                        "patent_id": patent_id,
+                        "product_id": product_id,
+                        "company_analysis_id": company_analysis_id,
+                        "infringement_likelihood": rng.choice(["High", "Low"]),
+                        "relevant_claims": json.dumps(["1", "2"]),
+                        "explanation": "Synthetic explanation " * 20,
+                        "specific_features": json.dumps(["feature"]),
+                        "created_at": created_at,
+                    }
+                )
+        if company_rows:
+            connection.execute(
+                database.CompanyPatentAnalysis.__table__.insert(), company_rows
+            )
+            connection.execute(
+                database.ProductPatentAnalysis.__table__.insert(), product_rows
+            )
+
+
+def field_info(document, context, variables=None):
+    """Minimal resolve info for calling a root resolver outside graphql execution"""
+    from graphql import parse
+
+    operation = parse(document).definitions[0]
+    return SimpleNamespace(
+        field_nodes=[operation.selection_set.selections[0]],
+        fragments={},
+        context=context,
+        variable_values=variables or {},
+    )
+
+
+def run(args):
+    scale = parse_scale(args.scale)
+    workdir = Path(args.workdir) / str(args.scale)
+    corpus_dir = workdir / "corpus"
+    db_path = workdir / "benchmark.sqlite"
+    results = {}
+
+    if not (corpus_dir / "patents.json").exists():
+        print(f"Generating {scale} patent corpus in {corpus_dir}")
+        started = time.perf_counter()
+        generate_corpus(corpus_dir, scale, args.seed)
+        print(f"Corpus generated in {time.perf_counter() - started:.1f}s")
+
+    reuse = args.reuse_db and db_path.exists()
+    if not reuse and db_path.exists():
+        db_path.unlink()
+
+    # The engine and ingest paths are read at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path.resolve()}"
+    os.environ["DATA_DIR"] = str(corpus_dir.resolve())
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+
+    from api.database import database
+    from api.database.claim_graph import build_claim_graph, load_claim_tree
+    from api.database.ingest import ClaimRecord
+    from api.graphql.context import Context
+    from api.graphql.query import Query
+    from api.graphql_schema import schema
+    from graphql import graphql
+
+    # Per-call INFO lines would dominate the output and the timings
+    logging.getLogger("api").setLevel(logging.WARNING)
+
+    if not reuse:
+        database.Base.metadata.create_all(bind=database.engine)
+        print("Ingesting corpus")
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            database.initialize_company_and_patent()
+        results["ingest.initialize_company_and_patent"] = summarize(
+            [time.perf_counter() - started], scale
+        )
+        seed_saved_analyses(database, args.saved_analyses, random.Random(args.seed))
+
+    db = database.SessionLocal()
+    patent_count = db.query(database.Patent).count()
+    rng = random.Random(args.seed)
+    sample_ids = rng.sample(
+        range(1, patent_count + 1), min(SAMPLE_PATENTS, patent_count)
+    )
+    patents = (
+        db.query(database.Patent)
+        .filter(database.Patent.patent_id.in_(sample_ids))
+        .all()
+    )
+    claim_sets = [
+        [ClaimRecord(claim.claim_id, claim.num, claim.text) for claim in patent.claims]
+        for patent in patents
+    ]
+    publication_numbers = [patent.publication_number for patent in patents]
+    db.close()
+    database.SessionLocal.remove()
+
+    print("Running claim tree benchmarks")
+    results["claim_graph.build_claim_graph"] = measure(
+        lambda: [build_claim_graph(claims) for claims in claim_sets],
+        args.repeat,
+        items_per_iteration=len(claim_sets),
+    )
+
+    def load_trees():
+        db = database.SessionLocal()
+        try:
+            for patent in patents:
+                load_claim_tree(db, patent)
+        finally:
+            database.SessionLocal.remove()
+
+    results["claim_graph.load_claim_tree"] = measure(
+        load_trees, args.repeat, items_per_iteration=len(patents)
+    )
+
+    async def run_async_benchmarks():
+        terms = iter(SEARCH_TERMS * (args.repeat + 1))
+        numbers = iter(publication_numbers * (args.repeat + 1))
+
+        async def with_context(fn):
+            context = Context()
+            context.db = database.SessionLocal()
+            try:
+                return await fn(context)
+            finally:
+                context.db.close()
+                database.SessionLocal.remove()
+
+        async def resolve_search(context):
+            info = field_info(SEARCH_PATENTS, context)
+            return await Query.resolve_search_patents(
+                None, info, query=next(terms), limit=10
+            )
+
+        async def resolve_saved(context):
+            info = field_info(SAVED_ANALYSES, context)
+            return await Query.resolve_saved_analyses(None, info)
+
+        async def execute(document, operation_name, variables=None):
+            async def run_document(context):
+                result = await graphql(
+                    schema.graphql_schema,
+                    document,
+                    context_value=context,
+                    operation_name=operation_name,
+                    variable_values=variables() if variables else None,
+                )
+                if result.errors:
+                    raise RuntimeError(result.errors[0])
+                return result
+
+            return await with_context(run_document)
+
+        print("Running resolver benchmarks")
+        results["resolver.resolve_search_patents"] = await measure_async(
+            lambda: with_context(resolve_search), args.repeat
+        )
+        results["resolver.resolve_saved_analyses"] = await measure_async(
+            lambda: with_context(resolve_saved), args.repeat
+        )
+
+        print("Running GraphQL execution benchmarks")
+        results["graphql.SearchPatents"] = await measure_async(
+            lambda: execute(
+                SEARCH_PATENTS,
+                "SearchPatents",
+                lambda: {"query": next(terms), "limit": 10},
+            ),
+            args.repeat,
+        )
+        results["graphql.GetPatent"] = await measure_async(
+            lambda: execute(
+                PATENT_WITH_CLAIMS,
+                "GetPatent",
+                lambda: {"publicationNumber": next(numbers)},
+            ),
+            args.repeat,
+        )
+        results["graphql.GetSavedAnalyses"] = await measure_async(
+            lambda: execute(SAVED_ANALYSES, "GetSavedAnalyses"), args.repeat
+        )
+
+    asyncio.run(run_async_benchmarks())
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "scale": str(args.scale),
+        "patents": patent_count,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "benchmarks": results,
+    }
+
+
+def compare(current, baseline, threshold):
+    """
+    Print the median change of every benchmark present in both runs
+
+    Returns the names of benchmarks slower than the baseline by more than threshold
+    """
+    regressions = []
+    print(f"\n{'benchmark':<42} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, result in current["benchmarks"].items():
+        previous = baseline.get("benchmarks", {}).get(name)
+        if not previous or not previous["median_ms"]:
+            continue
+        change = result["median_ms"] / previous["median_ms"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(
+            f"{name:<42} {previous['median_ms']:>12.3f} "
+            f"{result['median_ms']:>12.3f} {change:>+8.1%}{flag}"
+        )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--scale", default="1k", help="1k, 100k, 1m or a number")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed iterations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saved-analyses", type=int, default=100)
+    parser.add_argument(
+        "--workdir",
+        default="data/benchmarks",
+        help="Corpus and scratch databases, one subdirectory per scale",
+    )
+    parser.add_argument(
+        "--reuse-db",
+        action="store_true",
+        help="Keep the previous database and skip the ingest benchmark",
+    )
+    parser.add_argument("--output", help="Results file, default is in the workdir")
+    parser.add_argument("--compare", help="Results file of a previous run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="Median slowdown counted as a regression, default is 0.10",
+    )
+    args = parser.parse_args()
+
+    result = run(args)
+    output = Path(args.output or Path(args.workdir) / f"results-{args.scale}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+
+    print(f"\n{'benchmark':<42} {'median ms':>10} {'p95 ms':>10} {'items/s':>10}")
+    for name, stats in result["benchmarks"].items():
+        print(
+            f"{name:<42} {stats['median_ms']:>10.3f} {stats['p95_ms']:>10.3f} "
+            f"{stats['items_per_second']:>10}"
+        )
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(result, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,506 @@
+"""
+Read throughput of the SQLite storage profiles while analyses are committed
+
+Each profile runs in its own process on a copy of the same database, since
+the storage settings are read at import time. Reader threads load saved
+analyses and patents through the read sessions the GraphQL queries use,
+first alone and then while writer threads commit analysis-sized
+transactions through the writer path the analysis code uses.
+
+A last phase runs more concurrent async requests than the pools hold, each
+keeping its session across awaits the way GraphQL requests and analyses
+do, to check that requests never wait on a connection another one holds.
+
+Run from backend/app:
+    python -m benchmarks.storage --scale 1k
+    python -m benchmarks.storage --profiles wal --readers 16 --writers 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+from .corpus import generate_corpus, parse_scale
+from .run_benchmarks import git_commit, seed_saved_analyses, summarize
+
+PROFILES = ("default", "wal")
+SAMPLE_PATENTS = 200
+
+
+def _configure(db_path: Path, profile: str, corpus_dir: Path = None):
+    # The engine and storage settings are read at import time
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path.resolve()}"
+    os.environ["SQLITE_STORAGE_PROFILE"] = profile
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    if corpus_dir is not None:
+        os.environ["DATA_DIR"] = str(corpus_dir.resolve())
+
+
+def prepare(args, db_path: Path, corpus_dir: Path):
+    """Ingest the corpus into db_path with the default profile"""
+    _configure(db_path, "default", corpus_dir)
+    from api.database import database
+
+    logging.getLogger("api").setLevel(logging.WARNING)
+    database.Base.metadata.create_all(bind=database.engine)
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.initialize_company_and_patent()
+    seed_saved_analyses(database, args.saved_analyses, random.Random(args.seed))
+
+
+class Workload:
+    """Reader and writer threads sharing a stop flag and their measurements"""
+
+    def __init__(self, database, executor, publication_numbers, write_targets, seed):
+        self.database = database
+        self.executor = executor
+        self.publication_numbers = publication_numbers
+        self.write_targets = write_targets
+        self.seed = seed
+        self.stop = threading.Event()
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.read_durations = []
+        self.write_durations = []
+        self.read_errors = 0
+        self.write_errors = 0
+
+    def read_once(self, rng: random.Random):
+        from sqlalchemy.orm import joinedload
+
+        database = self.database
+        db = database.ReadSessionLocal()
+        try:
+            saved = (
+                db.query(database.CompanyPatentAnalysis)
+                .options(
+                    joinedload(database.CompanyPatentAnalysis.product_analyses),
+                    joinedload(database.CompanyPatentAnalysis.company),
+                    joinedload(database.CompanyPatentAnalysis.patent),
+                )
+                .filter(database.CompanyPatentAnalysis.is_saved.is_(True))
+                .all()
+            )
+            patent = (
+                db.query(database.Patent)
+                .filter(
+                    database.Patent.publication_number
+                    == rng.choice(self.publication_numbers)
+                )
+                .first()
+            )
+            return len(saved), patent.claims.all()
+        finally:
+            db.close()
+
+    def write_once(self, rng: random.Random):
+        database = self.database
+        patent_id, product_id, company_id = rng.choice(self.write_targets)
+        created_at = datetime.now().isoformat()
+        company_analysis_id = str(uuid4())
+
+        def save_analysis():
+            db = database.SessionLocal()
+            try:
+                db.add(
+                    database.CompanyPatentAnalysis(
+                        company_analysis_id=company_analysis_id,
+                        patent_id=patent_id,
+                        company_id=company_id,
+                        overall_risk="Moderate",
+                        overall_risk_assessment="Benchmark assessment " * 20,
+                        created_at=created_at,
+                    )
+                )
+                db.add_all(
+                    database.ProductPatentAnalysis(
+                        product_analysis_id=str(uuid4()),
+                        patent_id=patent_id,
+                        product_id=product_id,
+                        company_analysis_id=company_analysis_id,
+                        infringement_likelihood="Low",
+                        relevant_claims=json.dumps(["1"]),
+                        explanation="Benchmark explanation " * 20,
+                        specific_features=json.dumps(["feature"]),
+                        created_at=created_at,
+                    )
+                    for _ in range(2)
+                )
+                db.commit()
+            finally:
+                database.SessionLocal.remove()
+
+        # Same path as analysis commits, queued on the writer thread
+        self.executor.db_writer.submit(save_analysis).result()
+
+    def _loop(self, index: int, operation, durations_name: str, errors_name: str):
+        rng = random.Random(self.seed * 1000 + index)
+        durations = []
+        errors = 0
+        while not self.stop.is_set():
+            started = time.perf_counter()
+            try:
+                operation(rng)
+                durations.append(time.perf_counter() - started)
+            except Exception:
+                # Mostly "database is locked" once the busy timeout runs out
+                errors += 1
+        with self.lock:
+            getattr(self, durations_name).extend(durations)
+            setattr(self, errors_name, getattr(self, errors_name) + errors)
+
+    def run_phase(self, duration: float, readers: int, writers: int):
+        self.reset()
+        self.stop.clear()
+        threads = [
+            threading.Thread(
+                target=self._loop,
+                args=(index, self.read_once, "read_durations", "read_errors"),
+            )
+            for index in range(readers)
+        ] + [
+            threading.Thread(
+                target=self._loop,
+                args=(
+                    readers + index,
+                    self.write_once,
+                    "write_durations",
+                    "write_errors",
+                ),
+            )
+            for index in range(writers)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        self.stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        result = {
+            "seconds": round(elapsed, 3),
+            "reads_per_second": round(len(self.read_durations) / elapsed, 2),
+            "read_errors": self.read_errors,
+            "read": summarize(self.read_durations) if self.read_durations else None,
+        }
+        if writers:
+            result.update(
+                {
+                    "writes_per_second": round(len(self.write_durations) / elapsed, 2),
+                    "write_errors": self.write_errors,
+                    "write": summarize(self.write_durations)
+                    if self.write_durations
+                    else None,
+                }
+            )
+        return result
+
+    def run_requests(self, concurrency: int, await_seconds: float):
+        """
+        Concurrent requests sharing the DB thread pool like the server does
+
+        Half are GraphQL queries: a read session used by several run_db calls
+        with awaits in between, closed on the pool at the end. The others are
+        analyses: a writer session that loads inputs, waits on the model and
+        commits through the writer thread.
+        """
+        from api.database.executor import run_in_db, run_in_writer
+        from api.graphql.context import Context
+
+        database = self.database
+
+        async def query_request(rng):
+            context = Context(read_only=True)
+            context.db = database.ReadSessionLocal()
+            try:
+                for _ in range(3):
+                    await context.run_db(
+                        lambda db: db.query(database.Patent.patent_id)
+                        .filter(
+                            database.Patent.publication_number
+                            == rng.choice(self.publication_numbers)
+                        )
+                        .first()
+                    )
+                    await asyncio.sleep(await_seconds)
+            finally:
+                await run_in_db(context.db.close)
+
+        async def analysis_request(rng):
+            patent_id, _, company_id = rng.choice(self.write_targets)
+            db = next(database.get_db_session())
+            try:
+                await run_in_db(
+                    lambda: db.query(database.Company)
+                    .filter(database.Company.company_id == company_id)
+                    .first()
+                )
+                # Waiting on the model with the session open
+                await asyncio.sleep(await_seconds * 3)
+
+                def save_analysis():
+                    db.add(
+                        database.CompanyPatentAnalysis(
+                            company_analysis_id=str(uuid4()),
+                            patent_id=patent_id,
+                            company_id=company_id,
+                            overall_risk="Low",
+                            created_at=datetime.now().isoformat(),
+                        )
+                    )
+                    db.commit()
+
+                await run_in_writer(save_analysis)
+            finally:
+                await run_in_db(db.close)
+
+        async def timed(index):
+            rng = random.Random(self.seed * 1000 + index)
+            request = query_request if index % 2 else analysis_request
+            started = time.perf_counter()
+            try:
+                await request(rng)
+            except Exception:
+                return None
+            return time.perf_counter() - started
+
+        async def run_all():
+            return await asyncio.gather(*(timed(index) for index in range(concurrency)))
+
+        started = time.perf_counter()
+        durations = asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+        completed = [duration for duration in durations if duration is not None]
+        return {
+            "requests": concurrency,
+            "seconds": round(elapsed, 3),
+            "failed": concurrency - len(completed),
+            "request": summarize(completed) if completed else None,
+        }
+
+
+def run_profile(args, db_path: Path):
+    """Measure one profile in this process, its name is in args.profile"""
+    _configure(db_path, args.profile)
+    from api.database import database, executor, storage
+
+    logging.getLogger("api").setLevel(logging.WARNING)
+
+    with database.engine.connect() as connection:
+        journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+        patent_count = connection.execute(
+            database.Patent.__table__.select()
+            .with_only_columns([database.Patent.patent_id])
+            .order_by(database.Patent.patent_id.desc())
+            .limit(1)
+        ).scalar()
+        rng = random.Random(args.seed)
+        sample_ids = rng.sample(
+            range(1, patent_count + 1), min(SAMPLE_PATENTS, patent_count)
+        )
+        publication_numbers = [
+            row[0]
+            for row in connection.execute(
+                database.Patent.__table__.select()
+                .with_only_columns([database.Patent.publication_number])
+                .where(database.Patent.patent_id.in_(sample_ids))
+            )
+        ]
+        products = connection.execute(
+            database.Product.__table__.select()
+            .with_only_columns(
+                [database.Product.product_id, database.Product.company_id]
+            )
+            .limit(SAMPLE_PATENTS)
+        ).fetchall()
+    write_targets = [
+        (patent_id, product_id, company_id)
+        for patent_id, (product_id, company_id) in zip(
+            rng.sample(sample_ids, min(len(sample_ids), len(products))), products
+        )
+    ]
+
+    workload = Workload(
+        database, executor, publication_numbers, write_targets, args.seed
+    )
+    # Warm the pools and the page cache before timing
+    workload.run_phase(min(1.0, args.duration), args.readers, 0)
+    return {
+        "profile": args.profile,
+        "journal_mode": journal_mode,
+        "separate_read_pool": database.read_engine is not database.engine,
+        "serialized_writer": executor.db_writer is not executor.db_executor,
+        "settings": {
+            "synchronous": storage.SQLITE_SYNCHRONOUS,
+            "mmap_size": storage.SQLITE_MMAP_SIZE,
+            "cache_size": storage.SQLITE_CACHE_SIZE,
+            "temp_store": storage.SQLITE_TEMP_STORE,
+            "pool_size": storage.SQLITE_POOL_SIZE,
+        },
+        "reads": workload.run_phase(args.duration, args.readers, 0),
+        "reads_during_writes": workload.run_phase(
+            args.duration, args.readers, args.writers
+        ),
+        "concurrent_requests": workload.run_requests(args.requests, args.request_await),
+    }
+
+
+def run(args):
+    scale = parse_scale(args.scale)
+    workdir = Path(args.workdir) / str(args.scale)
+    corpus_dir = workdir / "corpus"
+    base_path = workdir / "storage-base.sqlite"
+
+    if not (corpus_dir / "patents.json").exists():
+        print(f"Generating {scale} patent corpus in {corpus_dir}")
+        generate_corpus(corpus_dir, scale, args.seed)
+    if not base_path.exists():
+        print(f"Ingesting corpus into {base_path}")
+        subprocess.run(
+            [sys.executable, "-m", "benchmarks.storage", "--prepare", *sys.argv[1:]],
+            check=True,
+            cwd=Path(__file__).parent.parent,
+        )
+
+    profiles = {}
+    for profile in args.profiles.split(","):
+        db_path = workdir / f"storage-{profile}.sqlite"
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{db_path}{suffix}").unlink(missing_ok=True)
+        shutil.copyfile(base_path, db_path)
+        print(
+            f"Profile {profile}: {args.readers} readers, then {args.writers} "
+            f"writers alongside, {args.duration:g}s each"
+        )
+        completed = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.storage",
+                "--worker",
+                "--profile",
+                profile,
+                *sys.argv[1:],
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+            cwd=Path(__file__).parent.parent,
+        )
+        profiles[profile] = json.loads(completed.stdout.strip().splitlines()[-1])
+
+    return {
+        "created_at": datetime.now().isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "scale": str(args.scale),
+        "readers": args.readers,
+        "writers": args.writers,
+        "duration": args.duration,
+        "seed": args.seed,
+        "profiles": profiles,
+    }
+
+
+def print_results(result):
+    print(
+        f"\n{'profile':<10} {'phase':<20} {'reads/s':>9} {'read p95 ms':>12} "
+        f"{'writes/s':>9} {'write p95 ms':>13} {'errors':>7}"
+    )
+    for profile, measured in result["profiles"].items():
+        for phase in ("reads", "reads_during_writes"):
+            stats = measured[phase]
+            read_p95 = stats["read"]["p95_ms"] if stats["read"] else 0
+            write = stats.get("write")
+            print(
+                f"{profile:<10} {phase:<20} {stats['reads_per_second']:>9.1f} "
+                f"{read_p95:>12.2f} {stats.get('writes_per_second', 0):>9.1f} "
+                f"{write['p95_ms'] if write else 0:>13.2f} "
+                f"{stats['read_errors'] + stats.get('write_errors', 0):>7}"
+            )
+
+    print(
+        f"\n{'profile':<10} {'requests':>9} {'seconds':>9} {'p95 ms':>9} {'failed':>7}"
+    )
+    for profile, measured in result["profiles"].items():
+        stats = measured["concurrent_requests"]
+        p95 = stats["request"]["p95_ms"] if stats["request"] else 0
+        print(
+            f"{profile:<10} {stats['requests']:>9} {stats['seconds']:>9.2f} "
+            f"{p95:>9.1f} {stats['failed']:>7}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the storage profiles")
+    parser.add_argument("--scale", default="1k", help="1k, 100k, 1m or a number")
+    parser.add_argument("--profiles", default=",".join(PROFILES))
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+    parser.add_argument(
+        "--writers",
+        type=int,
+        default=4,
+        help="Threads committing analyses, like concurrent analysis jobs",
+    )
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per phase")
+    parser.add_argument(
+        "--requests",
+        type=int,
+        default=64,
+        help="Concurrent async requests in the last phase, above the pool sizes",
+    )
+    parser.add_argument(
+        "--request-await",
+        type=float,
+        default=0.05,
+        help="Seconds a request awaits between database calls",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--saved-analyses", type=int, default=100)
+    parser.add_argument(
+        "--workdir",
+        default="data/benchmarks",
+        help="Corpus and scratch databases, one subdirectory per scale",
+    )
+    parser.add_argument("--output", help="Results file, default is in the workdir")
+    parser.add_argument("--prepare", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--profile", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    workdir = Path(args.workdir) / str(args.scale)
+    if args.prepare:
+        prepare(args, workdir / "storage-base.sqlite", workdir / "corpus")
+        return
+    if args.worker:
+        result = run_profile(args, workdir / f"storage-{args.profile}.sqlite")
+        print(json.dumps(result))
+        return
+
+    result = run(args)
+    output = Path(args.output or workdir / f"storage-{args.scale}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(result, indent=2))
+    print_results(result)
+    print(f"\nResults written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,128 @@
+import argparse
+import asyncio
+
 from api.database.database import init_db
 
+
+def main():
+    parser = argparse.ArgumentParser(description="Patent Checker maintenance commands")
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest_parser = subparsers.add_parser(
+        "ingest", help="Stream patents and companies into the database"
+    )
+    ingest_parser.add_argument("--patents", help="Path to patents.json")
+    ingest_parser.add_argument("--companies", help="Path to company_products.json")
+    ingest_parser.add_argument("--batch-size", type=int, default=None)
+    ingest_parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore checkpoints and start from the first record",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch", help="Analyze patents against companies with the background job pool"
+    )
+    batch_parser.add_argument("--patents", nargs="*", default=[])
+    batch_parser.add_argument(
+        "--patents-file", help="File with one publication number per line"
+    )
+    batch_parser.add_argument("--companies", nargs="*", default=[])
+    batch_parser.add_argument("--companies-file", help="File with one company per line")
+    batch_parser.add_argument("--top-n", type=int, default=2)
+    batch_parser.add_argument("--force", action="store_true")
+    batch_parser.add_argument(
+        "--resume", metavar="BATCH_ID", help="Finish an interrupted batch"
+    )
+    batch_parser.add_argument(
+        "--report-interval",
+        type=float,
+        default=10.0,
+        help="Seconds between progress reports",
+    )
+
+    migrate_parser = subparsers.add_parser(
+        "migrate", help="Apply pending schema migrations"
+    )
+    migrate_parser.add_argument(
+        "--status", action="store_true", help="List migrations without applying them"
+    )
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        migrate_command(args)
+    elif args.command == "ingest":
+        from api.database.ingest import (
+            ingest_patents,
+            ingest_companies,
+            INGEST_BATCH_SIZE,
+        )
+
+        init_db()
+        batch_size = args.batch_size or INGEST_BATCH_SIZE
+        if args.patents or not args.companies:
+            ingest_patents(
+                args.patents, batch_size=batch_size, resume=not args.no_resume
+            )
+        if args.companies or not args.patents:
+            ingest_companies(
+                args.companies, batch_size=batch_size, resume=not args.no_resume
+            )
+    elif args.command == "batch":
+        init_db()
+        asyncio.run(run_batch(args))
+    else:
+        init_db()
+
+
+def migrate_command(args):
+    from api.database.database import engine
+    from api.database.migrations import (
+        MIGRATIONS,
+        applied_migrations,
+        migrate,
+    )
+
+    if not args.status:
+        print(f"Schema at version {migrate(engine)}")
+        return
+    applied = {row["version"]: row for row in applied_migrations(engine)}
+    for item in MIGRATIONS:
+        row = applied.get(item.version)
+        state = f"applied {row['applied_at']}" if row else "pending"
+        print(f"{item.version:>4}  {item.name:<32} {state}")
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+async def run_batch(args):
+    from api.jobs import job_queue
+
+    # Only this batch's jobs, a running server keeps the others
+    await job_queue.start(batch_id=args.resume, resume=bool(args.resume))
+    try:
+        if args.resume:
+            batch_id = args.resume
+        else:
+            patents = list(args.patents)
+            if args.patents_file:
+                patents += read_lines(args.patents_file)
+            companies = list(args.companies)
+            if args.companies_file:
+                companies += read_lines(args.companies_file)
+            batch = await job_queue.enqueue_batch(
+                patents, companies, top_n=args.top_n, force=args.force
+            )
+            batch_id = batch.batch_id
+            print(f"Started batch {batch_id} with {batch.pairs_total} pairs")
+        await job_queue.wait_for_batch(batch_id, poll_interval=args.report_interval)
+    finally:
+        await job_queue.stop()
+
+
 if __name__ == "__main__":
-    init_db()
+    main()
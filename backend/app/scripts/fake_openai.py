@@ -0,0 +1,287 @@
+"""
+Local stand-in for the OpenAI chat completions API, for load tests without network
+
+Point the backend at it with:
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://localhost:8001/v1
+
+Run:
+    python scripts/fake_openai.py --port 8001 --latency-ms 800 --latency-dist lognormal \
+        --rate-limit-rate 0.02 --server-error-rate 0.01
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+import uuid
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI()
+settings = argparse.Namespace()
+stats = Counter()
+rate_window = []
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text or "") / 4))
+
+
+def sample_latency() -> float:
+    """Seconds to wait before answering, drawn from the configured distribution"""
+    mean = settings.latency_ms / 1000
+    spread = settings.latency_jitter_ms / 1000
+    if settings.latency_dist == "fixed":
+        latency = mean
+    elif settings.latency_dist == "uniform":
+        latency = random.uniform(mean - spread, mean + spread)
+    elif settings.latency_dist == "normal":
+        latency = random.gauss(mean, spread)
+    else:
+        # lognormal with the given mean, spread is the standard deviation
+        sigma2 = math.log(1 + (spread / mean) ** 2) if mean > 0 else 0
+        latency = random.lognormvariate(math.log(mean) - sigma2 / 2, math.sqrt(sigma2))
+    return max(0.0, latency)
+
+
+def templated_answer(prompt: str) -> str:
+    """Plausible JSON for the prompts in api/ai_analysis/ai_analysis.py"""
+    claims = re.findall(r"Claim (\d+):", prompt)
+    if '"product_analyses"' in prompt:
+        products = re.findall(r"Product: (.+)", prompt)
+        return json.dumps(
+            {
+                "product_analyses": {
+                    product: {
+                        "relevant_claims": random.sample(
+                            claims, k=min(len(claims), random.randint(0, 3))
+                        ),
+                        "explanations": {},
+                    }
+                    for product in products
+                }
+            }
+        )
+    if '"infringement_likelihood"' in prompt:
+        relevant = claims[: random.randint(0, min(len(claims), 8))]
+        return json.dumps(
+            {
+                "infringement_likelihood": random.choice(["High", "Moderate", "Low"]),
+                "relevant_claims": relevant,
+                "explanation": "The product implements the claimed steps. " * 3,
+                "specific_features": ["feature one", "feature two"],
+            }
+        )
+    return "Moderate risk of infringement driven by the products listed above."
+
+
+def answer_for(prompt: str) -> str:
+    for pattern, response in settings.canned:
+        if re.search(pattern, prompt):
+            return response
+    return templated_answer(prompt)
+
+
+def rate_limit_headers() -> dict:
+    return {
+        "x-ratelimit-limit-requests": str(settings.rpm or 10000),
+        "x-ratelimit-remaining-requests": str(
+            max(0, (settings.rpm or 10000) - len(rate_window))
+        ),
+    }
+
+
+def error_response(status: int, message: str, headers: dict = None) -> JSONResponse:
+    stats[f"status_{status}"] += 1
+    return JSONResponse(
+        {"error": {"message": message, "type": "fake_error", "code": status}},
+        status_code=status,
+        headers=headers,
+    )
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    stats["requests"] += 1
+
+    now = time.monotonic()
+    while rate_window and now - rate_window[0] > 60:
+        rate_window.pop(0)
+    if settings.rpm and len(rate_window) >= settings.rpm:
+        retry_after = 60 - (now - rate_window[0])
+        return error_response(
+            429,
+            "Rate limit reached for requests",
+            {"retry-after": f"{retry_after:.2f}", **rate_limit_headers()},
+        )
+    rate_window.append(now)
+
+    roll = random.random()
+    if roll < settings.rate_limit_rate:
+        return error_response(
+            429,
+            "Rate limit reached",
+            {"retry-after-ms": str(settings.retry_after_ms), **rate_limit_headers()},
+        )
+    roll -= settings.rate_limit_rate
+    if roll < settings.server_error_rate:
+        await asyncio.sleep(sample_latency() / 4)
+        return error_response(500, "The server had an error processing your request")
+    roll -= settings.server_error_rate
+    if roll < settings.timeout_rate:
+        stats["timeouts"] += 1
+        await asyncio.sleep(settings.timeout_seconds)
+
+    prompt = "\n".join(message.get("content") or "" for message in body["messages"])
+    content = answer_for(prompt)
+    completion_tokens = estimate_tokens(content)
+    await asyncio.sleep(
+        sample_latency() + completion_tokens * settings.ms_per_token / 1000
+    )
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-3.5-turbo")
+    usage = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "completion_tokens": completion_tokens,
+        "total_tokens": estimate_tokens(prompt) + completion_tokens,
+    }
+    stats["status_200"] += 1
+    stats["completion_tokens"] += completion_tokens
+
+    if body.get("stream"):
+
+        async def events():
+            pieces = re.findall(r"\S+\s*|\s+", content)
+            for index, piece in enumerate(pieces):
+                delta = {"content": piece}
+                if index == 0:
+                    delta["role"] = "assistant"
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(settings.ms_per_token / 1000)
+            final = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(final)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(usage_chunk)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(
+            events(), media_type="text/event-stream", headers=rate_limit_headers()
+        )
+
+    return JSONResponse(
+        {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": usage,
+        },
+        headers=rate_limit_headers(),
+    )
+
+
+@app.get("/v1/models")
+async def models():
+    return {
+        "object": "list",
+        "data": [
+            {"id": model, "object": "model", "owned_by": "fake"}
+            for model in ("gpt-3.5-turbo", "gpt-3.5-turbo-16k")
+        ],
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    return dict(stats)
+
+
+def load_canned(path: str):
+    """[{"match": regex, "response": str or JSON value}, ...] checked in order"""
+    if not path:
+        return []
+    with open(path) as f:
+        entries = json.load(f)
+    return [
+        (
+            entry["match"],
+            entry["response"]
+            if isinstance(entry["response"], str)
+            else json.dumps(entry["response"]),
+        )
+        for entry in entries
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument(
+        "--latency-dist",
+        choices=["fixed", "uniform", "normal", "lognormal"],
+        default="lognormal",
+    )
+    parser.add_argument("--latency-ms", type=float, default=500)
+    parser.add_argument("--latency-jitter-ms", type=float, default=250)
+    parser.add_argument(
+        "--ms-per-token", type=float, default=0, help="Extra latency per output token"
+    )
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after-ms", type=int, default=1000)
+    parser.add_argument("--server-error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=120)
+    parser.add_argument(
+        "--rpm", type=int, default=0, help="Answer 429 above this many requests/min"
+    )
+    parser.add_argument("--responses", help="JSON file of canned responses")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    vars(settings).update(vars(args))
+    settings.canned = load_canned(args.responses)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+"""
+Load generator for the /graphql endpoint
+
+Sends a weighted mix of the frontend's searchPatents, analyzeCompanyAgainstPatent
+and savedAnalyses operations from concurrent virtual users and reports
+throughput and p50/p95/p99 latency per operation.
+
+Run the backend against scripts/fake_openai.py to keep analyses offline, then:
+    python scripts/load_test.py --url http://localhost:8000/graphql \
+        --duration 60 --concurrency 20 --mix search=70,analyze=10,saved=20
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+# Same documents the frontend sends, see frontend/src/graphql/queries.js
+SEARCH_PATENTS = """
+query SearchPatents($query: String, $limit: Int) {
+  searchPatents(query: $query, limit: $limit) {
+    patentId
+    publicationNumber
+    title
+  }
+}
+"""
+
+ANALYZE_COMPANY = """
+mutation AnalyzeCompanyAgainstPatent($input: AnalyzeCompanyAgainstPatentInput!) {
+  analyzeCompanyAgainstPatent(input: $input) {
+    companyId
+    companyAnalysisId
+    patentId
+    overallRiskAssessment
+    overallRisk
+  }
+}
+"""
+
+SAVED_ANALYSES = """
+query GetSavedAnalyses {
+  savedAnalyses {
+    companyAnalysisId
+    company {
+      companyId
+      name
+    }
+    patent {
+      publicationNumber
+      title
+    }
+    overallRisk
+    overallRiskAssessment
+    createdAt
+    isSaved
+    isSavedAt
+    productAnalyses {
+      edges {
+        node {
+          infringementLikelihood
+          explanation
+          specificFeaturesList
+          relevantClaimsList
+          product {
+            name
+            description
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+DISCOVER = """
+query Discover($limit: Int) {
+  searchPatents(limit: $limit) {
+    publicationNumber
+    title
+  }
+  companies {
+    name
+  }
+}
+"""
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def persisted_query_not_found(body):
+    return any(
+        isinstance(error, dict)
+        and error.get("extensions", {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+        for error in body.get("errors") or []
+    )
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - {"search", "analyze", "saved"}
+    if unknown:
+        raise ValueError(f"Unknown operations in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.mix = parse_mix(args.mix)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.patents = []
+        self.companies = []
+        self.search_terms = []
+
+    async def post(self, client, operation_name, query, variables=None):
+        request = {"variables": variables or {}, "operationName": operation_name}
+        if self.args.persisted_queries:
+            sha256_hash = hashlib.sha256(query.encode("utf-8")).hexdigest()
+            request["extensions"] = {
+                "persistedQuery": {"version": 1, "sha256Hash": sha256_hash}
+            }
+            body = await self.send(client, request)
+            if not persisted_query_not_found(body):
+                return self.data(body)
+        body = await self.send(client, {**request, "query": query})
+        return self.data(body)
+
+    async def send(self, client, request):
+        response = await client.post(self.args.url, json=request)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def data(body):
+        if body.get("errors"):
+            error = body["errors"][0]
+            raise RuntimeError(
+                error.get("message") if isinstance(error, dict) else error
+            )
+        return body["data"]
+
+    async def discover(self, client):
+        """Pick patents, companies and search words from the running instance"""
+        data = await self.post(client, "Discover", DISCOVER, {"limit": 200})
+        self.patents = [p["publicationNumber"] for p in data["searchPatents"]]
+        self.companies = [c["name"] for c in data["companies"]]
+        words = set()
+        for patent in data["searchPatents"]:
+            words.update(
+                word.lower()
+                for word in (patent["title"] or "").split()
+                if len(word) > 4 and word.isalpha()
+            )
+        self.search_terms = sorted(words) or ["system"]
+        if "analyze" in self.mix and (not self.patents or not self.companies):
+            raise RuntimeError("No patents or companies to analyze, load data first")
+
+    def request_for(self, operation):
+        if operation == "search":
+            return (
+                "SearchPatents",
+                SEARCH_PATENTS,
+                {"query": random.choice(self.search_terms), "limit": 10},
+            )
+        if operation == "analyze":
+            return (
+                "AnalyzeCompanyAgainstPatent",
+                ANALYZE_COMPANY,
+                {
+                    "input": {
+                        "patentPublicationNumber": random.choice(self.patents),
+                        "companyName": random.choice(self.companies),
+                        "force": self.args.force_analyze,
+                    }
+                },
+            )
+        return "GetSavedAnalyses", SAVED_ANALYSES, {}
+
+    async def user(self, client, deadline):
+        operations = list(self.mix)
+        weights = [self.mix[operation] for operation in operations]
+        while time.monotonic() < deadline:
+            operation = random.choices(operations, weights)[0]
+            operation_name, query, variables = self.request_for(operation)
+            started = time.perf_counter()
+            try:
+                await self.post(client, operation_name, query, variables)
+            except Exception:
+                self.errors[operation] += 1
+            self.latencies[operation].append(time.perf_counter() - started)
+
+    async def run(self):
+        timeout = httpx.Timeout(self.args.timeout)
+        limits = httpx.Limits(max_connections=self.args.concurrency)
+        async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+            await self.discover(client)
+            started = time.monotonic()
+            deadline = started + self.args.duration
+            await asyncio.gather(
+                *(self.user(client, deadline) for _ in range(self.args.concurrency))
+            )
+            return time.monotonic() - started
+
+    def report(self, elapsed):
+        rows = {}
+        everything = []
+        for operation, values in sorted(self.latencies.items()):
+            everything.extend(values)
+            rows[operation] = self.summarize(values, self.errors[operation], elapsed)
+        rows["total"] = self.summarize(everything, sum(self.errors.values()), elapsed)
+        return {
+            "duration_seconds": round(elapsed, 2),
+            "concurrency": self.args.concurrency,
+            "operations": rows,
+        }
+
+    @staticmethod
+    def summarize(values, errors, elapsed):
+        values = sorted(values)
+        return {
+            "requests": len(values),
+            "errors": errors,
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+        }
+
+
+def print_table(result):
+    print(
+        f"{result['duration_seconds']}s with {result['concurrency']} concurrent users"
+    )
+    header = f"{'operation':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for operation, row in result["operations"].items():
+        print(
+            f"{operation:<10} {row['requests']:>9} {row['errors']:>7} "
+            f"{row['throughput_rps']:>8} {row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GraphQL load generator")
+    parser.add_argument("--url", default="http://localhost:8000/graphql")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument(
+        "--mix",
+        default="search=70,analyze=10,saved=20",
+        help="Relative weights of search, analyze and saved",
+    )
+    parser.add_argument(
+        "--force-analyze",
+        action="store_true",
+        help="Bypass stored analyses so every analyze calls the LLM",
+    )
+    parser.add_argument(
+        "--persisted-queries",
+        action="store_true",
+        help="Send query hashes (automatic persisted queries) instead of query text",
+    )
+    parser.add_argument("--timeout", type=float, default=300, help="Request seconds")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    load_test = LoadTest(args)
+    elapsed = asyncio.run(load_test.run())
+    result = load_test.report(elapsed)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_table(result)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Keep the modules under test away from data/patent_db.sqlite and the LLM
+# cache, api.database reads these when it is first imported
+_TEST_DIR = tempfile.mkdtemp(prefix="patent-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_TEST_DIR}/patent_db.sqlite"
+os.environ["LLM_CACHE_PATH"] = os.path.join(_TEST_DIR, "llm_cache.sqlite")
+os.environ["LLM_CACHE_ENABLED"] = "false"
+os.environ.pop("OPENAI_API_KEY", None)
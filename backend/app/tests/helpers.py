@@ -0,0 +1,11 @@
+from types import SimpleNamespace
+
+
+def make_claim(num, text, claim_id=None):
+    """Stand-in for a Claim row, the pure helpers only read these attributes"""
+    return SimpleNamespace(num=num, text=text, claim_id=claim_id)
+
+
+def make_product(name, description=None, product_id=None):
+    """Stand-in for a Product row"""
+    return SimpleNamespace(name=name, description=description, product_id=product_id)
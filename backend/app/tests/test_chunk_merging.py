@@ -0,0 +1,102 @@
+import pytest
+
+from api.ai_analysis.ai_analysis import (
+    ScreeningError,
+    merge_detail_results,
+    merge_screening_results,
+)
+
+
+def detail(likelihood, claims, explanation="", features=()):
+    return {
+        "infringement_likelihood": likelihood,
+        "relevant_claims": list(claims),
+        "explanation": explanation,
+        "specific_features": list(features),
+    }
+
+
+def test_screening_merge_unions_claims_in_claim_order():
+    merged = merge_screening_results(
+        [
+            {
+                "App": {
+                    "relevant_claims": ["00010", "00002"],
+                    "explanations": {"00010": "first", "00002": "two"},
+                }
+            },
+            {
+                "App": {
+                    "relevant_claims": ["00002", "00001"],
+                    "explanations": {"00010": "second", "00001": "one"},
+                },
+                "Plus": {"relevant_claims": ["3"]},
+            },
+            {},
+        ]
+    )
+
+    assert merged["App"]["relevant_claims"] == ["00001", "00002", "00010"]
+    assert list(merged["App"]["explanations"]) == ["00001", "00002", "00010"]
+    # The first chunk's explanation of a claim wins
+    assert merged["App"]["explanations"]["00010"] == "first"
+    assert merged["Plus"] == {"relevant_claims": ["3"], "explanations": {}}
+
+
+def test_screening_merge_ignores_chunk_order():
+    chunks = [
+        {"App": {"relevant_claims": ["2"]}},
+        {"App": {"relevant_claims": ["1"]}, "Plus": {"relevant_claims": ["4"]}},
+    ]
+
+    assert merge_screening_results(chunks) == merge_screening_results(chunks[::-1])
+
+
+def test_screening_merge_skips_malformed_products():
+    merged = merge_screening_results(
+        [{"App": ["1"], "Plus": {"relevant_claims": None}}]
+    )
+
+    assert merged == {"Plus": {"relevant_claims": [], "explanations": {}}}
+
+
+def test_failed_screening_chunk_fails_the_merge():
+    with pytest.raises(ScreeningError):
+        merge_screening_results([{"App": {"relevant_claims": ["1"]}}, None])
+
+
+def test_single_detail_chunk_is_returned_as_is():
+    result = detail("Low", ["3"], "only chunk")
+
+    assert merge_detail_results([result]) is result
+
+
+def test_detail_merge_unions_claims_and_features():
+    merged = merge_detail_results(
+        [
+            detail("Low", ["00003"], "Matches claim 3.", ["f1", "f2"]),
+            detail("Low", [], "Nothing here.", ["f2"]),
+            detail("Moderate", ["00001"], "Matches claim 1.", ["f3"]),
+        ]
+    )
+
+    assert merged == {
+        "infringement_likelihood": "Moderate",
+        "relevant_claims": ["00001", "00003"],
+        "explanation": "Matches claim 3. Matches claim 1.",
+        "specific_features": ["f1", "f2", "f3"],
+    }
+
+
+def test_detail_merge_raises_likelihood_with_claim_count():
+    two_claims = [detail("Low", ["1"]), detail("Low", ["2"])]
+    six_claims = [detail("Low", ["1", "2", "3"]), detail("Moderate", ["4", "5", "6"])]
+
+    assert merge_detail_results(two_claims)["infringement_likelihood"] == "Moderate"
+    assert merge_detail_results(six_claims)["infringement_likelihood"] == "High"
+
+
+def test_failed_detail_chunk_fails_the_merge():
+    failed = detail("Error", [], "Analysis failed: timeout")
+
+    assert merge_detail_results([detail("High", ["1"]), failed]) is failed
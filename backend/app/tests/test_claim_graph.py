@@ -0,0 +1,102 @@
+import pytest
+
+from api.database.claim_graph import (
+    build_claim_graph,
+    claim_number,
+    parse_claim_references,
+)
+
+from .helpers import make_claim
+
+
+@pytest.mark.parametrize(
+    "text, number, expected",
+    [
+        ("The method of claim 2, wherein the list is shared.", 3, [2]),
+        ("The system of claims 1-3, further comprising a display.", 5, [1, 2, 3]),
+        ("The system of claims 1 to 3.", 5, [1, 2, 3]),
+        ("The method of claims 1, 2 or 4.", 6, [1, 2, 4]),
+        ("The method of claim 1 or claim 2.", 3, [1, 2]),
+        ("The method according to any preceding claim.", 4, [1, 2, 3]),
+        ("A method comprising receiving an advertisement.", 1, []),
+    ],
+)
+def test_parse_claim_references(text, number, expected):
+    assert parse_claim_references(text, number) == expected
+
+
+def test_references_to_later_claims_are_dropped():
+    # Keeps the graph acyclic, a claim can only depend on earlier claims
+    assert parse_claim_references("The method of claim 3 or claim 7.", 5) == [3]
+    assert parse_claim_references("The method of claim 5.", 5) == []
+
+
+@pytest.mark.parametrize(
+    "num, expected",
+    [("00001", 1), ("12", 12), ("1a", 1), (" 7", 7), ("", None), (None, None)],
+)
+def test_claim_number(num, expected):
+    assert claim_number(make_claim(num, "")) == expected
+
+
+def graph_edges(rows):
+    return sorted(
+        (
+            row["claim"].num,
+            row["parent"].num if row["parent"] else None,
+            row["root"].num,
+            row["depth"],
+        )
+        for row in rows
+    )
+
+
+def test_build_claim_graph_transitive_dependencies():
+    claims = [
+        make_claim("00001", "A method comprising receiving an advertisement."),
+        make_claim("00002", "The method of claim 1, wherein the list is shared."),
+        make_claim("00003", "The method of claim 2, further comprising a display."),
+        make_claim("00004", "A system comprising a processor."),
+        make_claim("00005", "The system of claim 4 or the method of claim 3."),
+    ]
+
+    assert graph_edges(build_claim_graph(claims)) == [
+        ("00001", None, "00001", 0),
+        ("00002", "00001", "00001", 1),
+        ("00003", "00002", "00001", 2),
+        ("00004", None, "00004", 0),
+        ("00005", "00003", "00001", 3),
+        ("00005", "00004", "00004", 1),
+    ]
+
+
+def test_build_claim_graph_keeps_shortest_path():
+    claims = [
+        make_claim("1", "A method."),
+        make_claim("2", "The method of claim 1."),
+        make_claim("3", "The method of claim 1 or claim 2."),
+    ]
+    rows = [row for row in build_claim_graph(claims) if row["claim"].num == "3"]
+
+    assert len(rows) == 1
+    assert rows[0]["parent"].num == "1"
+    assert rows[0]["depth"] == 1
+
+
+def test_claims_without_number_get_no_rows():
+    claims = [
+        make_claim("00001", "A method."),
+        make_claim("", "The method of claim 1."),
+        make_claim("2a", "The method of claim 1."),
+    ]
+
+    assert graph_edges(build_claim_graph(claims)) == [
+        ("00001", None, "00001", 0),
+        ("2a", "00001", "00001", 1),
+    ]
+
+
+def test_reference_to_missing_claim_makes_a_base_claim():
+    claims = [make_claim("2", "The method of claim 1.")]
+
+    assert graph_edges(build_claim_graph(claims)) == [("2", None, "2", 0)]
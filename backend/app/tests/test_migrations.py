@@ -0,0 +1,70 @@
+import pytest
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+
+from api.database.database import Base, ClaimDependency, Patent
+from api.database.migrations import LATEST_VERSION, applied_migrations, migrate
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'patents.sqlite'}")
+    yield engine
+    engine.dispose()
+
+
+def make_baseline(engine):
+    """Schema as it was before schema_version, claim_dependencies and job owners"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE schema_version")
+        connection.exec_driver_sql("DROP TABLE claim_dependencies")
+        connection.exec_driver_sql("ALTER TABLE analysis_jobs DROP COLUMN owner")
+        connection.exec_driver_sql("ALTER TABLE analysis_jobs DROP COLUMN heartbeat_at")
+
+
+def test_fresh_database_is_stamped_at_latest_version(engine):
+    assert migrate(engine) == LATEST_VERSION
+
+    assert [row["version"] for row in applied_migrations(engine)] == list(
+        range(1, LATEST_VERSION + 1)
+    )
+    # Nothing was timed, the models already include every migration
+    assert {row["duration_ms"] for row in applied_migrations(engine)} == {None}
+
+
+def test_upgrade_from_baseline(engine):
+    make_baseline(engine)
+    with Session(bind=engine) as db:
+        db.add(
+            Patent(
+                publication_number="US-1-B1",
+                title="Shopping list",
+                claims=[
+                    {"num": "00001", "text": "A method."},
+                    {"num": "00002", "text": "The method of claim 1."},
+                ],
+            )
+        )
+        db.commit()
+    assert applied_migrations(engine) == []
+
+    assert migrate(engine) == LATEST_VERSION
+
+    columns = {
+        column["name"] for column in inspect(engine).get_columns("analysis_jobs")
+    }
+    assert {"owner", "heartbeat_at"} <= columns
+    with Session(bind=engine) as db:
+        assert db.query(ClaimDependency).count() == 2
+    assert [row["version"] for row in applied_migrations(engine)] == list(
+        range(1, LATEST_VERSION + 1)
+    )
+
+
+def test_migrate_is_a_no_op_when_current(engine):
+    migrate(engine)
+    before = applied_migrations(engine)
+
+    assert migrate(engine) == LATEST_VERSION
+    assert applied_migrations(engine) == before
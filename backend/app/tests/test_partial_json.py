@@ -0,0 +1,68 @@
+import json
+
+from api.ai_analysis.partial_json import IncrementalJSONParser
+
+ANSWER = {
+    "infringement_likelihood": "High",
+    "relevant_claims": ["1", "2"],
+    "explanation": 'Matches the "tracking payload" of claim 1, café',
+    "specific_features": ["f1", {"nested": [1, 2]}],
+    "score": 0.5,
+}
+
+
+def feed_in_pieces(parser, text, size):
+    completed = {}
+    for start in range(0, len(text), size):
+        completed.update(parser.feed(text[start : start + size]))
+    return completed
+
+
+def test_fields_complete_in_order_while_streaming():
+    parser = IncrementalJSONParser()
+    text = json.dumps(ANSWER)
+    split = text.index('"explanation"')
+
+    assert parser.feed(text[:split]) == {
+        "infringement_likelihood": "High",
+        "relevant_claims": ["1", "2"],
+    }
+    assert "explanation" not in parser.fields
+    parser.feed(text[split:])
+    assert parser.fields == ANSWER
+    assert parser.done
+
+
+def test_result_does_not_depend_on_chunk_size():
+    text = json.dumps(ANSWER, ensure_ascii=False)
+    for size in (1, 2, 3, 7, len(text)):
+        parser = IncrementalJSONParser()
+        assert feed_in_pieces(parser, text, size) == ANSWER
+
+
+def test_partial_field_returns_string_so_far():
+    parser = IncrementalJSONParser()
+    parser.feed('{"infringement_likelihood": "Low", "explanation": "Uses the \\"sel')
+    assert parser.partial_field() == ("explanation", 'Uses the "sel')
+
+    # An escape cut in half is left out until it is complete
+    parser.feed("ected\\u00")
+    assert parser.partial_field() == ("explanation", 'Uses the "selected')
+    parser.feed('e9"')
+    assert parser.partial_field() is None
+    assert parser.fields["explanation"] == 'Uses the "selectedé'
+
+
+def test_leading_text_and_trailing_commas_are_tolerated():
+    parser = IncrementalJSONParser()
+    parser.feed(
+        '```json\n{"relevant_claims": ["1", "3",], "specific_features": [],}\n```'
+    )
+    assert parser.fields == {"relevant_claims": ["1", "3"], "specific_features": []}
+    assert parser.done
+
+
+def test_malformed_value_is_skipped():
+    parser = IncrementalJSONParser()
+    parser.feed('{"score": nope, "explanation": "ok"}')
+    assert parser.fields == {"explanation": "ok"}
@@ -0,0 +1,97 @@
+from api.ai_analysis.relevance import bm25_scores, rank_products, tokenize
+
+from .helpers import make_claim, make_product
+
+BASE_CLAIMS = [
+    make_claim(
+        "00001", "A method of generating a shopping list from a digital advertisement."
+    ),
+    make_claim("00002", "A tractor with an autonomous steering controller."),
+]
+
+
+def names(ranked):
+    return [entry["product"].name for entry in ranked]
+
+
+def test_tokenize_drops_stopwords_and_single_characters():
+    assert tokenize("The method of claim 1, wherein a List is SHARED") == [
+        "method",
+        "list",
+        "shared",
+    ]
+
+
+def test_bm25_scores_shape_and_matches():
+    scores = bm25_scores(
+        ["shopping list", "steering"], ["shopping list app", "steering wheel", "x"]
+    )
+
+    assert scores.shape == (2, 3)
+    assert scores[0, 0] > 0 and scores[0, 1] == 0
+    assert scores[1, 1] > 0 and scores[1, 0] == 0
+    assert not scores[:, 2].any()
+
+
+def test_rank_products_best_match_first():
+    products = [
+        make_product("Drive Up", "Curbside pickup of orders."),
+        make_product("Shopping App", "Builds a shopping list from weekly ads."),
+        make_product("AutoTrac", "Autonomous steering for a tractor."),
+    ]
+
+    ranked = {
+        entry["product"].name: entry
+        for entry in rank_products(BASE_CLAIMS, products, top_k=3, min_score=0)
+    }
+
+    # A product scores its best base claim
+    for name, claim_num in (("Shopping App", "00001"), ("AutoTrac", "00002")):
+        entry = ranked[name]
+        assert entry["score"] == entry["claim_scores"][claim_num] > 0
+    assert list(ranked)[-1] == "Drive Up"
+    assert ranked["Drive Up"]["score"] == 0
+
+
+def test_rank_products_keeps_unscored_products_with_default_min_score():
+    products = [make_product("Gift Cards"), make_product("Pharmacy", "Prescriptions.")]
+
+    # Equal scores keep the original product order
+    assert names(rank_products(BASE_CLAIMS, products, top_k=5, min_score=0)) == [
+        "Gift Cards",
+        "Pharmacy",
+    ]
+
+
+def test_rank_products_min_score_and_top_k():
+    products = [
+        make_product("Gift Cards"),
+        make_product("Shopping App", "Shopping list from ads."),
+        make_product("Ad Viewer", "Shows a digital advertisement."),
+    ]
+
+    assert names(rank_products(BASE_CLAIMS, products, top_k=5, min_score=0.01)) == [
+        "Shopping App",
+        "Ad Viewer",
+    ]
+    assert names(rank_products(BASE_CLAIMS, products, top_k=1, min_score=0)) == [
+        "Shopping App"
+    ]
+
+
+def test_rank_products_falls_back_to_top_k_when_nothing_qualifies():
+    products = [
+        make_product("Gift Cards"),
+        make_product("Pharmacy"),
+        make_product("Optical"),
+    ]
+
+    assert names(rank_products(BASE_CLAIMS, products, top_k=2, min_score=5)) == [
+        "Gift Cards",
+        "Pharmacy",
+    ]
+
+
+def test_rank_products_without_claims_or_products():
+    assert rank_products([], [make_product("App")]) == []
+    assert rank_products(BASE_CLAIMS, []) == []
@@ -0,0 +1,120 @@
+import pytest
+from graphql import parse
+
+from api.graphql_schema import schema
+from api.graphql.response_cache import ResponseCache, cacheable_tables
+
+
+def tables_of(query, operation_name=None):
+    tables = cacheable_tables(schema.graphql_schema, parse(query), operation_name)
+    return None if tables is None else set(tables)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("{ companies { name } }", {"companies"}),
+        ("{ companies { name products { name } } }", {"companies", "products"}),
+        ('{ searchPatents(query: "list") { title } }', {"patents", "patents_fts"}),
+        ("{ __typename companies { __typename name } }", {"companies"}),
+        (
+            "{ savedAnalyses { company { name } patent { title }"
+            " productAnalyses { edges { node { product { name } } } } } }",
+            {
+                "company_patent_analyses",
+                "companies",
+                "patents",
+                "product_patent_analyses",
+                "products",
+            },
+        ),
+    ],
+)
+def test_cacheable_tables(query, expected):
+    assert tables_of(query) == expected
+
+
+def test_fragments_add_their_tables():
+    query = """
+        query P { patent(publicationNumber: "x") { ...Claims } }
+        fragment Claims on Patent { claims { edges { node { text } } } }
+    """
+
+    assert tables_of(query, "P") == {"patents", "claims"}
+
+
+def test_uncacheable_operations():
+    # Mutations and root fields outside CACHEABLE_FIELDS are never cached
+    query = """
+        query A { companies { name } }
+        mutation B { toggleSaveAnalysis(companyAnalysisId: "x", isSaved: true) { isSaved } }
+    """
+
+    assert tables_of(query, "A") == {"companies"}
+    assert tables_of(query, "B") is None
+    assert tables_of('{ companies { name } job(jobId: "x") { status } }') is None
+
+
+@pytest.fixture
+def cache():
+    return ResponseCache(schema.graphql_schema, capacity=10, max_bytes=1 << 20, ttl=0)
+
+
+def lookup(cache, query="{ companies { name } }", variables=None):
+    return cache.lookup(parse(query), query, None, variables)
+
+
+def test_write_to_a_read_table_invalidates(cache):
+    lookup(cache).store({"companies": []})
+    lookup(cache, "{ savedAnalyses { overallRisk } }").store({"savedAnalyses": []})
+
+    cache.invalidate({"companies"})
+
+    assert lookup(cache).cached is None
+    assert lookup(cache, "{ savedAnalyses { overallRisk } }").cached is not None
+
+
+def test_response_computed_during_a_write_is_not_stored(cache):
+    pending = lookup(cache)
+    cache.invalidate({"companies"})
+    pending.store({"companies": []})
+
+    assert lookup(cache).cached is None
+    assert cache.stats()["stale_stores"] == 1
+
+
+def test_variables_are_part_of_the_key(cache):
+    query = "query P($n: String!) { patent(publicationNumber: $n) { title } }"
+    lookup(cache, query, {"n": "A"}).store({"patent": {"title": "a"}})
+
+    assert lookup(cache, query, {"n": "A"}).cached is not None
+    assert lookup(cache, query, {"n": "B"}).cached is None
+
+
+def test_expired_responses_are_not_served(cache, monkeypatch):
+    cache.ttl = 60
+    now = [1000.0]
+    monkeypatch.setattr("api.graphql.response_cache.time.monotonic", lambda: now[0])
+    lookup(cache).store({"companies": []})
+
+    now[0] += 30
+    assert lookup(cache).cached is not None
+    now[0] += 31
+    assert lookup(cache).cached is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_external_writes_drop_every_entry(cache, monkeypatch):
+    monkeypatch.setattr("api.graphql.response_cache.RESPONSE_CACHE_SYNC_SECONDS", 0)
+    marker = ["2024-01-01T00:00:00"]
+    cache.watch_external(lambda: marker[0])
+    lookup(cache).store({"companies": []})
+    pending = lookup(cache, "{ savedAnalyses { overallRisk } }")
+
+    assert lookup(cache).cached is not None
+    marker[0] = "2024-01-01T00:05:00"
+    assert lookup(cache).cached is None
+    # A response computed before the external write is not stored either
+    pending.store({"savedAnalyses": []})
+    assert lookup(cache, "{ savedAnalyses { overallRisk } }").cached is None
+    assert cache.stats()["external_invalidations"] == 1
@@ -2,4 +2,48 @@ import { QueryClient } from '@tanstack/react-query';
 import { GraphQLClient } from 'graphql-request';
 
 export const queryClient = new QueryClient();
-export const graphqlClient = new GraphQLClient('http://localhost:8000/graphql'); 
\ No newline at end of file
+
+const sha256 = async (text) => {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => byte.toString(16).padStart(2, '0'))
+    .join('');
+};
+
+const isPersistedQueryNotFound = (body) =>
+  (body.errors || []).some(
+    (error) => error.extensions && error.extensions.code === 'PERSISTED_QUERY_NOT_FOUND'
+  );
+
+// Automatic persisted queries: send only the query hash, and the full query
+// text once if the server does not know the hash yet
+const persistedQueryFetch = async (url, options) => {
+  if (!crypto.subtle || typeof options.body !== 'string') {
+    return fetch(url, options);
+  }
+  const { query, ...request } = JSON.parse(options.body);
+  const extensions = { persistedQuery: { version: 1, sha256Hash: await sha256(query) } };
+
+  const response = await fetch(url, {
+    ...options,
+    body: JSON.stringify({ ...request, extensions }),
+  });
+  const text = await response.text();
+  let body = {};
+  try {
+    body = JSON.parse(text);
+  } catch (error) {
+    // Not JSON, hand it to graphql-request as is
+  }
+  if (!isPersistedQueryNotFound(body)) {
+    return new Response(text, { status: response.status, headers: response.headers });
+  }
+  return fetch(url, {
+    ...options,
+    body: JSON.stringify({ ...request, query, extensions }),
+  });
+};
+
+export const graphqlClient = new GraphQLClient('http://localhost:8000/graphql', {
+  fetch: persistedQueryFetch,
+});